@@ -1,13 +1,17 @@
 import os
-import asyncio
+import re
 import logging
 from datetime import datetime, time
 import pytz  # لضبط توقيت إرسال التقرير اليومي بدقة
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
-from telegram.error import TelegramError, Forbidden, BadRequest
 from functools import wraps
 
+from ban_list import ban, unban
+from channel_info import CHANNEL_INFO
+from broadcast_engine import start_broadcast
+from database import DB, BACKGROUND
+
 logger = logging.getLogger(__name__)
 
 # ==============================================================================
@@ -65,15 +69,7 @@ async def set_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ خيار غير صحيح! اختر إما: `month` أو `half` أو `year`.")  
             return  
 
-        pool = context.bot_data.get('db_conn')  
-          
-        async with pool.acquire() as conn:  
-            await conn.execute("""  
-                UPDATE users   
-                SET is_premium = TRUE,   
-                    premium_expiry = NOW() + ($2 || ' days')::INTERVAL  
-                WHERE user_id = $1  
-            """, user_id, str(days_to_add))  
+        await DB.execute("admin.set_premium", user_id, days_to_add)
           
         await update.message.reply_text(f"✅ تم تفعيل البريميوم بنجاح للمستخدم: {user_id}\n⏱ المدة الممنوحة: **{duration_text}**")  
           
@@ -98,14 +94,7 @@ async def remove_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:  
         user_id = int(context.args[0])  
-        pool = context.bot_data.get('db_conn')  
-          
-        async with pool.acquire() as conn:  
-            await conn.execute("""  
-                UPDATE users   
-                SET is_premium = FALSE, premium_expiry = NULL   
-                WHERE user_id = $1  
-            """, user_id)  
+        await DB.execute("admin.remove_premium", user_id)
               
         await update.message.reply_text(f"🚫 تم إلغاء البريميوم الزمني تماماً للمستخدم: {user_id}")  
     except Exception as e:  
@@ -124,11 +113,7 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:  
         user_id = int(context.args[0])  
-        user_data_dict = dict(context.application.user_data)  
-        if user_id not in user_data_dict:  
-            user_data_dict[user_id] = {}  
-          
-        context.application.user_data[user_id]["is_banned"] = True  
+        await ban(user_id)
         await update.message.reply_text(f"🔒 **تم حظر المستخدم بنجاح:** {user_id}")  
     except ValueError:  
         await update.message.reply_text("❌ يرجى كتابة معرف مستخدم (ID) رقمي صحيح.")  
@@ -144,9 +129,7 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:  
         user_id = int(context.args[0])  
-        user_data_dict = dict(context.application.user_data)  
-        if user_id in user_data_dict:  
-            context.application.user_data[user_id]["is_banned"] = False  
+        await unban(user_id)
               
         await update.message.reply_text(f"🔓 **تم إلغاء حظر المستخدم بنجاح:** {user_id}")  
     except ValueError:  
@@ -159,17 +142,24 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 📊 لوحة التحكم والإحصائيات (Admin Panel)
 # ==============================================================================
 
+def _update_processor_line(context: ContextTypes.DEFAULT_TYPE) -> str:
+    """سطر حالة معالجة التحديثات (العمق وزمن الانتظار) إن كان المعالج المرتّب مفعلاً"""
+    processor = context.application.update_processor
+    if not hasattr(processor, "stats"):
+        return ""
+    s = processor.stats()
+    return (
+        f"🚦 التحديثات: **{s['running']}/{s['concurrency']}** قيد التنفيذ، "
+        f"**{s['pending']}** معلقة لـ **{s['active_users']}** مستخدم "
+        f"(انتظار p95: **{s['wait_p95'] * 1000:.0f}ms**، مُهمل: **{s['dropped']:,}**)\n"
+    )
+
+
 @admin_only
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    pool = context.bot_data.get('db_conn')
-    if pool:
-        async with pool.acquire() as conn:
-            book_count = await conn.fetchval("SELECT COUNT(*) FROM books")
-            total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
-            premium_users = await conn.fetchval("""
-                SELECT COUNT(*) FROM users 
-                WHERE is_premium = TRUE AND (premium_expiry IS NULL OR premium_expiry > NOW())
-            """)
+    if DB.pool():
+        row = await DB.fetchrow("admin.panel_counts")
+        book_count, total_users, premium_users = row["books"], row["users"], row["premium"]
 
         stats_text = (  
             "📊 **لوحة تحكم المكتبة الكبرى v3.2**\n"  
@@ -177,6 +167,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📚 الكتب المفهرسة كلياً: **{book_count:,}**\n"  
             f"👥 المستخدمين الكلي: **{total_users:,}**\n"  
             f"⭐ الأعضاء المميزين (الزمني): **{premium_users:,}**\n"  
+            f"{_update_processor_line(context)}"
             "--------------------------------------\n"  
             "🛠 **أوامر الإدارة والتفعيل الزمني:**\n"  
             "• شهري: `/set_premium ID month`\n"  
@@ -187,6 +178,8 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📢 **إعدادات الاشتراك الإجباري:**\n"  
             "• تعيين/تغيير القناة: `/setchannel @username` أو `/setchannel ID`\n"  
             "• إحصائيات الـ 24 ساعة: `/channel_stats`\n"
+            "• أثقل استعلامات قاعدة البيانات: `/db_stats`\n"
+            "• أبطأ التحديثات وأسبابها: `/slow_updates [ساعات]`\n"
             "--------------------------------------\n"  
             "🚫 **أوامر الحظر والتحكم:**\n"  
             "• لحظر مستخدم كلياً: `/ban ID`\n"  
@@ -196,64 +189,55 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(stats_text, parse_mode='Markdown')
 
 
-# ==============================================================================
-# 📢 ميزة الإذاعة الآمنة والذكية في الخلفية (Background Broadcast)
-# ==============================================================================
+@admin_only
+async def db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أثقل الاستعلامات المسجلة حسب الزمن الكلي منذ الإقلاع"""
+    top = DB.top_queries()
+    if not top:
+        await update.message.reply_text("📭 لا توجد استعلامات مسجلة بعد.")
+        return
 
-async def _background_broadcast(users, msg, context: ContextTypes.DEFAULT_TYPE, admin_chat_id: int):
-    user_data_dict = dict(context.application.user_data) if context.application.user_data else {}
-    success_count = 0
-    fail_count = 0
-    
-    for index, r in enumerate(users):
-        u_id = r['user_id']
-        
-        if u_id in user_data_dict and user_data_dict[u_id].get("is_banned"):
-            continue
-            
-        try:   
-            await context.bot.send_message(chat_id=u_id, text=msg)  
-            success_count += 1
-            
-            if index % 20 == 0:
-                await asyncio.sleep(1.0)
-                
-        except Forbidden:
-            fail_count += 1
-        except BadRequest:
-            fail_count += 1
-        except TelegramError as e:
-            if "retry after" in str(e).lower():
-                try:
-                    retry_after = int(''.join(filter(str.isdigit, str(e))))
-                except ValueError:
-                    retry_after = 10
-                await asyncio.sleep(retry_after)
-                try:
-                    await context.bot.send_message(chat_id=u_id, text=msg)
-                    success_count += 1
-                except Exception:
-                    fail_count += 1
-            else:
-                fail_count += 1
-        except Exception:
-            fail_count += 1
+    lines = ["🗄 **أثقل الاستعلامات منذ الإقلاع:**", "--------------------------------------"]
+    for name, s in top:
+        lines.append(
+            f"`{name}`: {s.calls:,} مرة، p95 **{s.percentile(0.95) * 1000:.0f}ms**، "
+            f"الكلي {s.total_seconds:,.1f}s" + (f"، أخطاء {s.errors:,}" if s.errors else "")
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
+
+@admin_only
+async def slow_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أثقل أنماط التحديثات البطيئة وأكثر الاستعلامات/الطلبات مساهمة فيها"""
+    hours = int(context.args[0]) if context.args and context.args[0].isdigit() else 24
     try:
-        await context.bot.send_message(
-            chat_id=admin_chat_id,
-            text=(
-                "📢 **اكتملت إذاعة الخلفية بنجاح!**\n\n"
-                f"🟢 تم التسليم بنجاح: **{success_count:,}**\n"
-                f"🔴 فشل الإرسال (حظر/محذوف): **{fail_count:,}**\n\n"
-                "⚡ البوت لم يتأثر طوال فترة البث وعمل بكفاءة."
-            ),
-            parse_mode="Markdown"
-        )
+        patterns = await DB.fetch("admin.slow_patterns", hours, 10)
+        spans = await DB.fetch("admin.slow_spans", hours, 8)
     except Exception as e:
-        logger.error(f"Could not send broadcast report to admin: {e}")
+        await update.message.reply_text(f"❌ فشل جلب سجل التحديثات البطيئة: {e}")
+        return
+
+    if not patterns:
+        await update.message.reply_text(f"✅ لا توجد تحديثات بطيئة خلال آخر {hours} ساعة.")
+        return
+
+    lines = [f"🐢 **أبطأ الأنماط خلال آخر {hours} ساعة:**", "--------------------------------------"]
+    for r in patterns:
+        text = re.sub(r"[*_`\[\]]", "", r["query_text"] or "")
+        lines.append(
+            f"• `{r['handler']}` {f'«{text}» ' if text else ''}× {r['hits']:,} | p95 **{r['p95_ms']:,}ms** "
+            f"(قاعدة {r['db_ms']:,} / API {r['api_ms']:,} / بايثون {r['python_ms']:,})"
+        )
+    lines += ["--------------------------------------", "🔍 **أكثر ما استهلك الوقت فيها:**"]
+    for r in spans:
+        lines.append(f"• `{r['span']}`: {r['total_ms']:,}ms في {r['hits']:,} تحديث")
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
 
+# ==============================================================================
+# 📢 ميزة الإذاعة الآمنة والذكية في الخلفية (Background Broadcast)
+# ==============================================================================
+
 @admin_only
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: 
@@ -261,24 +245,16 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     msg = " ".join(context.args)
-    pool = context.bot_data.get('db_conn')
+    # الإذاعة تعمل لساعات: مجمع الخلفية (مهلة أوامر طويلة) وليس مجمع طلبات المستخدمين
+    pool = DB.pool(BACKGROUND)
     
     if not pool:
         await update.message.reply_text("❌ قاعدة البيانات غير متوفرة حالياً.")
         return
 
-    async with pool.acquire() as conn:  
-        users = await conn.fetch("SELECT user_id FROM users")  
-          
-    await update.message.reply_text(
-        f"🚀 **بدأت الإذاعة لـ {len(users)} مستخدم في الخلفية!**\n"  
-        f"⚡ البوت يعمل الآن بكامل طاقته ويستقبل طلبات البحث كالمعتاد.\n"
-        f"📊 سيصلك تقرير تفصيلي هنا فور الانتهاء كلياً."
-    )  
-    
-    asyncio.create_task(
-        _background_broadcast(users, msg, context, update.effective_chat.id)
-    )
+    # 📢 محرك الإذاعة: إرسال متوازٍ بمعدل محدود مع حفظ التقدم واستئنافه بعد إعادة التشغيل
+    # (رسالة البدء نفسها هي رسالة التقدم التي يحدّثها المحرك)
+    await start_broadcast(context.application, pool, msg, update.effective_chat.id)
 
 
 # ==============================================================================
@@ -303,6 +279,8 @@ async def set_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             channel_name = chat.title or str(target_id)  
               
         context.bot_data["required_channel_id"] = target_id  
+        # 📢 تحديث بيانات القناة فوراً من نفس نتيجة get_chat
+        CHANNEL_INFO.update_from_chat(chat)
         await update.message.reply_text(f"✅ تم تعيين قناة الاشتراك الإجباري بنجاح وحفظها دائمياً!\n📌 القناة: **{channel_name}**")  
     except Exception as e:  
         await update.message.reply_text("❌ لم يتم العثور على القناة. تأكد من رفع البوت مشرفاً أولاً.")
@@ -311,36 +289,20 @@ async def set_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_only
 async def channel_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     required_channel = context.bot_data.get("required_channel_id")
-    pool = context.bot_data.get('db_conn')
+    pool = DB.pool(BACKGROUND)
     
     if required_channel is None:
         await update.message.reply_text("❌ لم يتم تعيين قناة اشتراك إجباري للبوت حتى الآن.")
         return
 
     try:
-        chat_info = await context.bot.get_chat(required_channel)
-        channel_title = chat_info.title or "القناة المشتركة"
+        channel = await CHANNEL_INFO.resolve(context.bot, required_channel)
+        channel_title = channel.display_title
         
         joined_last_24h = 0
         if pool:
-            async with pool.acquire() as conn:
-                # 🔄 فحص ما إذا حان وقت تصفير العداد (مرت 24 ساعة)
-                reset_needed = await conn.fetchval("""
-                    SELECT (NOW() >= reset_at) FROM bot_counters WHERE counter_name = 'sub_verified_24h'
-                """)
-                
-                if reset_needed:
-                    # تصفير العداد الرقمي وإعادة جدولة الـ 24 ساعة القادمة تلقائياً
-                    await conn.execute("""
-                        UPDATE bot_counters 
-                        SET current_value = 0, reset_at = NOW() + INTERVAL '24 hours' 
-                        WHERE counter_name = 'sub_verified_24h';
-                    """)
-                
-                # جلب القيمة الصافية للعداد الرقمي المستقل
-                joined_last_24h = await conn.fetchval("""
-                    SELECT current_value FROM bot_counters WHERE counter_name = 'sub_verified_24h'
-                """)
+            # 🔄 قراءة العداد مع تصفيره تلقائياً إذا مرت 24 ساعة (أمر واحد)
+            joined_last_24h = await DB.fetchval("admin.sub_counter") or 0
 
         stats_reply = (
             "📢 **إحصائيات الاشتراك الإجبارية الحالية:**\n"
@@ -361,7 +323,7 @@ async def channel_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_daily_report_job(context: ContextTypes.DEFAULT_TYPE):
     """الوظيفة المجدولة التي تنطلق تلقائياً لإرسال الإحصائيات وتصفير العداد"""
-    pool = context.bot_data.get('db_conn')
+    pool = DB.pool(BACKGROUND)
     required_channel = context.bot_data.get("required_channel_id")
     
     if not pool or ADMIN_USER_ID == 0:
@@ -370,26 +332,11 @@ async def send_daily_report_job(context: ContextTypes.DEFAULT_TYPE):
     try:
         channel_title = "القناة المشتركة"
         if required_channel:
-            try:
-                chat_info = await context.bot.get_chat(required_channel)
-                channel_title = chat_info.title or "القناة المشتركة"
-            except:
-                pass
-
-        async with pool.acquire() as conn:
-            # جلب العدد الأخير المتوفر قبل التصفير
-            joined_today = await conn.fetchval("""
-                SELECT current_value FROM bot_counters WHERE counter_name = 'sub_verified_24h'
-            """)
-            if joined_today is None:
-                joined_today = 0
-
-            # تصفير العداد لليوم الجديد فوراً وتحديث وقت التصفير القادم
-            await conn.execute("""
-                UPDATE bot_counters 
-                SET current_value = 0, reset_at = NOW() + INTERVAL '24 hours' 
-                WHERE counter_name = 'sub_verified_24h';
-            """)
+            channel = await CHANNEL_INFO.resolve(context.bot, required_channel)
+            channel_title = channel.display_title
+
+        # جلب العدد الأخير وتصفير العداد لليوم الجديد في أمر واحد
+        joined_today = await DB.fetchval("admin.sub_counter_reset") or 0
 
         # إرسال التقرير النهائي لك مباشرة
         report_text = (
@@ -424,6 +371,8 @@ def register_admin_handlers(application, original_start_handler):
     application.add_handler(CommandHandler("broadcast", admin_broadcast))  
     application.add_handler(CommandHandler("setchannel", set_channel))
     application.add_handler(CommandHandler("channel_stats", channel_stats))
+    application.add_handler(CommandHandler("db_stats", db_stats))
+    application.add_handler(CommandHandler("slow_updates", slow_updates))
 
     # ⏳ تفعيل الجدولة اليومية التلقائية عبر الـ Job Queue الخاص بالبوت
     if application.job_queue:
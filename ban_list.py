@@ -0,0 +1,86 @@
+import pickle
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes, ApplicationHandlerStop
+
+from database import DB
+
+# إعداد اللوج لمتابعة الحظر
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🔒 قائمة المحظورين
+# تُحفظ في جدول banned_users وتُنسخ في مجموعة داخل الذاكرة عند الإقلاع،
+# ويفحصها معالج واحد بأولوية عالية (group -1) يوقف تحديثات المحظور مبكراً.
+# ==========================================================
+
+BANNED_USERS = set()
+
+MIGRATION_BATCH = 2000
+
+
+async def load_banned_users(pool):
+    async with DB.acquire(pool) as conn:
+        rows = await DB.fetch("bans.all", conn=conn)
+    BANNED_USERS.clear()
+    BANNED_USERS.update(r["user_id"] for r in rows)
+
+
+async def ban(user_id: int):
+    await DB.execute("bans.add", user_id)
+    BANNED_USERS.add(user_id)
+
+
+async def unban(user_id: int):
+    await DB.execute("bans.remove", user_id)
+    BANNED_USERS.discard(user_id)
+
+
+async def enforce_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """معالج group -1: إيقاف أي رسالة أو زر من مستخدم محظور قبل بقية المعالجات"""
+    user = update.effective_user
+    if not user or user.id not in BANNED_USERS:
+        return
+
+    # تحديثات العضوية والقنوات تمر كما هي (تعتمد عليها كاشات الاشتراك)
+    if update.chat_member or update.my_chat_member or update.channel_post:
+        return
+
+    if update.callback_query:
+        await update.callback_query.answer("❌ أنت محظور من استخدام أزرار هذا البوت.", show_alert=True)
+    raise ApplicationHandlerStop
+
+
+async def migrate_legacy_bans(application, pool):
+    """ترحيل لمرة واحدة لعلامات is_banned القديمة المحفوظة داخل user_data"""
+    if application.bot_data.get("bans_migrated"):
+        return
+
+    try:
+        banned = {uid for uid, data in application.user_data.items() if data.get("is_banned")}
+
+        # جدول persistence_user_data ينشئه الترحيل 0013 (فارغ إن كان الحفظ في ملف pickle)
+        last_id = 0
+        while True:
+            async with DB.acquire(pool) as conn:
+                rows = await DB.fetch("bans.legacy_user_data", last_id, MIGRATION_BATCH, conn=conn)
+            if not rows:
+                break
+            for r in rows:
+                try:
+                    if pickle.loads(r["data"]).get("is_banned"):
+                        banned.add(r["user_id"])
+                except Exception:
+                    continue
+            last_id = rows[-1]["user_id"]
+
+        if banned:
+            async with DB.acquire(pool) as conn:
+                await DB.execute("bans.add_many", list(banned), conn=conn)
+            BANNED_USERS.update(banned)
+
+        application.bot_data["bans_migrated"] = True
+        logger.info(f"✅ Legacy bans migrated: {len(banned):,} users.")
+    except Exception:
+        logger.error("❌ Legacy bans migration error", exc_info=True)
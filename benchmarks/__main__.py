@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+
+from database import Database, INTERACTIVE, BACKGROUND
+from migrator import migrate
+from radar_pool import load_radar_pool_sizes
+from benchmarks.corpus import seed_corpus
+from benchmarks.cases import Samples, build_cases
+
+logger = logging.getLogger("benchmarks")
+
+# ==========================================================
+# ⏱ قياس استعلامات المسار الساخن على فهرس اصطناعي
+# يطبق ترحيلات البوت على قاعدة قياس منفصلة، ويملؤها بالفهرس الاصطناعي،
+# ثم يقيس كل حالة (p50/p95/p99) على اتصال من المجمع التفاعلي بنفس إعدادات
+# الجلسة، ويعرض خطة EXPLAIN ويتحقق من الفهارس المستخدمة فيها.
+# رمز الخروج 1 عند أي تراجع في الخطة (للاستخدام قبل النشر).
+#
+# التشغيل:
+#   BENCH_DATABASE_URL=postgres://.../library_bench python -m benchmarks --books 500000
+# ==========================================================
+
+SAMPLE_TITLES = 2000
+WARMUP_ITERATIONS = 5
+
+
+def _percentile(sorted_values: list, p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _format_plan(plan: dict, depth: int = 0) -> list:
+    target = f" on {plan['Relation Name']}" if "Relation Name" in plan else ""
+    index = f" using {plan['Index Name']}" if "Index Name" in plan else ""
+    actual = f" (rows={plan.get('Actual Rows', '?')}, {plan.get('Actual Total Time', 0):.2f}ms)"
+    lines = ["  " * depth + f"-> {plan['Node Type']}{target}{index}{actual}"]
+    for child in plan.get("Plans", []):
+        lines += _format_plan(child, depth + 1)
+    return lines
+
+
+async def explain(conn, sql: str, args) -> dict:
+    raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql.rstrip().rstrip(';')}", *args)
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+
+async def run_case(conn, case, samples: Samples, rng: random.Random, iterations: int) -> dict:
+    try:
+        arg_sets = [case.make_args(samples, rng) for _ in range(iterations + WARMUP_ITERATIONS)]
+    except (IndexError, ValueError) as e:
+        # مثلاً لا توجد مخزونات رادار في فهرس صغير جداً
+        return {"name": case.name, "skipped": f"no sample arguments ({e})"}
+
+    timings = []
+    rows = 0
+    for i, args in enumerate(arg_sets):
+        started = time.perf_counter()
+        if case.run:
+            result = await case.run(conn, *args)
+        else:
+            result = await conn.fetch(case.sql, *args)
+        elapsed = time.perf_counter() - started
+        if i >= WARMUP_ITERATIONS:
+            timings.append(elapsed)
+            rows += len(result)
+
+    timings.sort()
+    report = {
+        "name": case.name,
+        "iterations": len(timings),
+        "avg_rows": rows / len(timings),
+        "p50_ms": _percentile(timings, 0.50) * 1000,
+        "p95_ms": _percentile(timings, 0.95) * 1000,
+        "p99_ms": _percentile(timings, 0.99) * 1000,
+    }
+
+    if case.sql:
+        plan = await explain(conn, case.sql, arg_sets[-1])
+        used = sorted({n["Index Name"] for n in _plan_nodes(plan) if "Index Name" in n})
+        report["plan"] = _format_plan(plan)
+        report["indexes_used"] = used
+        if case.indexes is not None:
+            report["plan_ok"] = bool(set(case.indexes) & set(used))
+            report["expected_indexes"] = list(case.indexes)
+    return report
+
+
+def print_report(reports: list, show_plans: bool):
+    print(f"\n{'case':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rows':>8}  plan")
+    print("-" * 80)
+    for r in reports:
+        if "skipped" in r:
+            print(f"{r['name']:<24}{'skipped: ' + r['skipped']:>38}")
+            continue
+        status = {True: "✅ " + ", ".join(r["indexes_used"]), False: "❌ expected " + " | ".join(r.get("expected_indexes", []))}
+        plan = status.get(r.get("plan_ok"), "· " + ", ".join(r.get("indexes_used", [])))
+        print(f"{r['name']:<24}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['avg_rows']:>8.0f}  {plan}")
+        if show_plans or r.get("plan_ok") is False:
+            for line in r.get("plan", []):
+                print(f"{'':<6}{line}")
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Hot-path SQL benchmarks on a synthetic catalog.")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"), help="benchmark database (default: BENCH_DATABASE_URL)")
+    parser.add_argument("--books", type=int, default=100_000, help="synthetic catalog size (100k to 2M)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="regenerate the corpus even if one exists")
+    parser.add_argument("--only", nargs="*", help="run only these case names")
+    parser.add_argument("--plans", action="store_true", help="print every EXPLAIN plan")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--report-only", action="store_true", help="do not fail on unexpected plans")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.dsn:
+        parser.error("set BENCH_DATABASE_URL or pass --dsn")
+    # القياس يفرّغ الجداول: لا يعمل أبداً على قاعدة البوت
+    if args.dsn == os.getenv("DATABASE_URL"):
+        parser.error("refusing to run against DATABASE_URL; use a separate benchmark database")
+
+    db = Database()
+    await db.connect(args.dsn, interactive_size=2, background_size=2)
+    try:
+        version, applied = await migrate(db.pool(), args.dsn)
+        logger.info(f"🧱 Benchmark schema at v{version} ({len(applied)} applied).")
+
+        # التعبئة على مجمع الخلفية (مهلة أوامر طويلة)، والقياس على التفاعلي كما في الإنتاج
+        corpus = await seed_corpus(db.pool(BACKGROUND), args.books, seed=args.seed, reset=args.reset)
+        await load_radar_pool_sizes(db.pool())
+
+        async with db.pool(INTERACTIVE).acquire() as conn:
+            titles = await conn.fetch("""
+                SELECT name_normalized FROM books
+                TABLESAMPLE SYSTEM (5) REPEATABLE ($2)
+                WHERE name_normalized <> ''
+                LIMIT $1;
+            """, SAMPLE_TITLES, args.seed)
+            max_book_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM books;")
+            max_user_id = await conn.fetchval("SELECT COALESCE(MAX(user_id), 0) FROM users;")
+            samples = Samples([r["name_normalized"] for r in titles], max_book_id, max_user_id)
+
+            rng = random.Random(args.seed)
+            cases = [c for c in build_cases() if not args.only or c.name in args.only]
+            reports = []
+            for case in cases:
+                logger.info(f"⏱ {case.name}...")
+                reports.append(await run_case(conn, case, samples, rng, args.iterations))
+    finally:
+        await db.close()
+
+    logger.info(f"📚 Corpus: {corpus['books']:,} books")
+    print_report(reports, args.plans)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"books": corpus["books"], "cases": reports}, f, ensure_ascii=False, indent=2)
+
+    regressions = [r["name"] for r in reports if r.get("plan_ok") is False]
+    if regressions:
+        print(f"\n❌ Unexpected plans: {', '.join(regressions)}")
+        return 0 if args.report_only else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,141 @@
+import random
+from collections import namedtuple
+
+from database import QUERIES
+from search_engine import TIER_BUDGETS, prefix_upper_bound, run_tiered_search
+from search_handler import MAX_RESULTS, build_ts_query
+from search_session import BOOKS_PER_PAGE, COUNT_CAP
+from limit_handler import DAILY_SEARCH_LIMIT
+from indexes import INDEX_CATEGORIES
+from english_index_handler import ENGLISH_INDEX_CATEGORIES
+from book_categories import CATEGORY_RULES
+from radar_pool import RADAR_POOL_SIZES, RADAR_PICKS, RADAR_OVERSAMPLE, RADAR_SIZE_PAGES
+from trending import TRENDING_WINDOWS, TRENDING_LIMIT, DEFAULT_WINDOW
+
+# ==========================================================
+# 🎯 حالات القياس
+# كل حالة تنفذ نص الاستعلام نفسه الذي يستخدمه البوت (من سجل database.py)
+# بمعاملات مأخوذة من الفهرس الاصطناعي. indexes هي
+# الفهارس المتوقعة في الخطة: يكفي ظهور أحدها، وغيابها كلها يُعد تراجعاً.
+# indexes=None: قياس الزمن فقط (دالة plpgsql أو مسار من عدة استعلامات).
+# ==========================================================
+
+# sql: نص الاستعلام، أو None مع run للحالات المركبة
+# make_args: دالة (samples, rng) ← tuple المعاملات
+Case = namedtuple("Case", ["name", "sql", "make_args", "indexes", "run"])
+
+
+def _case(name, sql, make_args, indexes=None, run=None) -> Case:
+    return Case(name, sql, make_args, tuple(indexes) if indexes else None, run)
+
+
+def _typo(rng: random.Random, text: str) -> str:
+    """حذف حرف من كل كلمة طويلة لمحاكاة خطأ إملائي (مسار البحث التقريبي)"""
+    words = []
+    for word in text.split()[:3]:
+        if len(word) > 3:
+            i = rng.randrange(len(word))
+            word = word[:i] + word[i + 1:]
+        words.append(word)
+    return " ".join(words)
+
+
+def _category_patterns(categories) -> list:
+    # كلمة من حرفين لا تعطي trigram، فيصبح المسح الكامل هو الخطة الصحيحة لنمطها:
+    # تُستبعد هذه الأقسام من حالات فحص الفهرس
+    return [
+        f"({'|'.join(c['keywords'])})"
+        for c in categories.values()
+        if all(len(k.replace(" ", "")) >= 3 for k in c["keywords"])
+    ]
+
+
+class Samples:
+    """عينات المعاملات المشتقة من عناوين مطبّعة حقيقية في قاعدة القياس"""
+
+    def __init__(self, titles: list, max_book_id: int, max_user_id: int):
+        self.titles = [t for t in titles if t.strip()]
+        self.max_book_id = max_book_id
+        self.max_user_id = max_user_id
+        self.patterns = _category_patterns(INDEX_CATEGORIES) + _category_patterns(ENGLISH_INDEX_CATEGORIES)
+        self.category_keys = [key for key, _ in CATEGORY_RULES]
+
+    def title(self, rng):
+        return rng.choice(self.titles)
+
+    def prefix(self, rng):
+        return " ".join(self.title(rng).split()[:2])
+
+    def pair(self, rng):
+        """كلمتان متجاورتان من عنوان (استعلام احتواء واقعي، أندر من كلمة واحدة)"""
+        words = self.title(rng).split()
+        if len(words) < 2:
+            return words[0]
+        i = rng.randrange(len(words) - 1)
+        return f"{words[i]} {words[i + 1]}"
+
+
+def _exact_args(samples: Samples, rng: random.Random):
+    norm_q = samples.prefix(rng)
+    return norm_q, prefix_upper_bound(norm_q), TIER_BUDGETS["exact"]
+
+
+def _radar_args(samples: Samples, rng: random.Random):
+    key = rng.choice(sorted(RADAR_POOL_SIZES))
+    size = rng.choice(sorted(RADAR_SIZE_PAGES))
+    min_pages, max_pages = RADAR_SIZE_PAGES[size]
+    slots = rng.sample(range(RADAR_POOL_SIZES[key]), min(RADAR_PICKS * RADAR_OVERSAMPLE, RADAR_POOL_SIZES[key]))
+    return key, slots, min_pages, max_pages, RADAR_PICKS
+
+
+async def _tiered_search(conn, norm_q: str):
+    return await run_tiered_search(conn, norm_q, build_ts_query(norm_q), MAX_RESULTS)
+
+
+def build_cases() -> list:
+    sql = {name: query.sql for name, query in QUERIES.items()}
+    period, _, min_downloads = TRENDING_WINDOWS[DEFAULT_WINDOW]
+    return [
+        # 🧭 البحث: كل طبقة منفردة ثم المسار الكامل كما ينفذه search_books
+        _case("search.exact", sql["search.exact"], _exact_args, ["idx_books_name_prefix"]),
+        _case("search.contains", sql["search.contains"],
+              lambda s, r: (f"%{s.pair(r)}%", TIER_BUDGETS["contains"]),
+              ["idx_trgm_books_normalized"]),
+        _case("search.fts", sql["search.fts"],
+              lambda s, r: (build_ts_query(s.prefix(r)), TIER_BUDGETS["fts"]),
+              ["idx_fts_books"]),
+        _case("search.fuzzy", sql["search.fuzzy"],
+              lambda s, r: (_typo(r, s.title(r)), TIER_BUDGETS["fuzzy"]),
+              ["idx_trgm_books_normalized"]),
+        _case("search.tiered", None, lambda s, r: (s.prefix(r),), run=_tiered_search),
+
+        # 📑 الفهارس: صفحات الجلسات بالـ regex (قبل التصنيف) وعبر book_categories
+        _case("session.regex_count", sql["session.regex_count"],
+              lambda s, r: (r.choice(s.patterns), COUNT_CAP + 1),
+              ["idx_trgm_books"]),
+        _case("session.regex_next", sql["session.regex_next"],
+              lambda s, r: (r.choice(s.patterns), r.randint(0, s.max_book_id // 2), BOOKS_PER_PAGE),
+              ["idx_trgm_books", "books_pkey"]),
+        _case("session.regex_prev", sql["session.regex_prev"],
+              lambda s, r: (r.choice(s.patterns), r.randint(s.max_book_id // 2, s.max_book_id), BOOKS_PER_PAGE),
+              ["idx_trgm_books", "books_pkey"]),
+        _case("session.category_next", sql["session.category_next"],
+              lambda s, r: (r.choice(s.category_keys), r.randint(0, s.max_book_id // 2), BOOKS_PER_PAGE),
+              ["book_categories_pkey"]),
+        _case("session.page_by_ids", sql["session.page_by_ids"],
+              lambda s, r: ([r.randint(1, s.max_book_id) for _ in range(BOOKS_PER_PAGE)],),
+              ["books_pkey"]),
+
+        # 🚀 الرادار
+        _case("radar.pick", sql["radar.pick"], _radar_args, ["radar_candidates_pkey"]),
+
+        # 🔥 الأكثر تحميلاً هذا الأسبوع: نافذة 7 أيام من 31 يوماً محفوظة قد تُمسح
+        # كاملة بحق، فالمطلوب فقط أن يبقى الربط مع books عبر المفتاح الأساسي
+        _case("trending.top_weekly", sql["trending.top_books"],
+              lambda s, r: (period, min_downloads, TRENDING_LIMIT),
+              ["books_pkey"]),
+
+        # 🎟 فحص واستهلاك الحصة (consume_search_quota): دالة plpgsql، زمن فقط
+        _case("quota.consume", sql["quota.consume"],
+              lambda s, r: (r.randint(1, s.max_user_id), DAILY_SEARCH_LIMIT)),
+    ]
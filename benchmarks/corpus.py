@@ -0,0 +1,196 @@
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from search_handler import normalize_query
+from indexes import INDEX_CATEGORIES
+from english_index_handler import ENGLISH_INDEX_CATEGORIES
+from radar_handler import RADAR_ATLAS
+from download_recorder import RETENTION_DAYS, _create_partition, _utc_today
+
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📚 فهرس اصطناعي يشبه مكتبة القناة
+# عناوين عربية وإنجليزية مختلطة بأشكال أسماء الملفات الحقيقية: شرطات سفلية
+# بدل المسافات، تشكيل، لواحق طبعات وأجزاء، وامتداد pdf أحياناً. كلمات
+# الأقسام وجذور أطلس الرادار تُزرع بنسب ثابتة حتى تعمل استعلامات الفهارس
+# والرادار على مخزونات بحجم واقعي. التوليد حتمي بالـ seed.
+# ==========================================================
+
+COPY_BATCH = 50_000
+
+# نسبة العناوين العربية، ونسب زرع كلمات الأقسام وجذور الرادار
+ARABIC_SHARE = 0.7
+CATEGORY_SHARE = 0.35
+RADAR_SHARE = 0.05
+
+# نسبة الكتب التي استُخرج عدد صفحاتها (الباقي NULL كما قبل اكتمال العامل)
+PAGE_COUNT_SHARE = 0.6
+
+ARABIC_WORDS = (
+    "الحب", "الزمن", "المدينة", "الليل", "البحر", "الطريق", "الذاكرة", "الحرب", "السلام", "الصمت",
+    "الظل", "النور", "القلب", "الروح", "الوطن", "المنفى", "الحلم", "الغريب", "الأرض", "السماء",
+    "أسرار", "رحلة", "حكاية", "مقدمة", "مدخل", "أسس", "مبادئ", "دليل", "موسوعة", "تاريخ",
+    "العقل", "الإنسان", "المجتمع", "الحضارة", "الثقافة", "اللغة", "المعرفة", "الحرية", "العدالة", "الأخلاق",
+    "نظرية", "منهج", "دراسات", "قضايا", "رسائل", "مختارات", "شرح", "تحقيق", "نقد", "فلسفة",
+)
+ENGLISH_WORDS = (
+    "the", "art", "of", "war", "history", "modern", "introduction", "to", "guide", "principles",
+    "mind", "power", "secret", "life", "world", "science", "theory", "practice", "handbook", "essentials",
+    "learning", "deep", "python", "data", "economics", "psychology", "philosophy", "ancient", "empire", "rise",
+    "fall", "silent", "night", "city", "journey", "stories", "complete", "works", "advanced", "fundamentals",
+)
+ARABIC_AUTHORS = (
+    "نجيب محفوظ", "طه حسين", "العقاد", "أحمد خالد توفيق", "غسان كنفاني", "محمود درويش",
+    "ابن خلدون", "مصطفى محمود", "علي الوردي", "أحلام مستغانمي", "جبران خليل جبران", "المنفلوطي",
+)
+ENGLISH_AUTHORS = (
+    "Orwell", "Tolstoy", "Dostoevsky", "Hemingway", "Kafka", "Austen",
+    "Harari", "Sagan", "Hawking", "Dickens", "Camus", "Nietzsche",
+)
+ARABIC_SUFFIXES = ("الطبعة الثانية", "ط2", "ط 3", "الجزء الأول", "ج2", "نسخة مصورة", "مكتبة نور", "pdf")
+ENGLISH_SUFFIXES = ("2nd edition", "(3rd ed.)", "vol 1", "v2", "revised", "final", "ebook", "pdf")
+DIACRITICS = "ًٌٍَُِّْ"
+
+
+def _keywords(categories) -> list:
+    return [k for category in categories.values() for k in category["keywords"]]
+
+
+ARABIC_KEYWORDS = _keywords(INDEX_CATEGORIES)
+ENGLISH_KEYWORDS = _keywords(ENGLISH_INDEX_CATEGORIES)
+# "_" في جذور الأطلس تعني أي حرف في ILIKE: تُكتب مسافة في العنوان
+RADAR_ROOTS = [
+    root.replace("_", " ")
+    for levels in RADAR_ATLAS.values() for roots in levels.values() for root in roots
+]
+
+
+def _add_diacritics(rng: random.Random, text: str) -> str:
+    return "".join(
+        ch + rng.choice(DIACRITICS) if "ء" <= ch <= "ي" and rng.random() < 0.15 else ch
+        for ch in text
+    )
+
+
+def make_title(rng: random.Random) -> str:
+    """عنوان ملف واحد بشكل أسماء ملفات القناة"""
+    arabic = rng.random() < ARABIC_SHARE
+    words = ARABIC_WORDS if arabic else ENGLISH_WORDS
+    parts = rng.sample(words, rng.randint(2, 5))
+
+    if rng.random() < CATEGORY_SHARE:
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(ARABIC_KEYWORDS if arabic else ENGLISH_KEYWORDS))
+    if arabic and rng.random() < RADAR_SHARE:
+        parts.insert(0, rng.choice(RADAR_ROOTS))
+    if rng.random() < 0.4:
+        parts.append(rng.choice(ARABIC_AUTHORS if arabic else ENGLISH_AUTHORS))
+    if rng.random() < 0.3:
+        parts.append(rng.choice(ARABIC_SUFFIXES if arabic else ENGLISH_SUFFIXES))
+
+    title = " ".join(parts)
+    if not arabic and rng.random() < 0.5:
+        title = title.title()
+    if arabic and rng.random() < 0.25:
+        title = _add_diacritics(rng, title)
+    if rng.random() < 0.35:
+        title = title.replace(" ", "_")
+    if rng.random() < 0.2:
+        title += ".pdf"
+    return title
+
+
+async def _copy_in_batches(conn, table: str, columns, records_iter, total: int):
+    batch = []
+    written = 0
+    for record in records_iter:
+        batch.append(record)
+        if len(batch) >= COPY_BATCH:
+            await conn.copy_records_to_table(table, records=batch, columns=columns)
+            written += len(batch)
+            batch = []
+            logger.info(f"  {table}: {written:,}/{total:,}")
+    if batch:
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+
+
+def _book_records(rng: random.Random, count: int):
+    for i in range(count):
+        title = make_title(rng)
+        pages = rng.choice((rng.randint(20, 150), rng.randint(151, 900))) if rng.random() < PAGE_COUNT_SHARE else None
+        yield (f"BENCH{i:08d}", title, normalize_query(title), pages)
+
+
+def _user_records(rng: random.Random, count: int, now: datetime):
+    for user_id in range(1, count + 1):
+        premium = rng.random() < 0.03
+        expiry = (now + timedelta(days=rng.randint(-30, 365))).replace(tzinfo=None) if premium else None
+        yield (user_id, premium, expiry, rng.choice((0, 0, 0, 5, 10, 30)))
+
+
+def _rollup_records(rng: random.Random, books: int, now: datetime):
+    """تحميلات بالساعة لآخر 30 يوماً بتوزيع ذيل طويل (قلة من الكتب تأخذ معظم التحميلات)"""
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    popular = max(1, books // 100)
+    for hours_ago in range(30 * 24):
+        hour = current_hour - timedelta(hours=hours_ago)
+        seen = set()
+        for _ in range(rng.randint(20, 60)):
+            book_id = int(rng.paretovariate(1.2)) % popular + 1 if rng.random() < 0.8 else rng.randint(1, books)
+            if book_id not in seen:
+                seen.add(book_id)
+                yield (book_id, hour, rng.randint(1, 15))
+
+
+def _download_records(rng: random.Random, books: int, now: datetime, count: int):
+    for _ in range(count):
+        yield (rng.randint(1, books), f"BENCH{rng.randint(0, books - 1):08d}",
+               now - timedelta(seconds=rng.randint(0, RETENTION_DAYS * 86400 - 1)))
+
+
+async def seed_corpus(pool, books: int, seed: int = 42, reset: bool = False) -> dict:
+    """ملء قاعدة البيانات (بعد الترحيلات) بالفهرس الاصطناعي، ثم بناء الجداول المشتقة بنفس كود البوت"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    users = max(1000, books // 10)
+
+    async with pool.acquire() as conn:
+        existing = await conn.fetchval("SELECT COUNT(*) FROM books;")
+        if existing and not reset:
+            if existing != books:
+                logger.warning(f"Reusing existing corpus of {existing:,} books (pass --reset to regenerate {books:,}).")
+            return {"books": existing, "seeded": False}
+
+        logger.info(f"🌱 Seeding {books:,} books, {users:,} users and download history...")
+        await conn.execute("""
+            TRUNCATE books, users, search_logs, book_categories, radar_candidates,
+                     download_rollups, download_stats, pdf_metadata_queue RESTART IDENTITY;
+        """)
+        await _copy_in_batches(conn, "books", ("file_id", "file_name", "name_normalized", "page_count"),
+                               _book_records(rng, books), books)
+        await _copy_in_batches(conn, "users", ("user_id", "is_premium", "premium_expiry", "search_credits"),
+                               _user_records(rng, users, now), users)
+        await conn.copy_records_to_table(
+            "search_logs", columns=("user_id", "search_date", "count"),
+            records=[(u, now.date(), rng.randint(1, 10)) for u in rng.sample(range(1, users + 1), users // 5)]
+        )
+        await _copy_in_batches(conn, "download_rollups", ("book_id", "hour", "downloads"),
+                               _rollup_records(rng, books, now), 30 * 24 * 40)
+        # أقسام أيام الاحتفاظ (قاعدة مُرحّلة قديماً قد تفتقد أقسام الأيام الأخيرة)
+        for offset in range(-RETENTION_DAYS, 1):
+            await _create_partition(conn, _utc_today() + timedelta(days=offset))
+        await _copy_in_batches(conn, "download_stats", ("book_id", "file_id", "downloaded_at"),
+                               _download_records(rng, books, now, books * 2), books * 2)
+
+    # الأقسام ومخزونات الرادار تُبنى بنفس الدوال التي يشغلها البوت عند الإقلاع
+    from book_categories import reclassify_books
+    from radar_pool import rebuild_radar_candidates
+    await reclassify_books(pool, {})
+    await rebuild_radar_candidates(pool, {})
+
+    async with pool.acquire() as conn:
+        await conn.execute("ANALYZE;")
+    await asyncio.sleep(0)
+    return {"books": books, "seeded": True}
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from database import DB
+from search_handler import normalize_query, NORMALIZATION_VERSION
+from indexes import INDEX_CATEGORIES
+from english_index_handler import ENGLISH_INDEX_CATEGORIES
+
+# إعداد اللوج لمتابعة تصنيف الكتب
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🗂 تصنيف الكتب مسبقاً إلى أقسام الفهرسين العربي والإنكليزي
+# كل كتاب يُصنَّف مرة واحدة عند الإدخال في جدول book_categories،
+# وتصفح القسم يصبح مسحاً لنطاق في الفهرس بدلاً من regex على كل الجدول.
+# ==========================================================
+
+RECLASSIFY_BATCH = 5000
+
+def category_key(index_name: str, category_id: str) -> str:
+    """مفتاح القسم في الجدول: ar:<id> أو en:<id>"""
+    return f"{index_name}:{category_id}"
+
+
+def _build_rules() -> list:
+    rules = []
+    for index_name, categories in (("ar", INDEX_CATEGORIES), ("en", ENGLISH_INDEX_CATEGORIES)):
+        for category_id, category in categories.items():
+            keywords = [normalize_query(k) for k in category["keywords"]]
+            rules.append((category_key(index_name, category_id), [k for k in keywords if k]))
+    return rules
+
+
+CATEGORY_RULES = _build_rules()
+
+# بصمة الكلمات المفتاحية ونسخة التطبيع: أي تعديل على الأقسام أو على normalize_query
+# يطلق إعادة التصنيف تلقائياً عند الإقلاع
+CATEGORIES_HASH = hashlib.sha1(
+    json.dumps([NORMALIZATION_VERSION, CATEGORY_RULES], ensure_ascii=False).encode("utf-8")
+).hexdigest()
+
+# عدد الكتب في كل قسم (يُعرض على أزرار الفهرس)
+CATEGORY_COUNTS = {}
+
+
+def classify_title(normalized_title: str) -> list:
+    """أقسام العنوان المطبّع (مطابقة جزئية لأي كلمة مفتاحية كما في regex القديم)"""
+    if not normalized_title:
+        return []
+    return [
+        key for key, keywords in CATEGORY_RULES
+        if any(k in normalized_title for k in keywords)
+    ]
+
+
+def categories_ready(bot_data) -> bool:
+    """الجدول مكتمل ومطابق للأقسام الحالية (وإلا يُستخدم التصفح القديم بالـ regex)"""
+    return bot_data.get("categories_hash") == CATEGORIES_HASH
+
+
+async def _write_categories(conn, books):
+    """استبدال أقسام مجموعة كتب: books قائمة (id, name_normalized)"""
+    keys, ids = [], []
+    for book_id, normalized_title in books:
+        for key in classify_title(normalized_title):
+            keys.append(key)
+            ids.append(book_id)
+
+    async with conn.transaction():
+        removed = await DB.fetch("categories.remove_books", [book_id for book_id, _ in books], conn=conn)
+        if keys:
+            await DB.execute("categories.add", keys, ids, conn=conn)
+    return [r["category_key"] for r in removed], keys
+
+
+async def classify_books(pool, books):
+    """تصنيف كتب أُدخلت للتو وتحديث عدّادات الأقسام في الذاكرة"""
+    if not pool or not books:
+        return
+    try:
+        async with DB.acquire(pool) as conn:
+            removed, added = await _write_categories(conn, books)
+        # تحديث تدريجي للعدّادات (إعادة إدخال كتاب قد تنقله بين الأقسام)
+        for key in removed:
+            CATEGORY_COUNTS[key] = max(0, CATEGORY_COUNTS.get(key, 0) - 1)
+        for key in added:
+            CATEGORY_COUNTS[key] = CATEGORY_COUNTS.get(key, 0) + 1
+    except Exception as e:
+        logger.error(f"Error classifying ingested books: {e}")
+
+
+async def load_category_counts(pool):
+    async with DB.acquire(pool) as conn:
+        rows = await DB.fetch("categories.counts", conn=conn)
+    CATEGORY_COUNTS.clear()
+    CATEGORY_COUNTS.update({r["category_key"]: r["books"] for r in rows})
+
+
+async def reclassify_books(pool, bot_data, batch_size: int = RECLASSIFY_BATCH):
+    """إعادة تصنيف كل الكتب على دفعات عند تغيّر الأقسام (قابلة للاستئناف عبر bot_data)"""
+    try:
+        if categories_ready(bot_data):
+            await load_category_counts(pool)
+            return
+
+        if bot_data.get("categories_build_hash") != CATEGORIES_HASH:
+            bot_data["categories_build_hash"] = CATEGORIES_HASH
+            bot_data["categories_checkpoint"] = 0
+
+        last_id = bot_data.get("categories_checkpoint", 0)
+        total = 0
+        while True:
+            async with DB.acquire(pool) as conn:
+                rows = await DB.fetch("books.scan", last_id, batch_size, conn=conn)
+
+                if not rows:
+                    break
+
+                # التطبيع هنا مباشرة حتى لا يتأثر التصنيف بصفوف لم تصلها التعبئة بعد
+                await _write_categories(conn, [(r["id"], normalize_query(r["file_name"] or "")) for r in rows])
+
+            last_id = rows[-1]["id"]
+            total += len(rows)
+            bot_data["categories_checkpoint"] = last_id
+            # إفساح المجال لطلبات المستخدمين بين الدفعات
+            await asyncio.sleep(0.1)
+
+        bot_data["categories_hash"] = CATEGORIES_HASH
+        bot_data.pop("categories_build_hash", None)
+        bot_data.pop("categories_checkpoint", None)
+        await load_category_counts(pool)
+        logger.info(f"✅ Book categories rebuilt: {total:,} books classified into {len(CATEGORY_COUNTS)} sections.")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.error("❌ Book categories reclassification error", exc_info=True)
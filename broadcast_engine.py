@@ -0,0 +1,292 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+
+from ban_list import BANNED_USERS
+from database import DB
+
+# إعداد اللوج لمتابعة الإذاعات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📢 محرك الإذاعة (Broadcast Engine)
+# إرسال متوازٍ محدود بعدد العمّال، تحت محدِّد معدل (Token Bucket) أقل من
+# حد تيليجرام العام (~30 رسالة/ثانية) حتى يبقى هامش لردود البحث.
+# المستلمون يُقرؤون على دفعات keyset ويُحفظ التقدم كل CHECKPOINT_INTERVAL في
+# جدول broadcast_jobs: آخر معرّف اكتمل كل ما قبله (last_user_id) ومعرّفات
+# المكتملين بعده (delivered_ids)، فتستأنف الإذاعة بعد أي إعادة تشغيل دون
+# إعادة الإرسال لمن وصلته الرسالة إلا ما كان قيد الإرسال لحظة التوقف.
+# ==========================================================
+
+BROADCAST_RATE = 25
+BROADCAST_WORKERS = 20
+RECIPIENTS_BATCH = 1000
+MAX_SEND_ATTEMPTS = 3
+
+# الفاصل الأدنى بين تحديثات رسالة التقدم عند المشرف
+PROGRESS_INTERVAL = 5
+
+# الفاصل الأدنى بين نقاط الحفظ (بالثواني)
+CHECKPOINT_INTERVAL = 1
+
+# مهام الإذاعة الجارية (تُلغى عند الإغلاق وتُستأنف عند الإقلاع القادم)
+BROADCAST_TASKS = set()
+
+
+class TokenBucket:
+    """محدِّد معدل: rate رسالة في الثانية مع سعة انفجار مساوية للمعدل"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """إيقاف الإرسال للجميع (حد الفيضان في تيليجرام عام على البوت كله)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class BroadcastRun:
+    """تنفيذ إذاعة واحدة (جديدة أو مستأنفة) حتى نهايتها"""
+
+    def __init__(self, application, pool, job):
+        self.application = application
+        self.bot = application.bot
+        self.pool = pool
+        self.job_id = job["id"]
+        self.message = job["message"]
+        self.admin_chat_id = job["admin_chat_id"]
+        self.progress_message_id = job["progress_message_id"]
+        self.total = job["total"]
+        self.last_user_id = job["last_user_id"]
+        self.sent = job["sent"]
+        self.failed = job["failed"]
+        # المكتملون بعد last_user_id في نقطة الحفظ السابقة (يُتخطَّون عند الاستئناف)
+        self._already_delivered = set(job["delivered_ids"] or ())
+        # المستلمون المُرسلون بالترتيب، وما اكتمل منهم بعد last_user_id
+        self._dispatched = deque()
+        self._completed = set()
+        self.bucket = TokenBucket(BROADCAST_RATE)
+        self._started = time.monotonic()
+        self._sent_at_start = self.sent + self.failed
+        self._last_progress = 0.0
+        self._last_checkpoint = 0.0
+
+    async def _send(self, user_id: int) -> bool:
+        for _ in range(MAX_SEND_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=self.message)
+                return True
+            except RetryAfter as e:
+                # احترام المدة المطلوبة من تيليجرام بالضبط ثم إعادة المحاولة لنفس المستخدم
+                self.bucket.pause(_retry_seconds(e))
+            except (Forbidden, BadRequest):
+                return False
+            except TelegramError:
+                return False
+        return False
+
+    def _complete(self, user_id: int):
+        """تسجيل اكتمال مستلم، ودفع last_user_id إلى آخر معرّف اكتمل كل ما قبله"""
+        self._completed.add(user_id)
+        while self._dispatched and self._dispatched[0] in self._completed:
+            self.last_user_id = self._dispatched.popleft()
+            self._completed.discard(self.last_user_id)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                if await self._send(user_id):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Broadcast send error for {user_id}: {e}")
+            finally:
+                queue.task_done()
+            # الإلغاء أثناء الإرسال لا يصل هنا: المستلم يبقى غير مكتمل ويُعاد عند الاستئناف
+            self._complete(user_id)
+
+    async def _fetch_batch(self, after_user_id: int) -> list:
+        async with DB.acquire(self.pool) as conn:
+            rows = await DB.fetch("broadcast.recipients", after_user_id, RECIPIENTS_BATCH, conn=conn)
+        return [r["user_id"] for r in rows]
+
+    def _delivered_ids(self) -> list:
+        """المكتملون بعد last_user_id: ما اكتمل في هذا التشغيل وما اكتمل قبله ولم نصله بعد"""
+        pending = {u for u in self._already_delivered if u > self.last_user_id}
+        return sorted(self._completed | pending)
+
+    async def _checkpoint(self, status: str = "running"):
+        self._last_checkpoint = time.monotonic()
+        async with DB.acquire(self.pool) as conn:
+            await DB.execute(
+                "broadcast.checkpoint",
+                self.job_id, self.last_user_id, self.sent, self.failed, status, self._delivered_ids(),
+                conn=conn
+            )
+
+    async def _maybe_checkpoint(self):
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            await self._checkpoint()
+
+    def _progress_text(self, finished: bool = False) -> str:
+        done = self.sent + self.failed
+        elapsed = max(time.monotonic() - self._started, 0.001)
+        rate = (done - self._sent_at_start) / elapsed
+        remaining = max(self.total - done, 0)
+        eta = int(remaining / rate) if rate > 0 else 0
+
+        if finished:
+            return (
+                "📢 **اكتملت إذاعة الخلفية بنجاح!**\n\n"
+                f"🟢 تم التسليم بنجاح: **{self.sent:,}**\n"
+                f"🔴 فشل الإرسال (حظر/محذوف): **{self.failed:,}**\n"
+                f"⚡ متوسط السرعة: **{rate:.1f}** رسالة/ثانية\n\n"
+                "⚡ البوت لم يتأثر طوال فترة البث وعمل بكفاءة."
+            )
+        return (
+            f"📡 **الإذاعة #{self.job_id} قيد التنفيذ...**\n\n"
+            f"📬 تمت معالجة: **{done:,} / {self.total:,}**\n"
+            f"🟢 نجاح: **{self.sent:,}** | 🔴 فشل: **{self.failed:,}**\n"
+            f"⚡ السرعة: **{rate:.1f}** رسالة/ثانية\n"
+            f"⏳ الوقت المتبقي التقريبي: **{eta // 60} دقيقة و {eta % 60} ثانية**"
+        )
+
+    async def _report_progress(self, finished: bool = False):
+        now = time.monotonic()
+        if not finished and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        try:
+            if self.progress_message_id:
+                await self.bot.edit_message_text(
+                    chat_id=self.admin_chat_id,
+                    message_id=self.progress_message_id,
+                    text=self._progress_text(finished),
+                    parse_mode="Markdown"
+                )
+        except BadRequest:
+            # نفس النص السابق أو رسالة محذوفة
+            pass
+        except Exception as e:
+            logger.error(f"Could not update broadcast progress for admin: {e}")
+
+    async def run(self):
+        queue = asyncio.Queue(maxsize=BROADCAST_WORKERS * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(BROADCAST_WORKERS)]
+        finished = False
+        try:
+            while True:
+                # الدفعة التالية تبدأ بعد آخر مستلم مُرسل (وليس آخر مستلم اكتمل)
+                batch = await self._fetch_batch(self._dispatched[-1] if self._dispatched else self.last_user_id)
+                if not batch:
+                    break
+
+                for user_id in batch:
+                    self._dispatched.append(user_id)
+                    if user_id in BANNED_USERS or user_id in self._already_delivered:
+                        self._complete(user_id)
+                        continue
+                    await queue.put(user_id)
+                    await self._report_progress()
+                    await self._maybe_checkpoint()
+
+            await queue.join()
+            await self._checkpoint("done")
+            finished = True
+            await self._report_progress(finished=True)
+            logger.info(f"✅ Broadcast #{self.job_id} finished: {self.sent:,} sent, {self.failed:,} failed.")
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if not finished:
+                # نقطة حفظ أخيرة بما اكتمل فعلاً قبل الإيقاف
+                try:
+                    await self._checkpoint()
+                except Exception as e:
+                    logger.error(f"Could not checkpoint broadcast #{self.job_id} on stop: {e}")
+
+
+def _launch(run: BroadcastRun):
+    task = asyncio.create_task(run.run())
+    BROADCAST_TASKS.add(task)
+    task.add_done_callback(BROADCAST_TASKS.discard)
+    return task
+
+
+async def start_broadcast(application, pool, message: str, admin_chat_id: int) -> int:
+    """تسجيل إذاعة جديدة وإطلاقها في الخلفية، وترجع عدد المستلمين"""
+    async with DB.acquire(pool) as conn:
+        total = await DB.fetchval("broadcast.count_users", conn=conn)
+
+    progress = await application.bot.send_message(
+        chat_id=admin_chat_id,
+        text=(
+            f"🚀 **بدأت الإذاعة لـ {total:,} مستخدم في الخلفية!**\n"
+            f"⚡ البوت يعمل الآن بكامل طاقته ويستقبل طلبات البحث كالمعتاد.\n"
+            f"📊 هذه الرسالة تتحدث تلقائياً بالسرعة والوقت المتبقي حتى الانتهاء."
+        ),
+        parse_mode="Markdown"
+    )
+
+    async with DB.acquire(pool) as conn:
+        job = await DB.fetchrow("broadcast.create", message, admin_chat_id, progress.message_id, total, conn=conn)
+
+    _launch(BroadcastRun(application, pool, job))
+    return total
+
+
+async def resume_broadcasts(application, pool):
+    """استئناف الإذاعات التي قطعها إيقاف البوت من آخر نقطة حفظ"""
+    try:
+        async with DB.acquire(pool) as conn:
+            jobs = await DB.fetch("broadcast.running", conn=conn)
+        for job in jobs:
+            logger.info(f"🔁 Resuming broadcast #{job['id']} after user {job['last_user_id']}.")
+            await BroadcastRun(application, pool, job).run()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.error("❌ Broadcast resume error", exc_info=True)
+
+
+async def stop_broadcasts():
+    """إيقاف الإذاعات الجارية عند الإغلاق (تبقى بحالة running لتُستأنف لاحقاً)"""
+    for task in list(BROADCAST_TASKS):
+        task.cancel()
+    if BROADCAST_TASKS:
+        await asyncio.gather(*BROADCAST_TASKS, return_exceptions=True)
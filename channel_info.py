@@ -0,0 +1,104 @@
+import time
+import asyncio
+import logging
+
+# إعداد اللوج لمتابعة تحديث بيانات القناة
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📢 بيانات قناة الاشتراك الإجباري (العنوان، المعرف، رابط الدعوة)
+# تُجلب مرة واحدة عبر get_chat وتُحدَّث دورياً عبر الـ Job Queue،
+# ويستخدمها الاشتراك الإجباري والإحصائيات والتقرير اليومي دون طلبات إضافية.
+# ==========================================================
+
+REFRESH_INTERVAL = 30 * 60
+
+# بعد فشل get_chat لا يُعاد الطلب لنفس القناة قبل هذه المدة (حتى لا يطلبه كل تحديث)
+FAILURE_RETRY_INTERVAL = 5 * 60
+
+# فاصل مهمة الفحص الدورية (الفحص في الذاكرة، والطلب فقط عند انتهاء الصلاحية)
+CHECK_INTERVAL = 60
+
+DEFAULT_TITLE = "القناة المشتركة"
+DEFAULT_LINK = "https://t.me/"
+
+
+class ChannelInfo:
+    """آخر بيانات معروفة للقناة الإجبارية الحالية"""
+
+    def __init__(self):
+        self.channel_id = None
+        self.title = None
+        self.username = None
+        self.invite_link = None
+        self.refreshed_at = 0.0
+        # آخر فشل في الجلب: (معرّف القناة، وقته)
+        self.failed_channel_id = None
+        self.failed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def link(self) -> str:
+        if self.username:
+            return f"https://t.me/{self.username}"
+        return self.invite_link or DEFAULT_LINK
+
+    @property
+    def display_title(self) -> str:
+        return self.title or DEFAULT_TITLE
+
+    def update_from_chat(self, chat):
+        self.channel_id = chat.id
+        self.title = chat.title
+        self.username = chat.username
+        self.invite_link = chat.invite_link
+        self.refreshed_at = time.monotonic()
+        self.failed_channel_id = None
+
+    def is_fresh(self, channel_id) -> bool:
+        return (
+            self.channel_id == channel_id
+            and time.monotonic() - self.refreshed_at < REFRESH_INTERVAL
+        )
+
+    def is_backing_off(self, channel_id) -> bool:
+        """فشل جلب هذه القناة مؤخراً: تُستخدم آخر قيمة معروفة حتى انتهاء المهلة"""
+        return (
+            self.failed_channel_id == channel_id
+            and time.monotonic() - self.failed_at < FAILURE_RETRY_INTERVAL
+        )
+
+    async def refresh(self, bot, channel_id, force: bool = False):
+        """جلب البيانات من Bot API (عند الفشل تبقى آخر قيمة معروفة ويؤجَّل الطلب التالي)"""
+        if channel_id is None:
+            return
+        async with self._lock:
+            # طلب آخر أنهى الجلب أو فشل فيه أثناء الانتظار على القفل
+            if not force and (self.is_fresh(channel_id) or self.is_backing_off(channel_id)):
+                return
+            try:
+                self.update_from_chat(await bot.get_chat(channel_id))
+            except Exception as e:
+                self.failed_channel_id = channel_id
+                self.failed_at = time.monotonic()
+                logger.error(f"Error refreshing required channel info (retry in {FAILURE_RETRY_INTERVAL}s): {e}")
+
+    async def resolve(self, bot, channel_id) -> "ChannelInfo":
+        """البيانات الحالية، مع جلبها فقط إذا تغيّرت القناة أو لم تُجلب بعد"""
+        if (
+            channel_id is not None
+            and self.channel_id != channel_id
+            and not self.is_backing_off(channel_id)
+        ):
+            await self.refresh(bot, channel_id)
+        return self
+
+
+CHANNEL_INFO = ChannelInfo()
+
+
+async def refresh_channel_info_job(context):
+    """مهمة الـ Job Queue: تحديث بيانات القناة كل REFRESH_INTERVAL (أو بعد مهلة الفشل)"""
+    channel_id = context.bot_data.get("required_channel_id")
+    if channel_id is not None and not CHANNEL_INFO.is_fresh(channel_id):
+        await CHANNEL_INFO.refresh(context.bot, channel_id)
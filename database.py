@@ -0,0 +1,585 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from collections import namedtuple
+
+import asyncpg
+
+from slow_updates import record_span
+
+# إعداد اللوج لمتابعة طبقة الوصول للبيانات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🗄 طبقة الوصول للبيانات (Data Access Layer)
+# كل استعلامات مسار المستخدم مسجلة هنا باسم ثابت ونص ثابت بمعاملات فقط،
+# فيحضّرها asyncpg مرة واحدة لكل اتصال (ذاكرة الاستعلامات المحضّرة) ويُقاس
+# عدد مرات تنفيذ كل استعلام وتوزيع زمنه في مكان واحد.
+#
+# مجمعان بإعدادات جلسة مختلفة حسب نوع العمل:
+#   - interactive: ردود المستخدمين (مهلة قصيرة، بدون JIT، ذاكرة فرز صغيرة)
+#   - background: التعبئة وإعادة البناء والإذاعة (مهلة طويلة، JIT، ذاكرة أكبر)
+# ==========================================================
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+WORKLOAD_SETTINGS = {
+    INTERACTIVE: {
+        "application_name": "library-bot-interactive",
+        "statement_timeout": os.getenv("DB_INTERACTIVE_TIMEOUT", "5s"),
+        "jit": "off",
+        "work_mem": "8MB",
+    },
+    BACKGROUND: {
+        "application_name": "library-bot-background",
+        "statement_timeout": os.getenv("DB_BACKGROUND_TIMEOUT", "10min"),
+        "jit": "on",
+        "work_mem": "64MB",
+    },
+}
+
+# حجم مجمع الخلفية (مجمع المستخدمين يُحدد من DB_POOL_MAX_SIZE في main)
+BACKGROUND_POOL_SIZE = int(os.getenv("DB_BACKGROUND_POOL_SIZE", "4"))
+
+# حدود فئات مدرّج الزمن بالثواني (نفس حدود Prometheus الافتراضية تقريباً)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Query = namedtuple("Query", ["sql", "workload"])
+
+
+def _q(sql: str, workload: str = INTERACTIVE) -> Query:
+    return Query(sql.strip(), workload)
+
+
+QUERIES = {
+    # 🧭 طبقات البحث (search_engine.py)
+    # تطابق تام ثم بادئة العنوان عبر فهرس text_pattern_ops
+    # (مقارنة نطاق بدل LIKE حتى تبقى صالحة للخطط العامة المحضّرة)
+    "search.exact": _q("""
+        (SELECT id, file_id, file_name FROM books
+         WHERE name_normalized = $1
+         LIMIT $3)
+        UNION ALL
+        (SELECT id, file_id, file_name FROM books
+         WHERE name_normalized ~>=~ $1 AND name_normalized ~<~ $2
+         ORDER BY name_normalized
+         LIMIT $3);
+    """),
+    # احتواء النص في أي موضع من العنوان عبر فهرس الـ trigram
+    "search.contains": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE name_normalized LIKE $1
+        LIMIT $2;
+    """),
+    # البحث النصي الكامل مع الترتيب حسب الصلة
+    "search.fts": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE to_tsvector('arabic', file_name) @@ to_tsquery('arabic', $1)
+        ORDER BY ts_rank_cd(to_tsvector('arabic', file_name), to_tsquery('arabic', $1)) DESC
+        LIMIT $2;
+    """),
+    # البحث التقريبي (الأغلى) ويعمل كملاذ أخير فقط
+    "search.fuzzy": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE name_normalized % $1
+        ORDER BY similarity(name_normalized, $1) DESC
+        LIMIT $2;
+    """),
+
+    # 📑 صفحات جلسات البحث والأقسام (search_session.py)
+    "session.page_by_ids": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE id = ANY($1::int[]);
+    """),
+    "session.regex_next": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE file_name ~* $1 AND id > $2
+        ORDER BY id
+        LIMIT $3;
+    """),
+    "session.regex_prev": _q("""
+        SELECT id, file_id, file_name FROM books
+        WHERE file_name ~* $1 AND id < $2
+        ORDER BY id DESC
+        LIMIT $3;
+    """),
+    "session.regex_count": _q("""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM books WHERE file_name ~* $1 LIMIT $2
+        ) AS capped;
+    """),
+    "session.category_next": _q("""
+        SELECT b.id, b.file_id, b.file_name
+        FROM book_categories c JOIN books b ON b.id = c.book_id
+        WHERE c.category_key = $1 AND c.book_id > $2
+        ORDER BY c.book_id
+        LIMIT $3;
+    """),
+    "session.category_prev": _q("""
+        SELECT b.id, b.file_id, b.file_name
+        FROM book_categories c JOIN books b ON b.id = c.book_id
+        WHERE c.category_key = $1 AND c.book_id < $2
+        ORDER BY c.book_id DESC
+        LIMIT $3;
+    """),
+
+    # 📚 الكتب
+    "books.by_id": _q("SELECT id, file_id, file_name FROM books WHERE id = $1;"),
+    "books.titles": _q("SELECT id, file_name FROM books WHERE id = ANY($1::int[]);"),
+    # الكتب المطابقة للحجم أولاً، ثم الكتب التي لم تُستخرج صفحاتها بعد، ثم البقية
+    "radar.pick": _q("""
+        SELECT b.id, b.file_id, b.file_name, b.page_count
+        FROM radar_candidates c JOIN books b ON b.id = c.book_id
+        WHERE c.pool_key = $1 AND c.slot = ANY($2::int[])
+        ORDER BY (b.page_count BETWEEN $3 AND $4) IS TRUE DESC,
+                 b.page_count IS NULL DESC,
+                 random()
+        LIMIT $5;
+    """),
+
+    # 🎟 الحصص (الدالة معرّفة في migrations/0002_search_quota.sql)
+    "quota.consume": _q("SELECT * FROM consume_search_quota($1, $2);"),
+
+    # 👥 المستخدمون
+    # يرجع صفاً فقط إذا كان المستخدم جديداً كلياً
+    "users.register": _q("""
+        INSERT INTO users (user_id) VALUES ($1)
+        ON CONFLICT DO NOTHING
+        RETURNING user_id;
+    """),
+    "users.add_credits": _q("""
+        UPDATE users SET search_credits = search_credits + $2
+        WHERE user_id = $1;
+    """),
+    # تسجيل تخطي الاشتراك الإجباري وزيادة عدّاد الـ 24 ساعة مرة واحدة لكل مستخدم يومياً
+    "users.mark_sub_verified": _q("""
+        WITH prev AS (
+            SELECT sub_verified_at FROM users WHERE user_id = $1 FOR UPDATE
+        ), touched AS (
+            UPDATE users SET sub_verified_at = NOW() WHERE user_id = $1
+        )
+        UPDATE bot_counters
+        SET current_value = current_value + 1
+        WHERE counter_name = 'sub_verified_24h'
+          AND NOT EXISTS (
+              SELECT 1 FROM prev WHERE sub_verified_at >= NOW() - INTERVAL '24 hours'
+          );
+    """),
+
+    # 🛠 الإدارة (admin_panel.py)
+    "admin.set_premium": _q("""
+        UPDATE users
+        SET is_premium = TRUE,
+            premium_expiry = NOW() + make_interval(days => $2)
+        WHERE user_id = $1;
+    """),
+    "admin.remove_premium": _q("""
+        UPDATE users
+        SET is_premium = FALSE, premium_expiry = NULL
+        WHERE user_id = $1;
+    """),
+    "admin.panel_counts": _q("""
+        SELECT
+            (SELECT COUNT(*) FROM books) AS books,
+            (SELECT COUNT(*) FROM users) AS users,
+            (SELECT COUNT(*) FROM users
+             WHERE is_premium = TRUE AND (premium_expiry IS NULL OR premium_expiry > NOW())) AS premium;
+    """, BACKGROUND),
+    # 🐢 أثقل أنماط التحديثات البطيئة (المعالج + النص المنقّح) خلال آخر $1 ساعة
+    "admin.slow_patterns": _q("""
+        SELECT handler, query_text, COUNT(*) AS hits,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY total_ms)::int AS p95_ms,
+               AVG(db_ms)::int AS db_ms, AVG(api_ms)::int AS api_ms, AVG(python_ms)::int AS python_ms
+        FROM slow_updates
+        WHERE occurred_at > NOW() - make_interval(hours => $1)
+        GROUP BY handler, query_text
+        ORDER BY SUM(total_ms) DESC
+        LIMIT $2;
+    """, BACKGROUND),
+    # الاستعلامات وطلبات Bot API الأكثر مساهمة في تلك التحديثات
+    "admin.slow_spans": _q("""
+        SELECT s.key AS span, COUNT(*) AS hits, SUM(s.value::int) AS total_ms
+        FROM slow_updates, jsonb_each_text(breakdown->'spans') AS s
+        WHERE occurred_at > NOW() - make_interval(hours => $1)
+        GROUP BY s.key
+        ORDER BY total_ms DESC
+        LIMIT $2;
+    """, BACKGROUND),
+    # العدّاد الحالي مع تصفيره تلقائياً إذا مرت 24 ساعة منذ آخر تصفير
+    "admin.sub_counter": _q("""
+        UPDATE bot_counters
+        SET current_value = CASE WHEN NOW() >= reset_at THEN 0 ELSE current_value END,
+            reset_at = CASE WHEN NOW() >= reset_at THEN NOW() + INTERVAL '24 hours' ELSE reset_at END
+        WHERE counter_name = 'sub_verified_24h'
+        RETURNING current_value;
+    """, BACKGROUND),
+    # قراءة العدّاد وتصفيره لليوم الجديد في أمر واحد (التقرير اليومي)
+    "admin.sub_counter_reset": _q("""
+        UPDATE bot_counters AS c
+        SET current_value = 0, reset_at = NOW() + INTERVAL '24 hours'
+        FROM (SELECT current_value FROM bot_counters WHERE counter_name = 'sub_verified_24h' FOR UPDATE) AS old
+        WHERE c.counter_name = 'sub_verified_24h'
+        RETURNING old.current_value;
+    """, BACKGROUND),
+
+    # 🔒 الحظر (ban_list.py): الحظر وفكّه من أوامر المشرف، والبقية عند الإقلاع
+    "bans.add": _q("INSERT INTO banned_users (user_id) VALUES ($1) ON CONFLICT DO NOTHING;"),
+    "bans.remove": _q("DELETE FROM banned_users WHERE user_id = $1;"),
+    "bans.all": _q("SELECT user_id FROM banned_users;", BACKGROUND),
+    "bans.add_many": _q("""
+        INSERT INTO banned_users (user_id)
+        SELECT unnest($1::bigint[])
+        ON CONFLICT DO NOTHING;
+    """, BACKGROUND),
+    "bans.legacy_user_data": _q("""
+        SELECT user_id, data FROM persistence_user_data
+        WHERE user_id > $1
+        ORDER BY user_id
+        LIMIT $2;
+    """, BACKGROUND),
+
+    # 📢 الإذاعة (broadcast_engine.py)
+    "broadcast.count_users": _q("SELECT COUNT(*) FROM users;", BACKGROUND),
+    "broadcast.recipients": _q("""
+        SELECT user_id FROM users
+        WHERE user_id > $1
+        ORDER BY user_id
+        LIMIT $2;
+    """, BACKGROUND),
+    "broadcast.create": _q("""
+        INSERT INTO broadcast_jobs (message, admin_chat_id, progress_message_id, total)
+        VALUES ($1, $2, $3, $4)
+        RETURNING *;
+    """, BACKGROUND),
+    "broadcast.checkpoint": _q("""
+        UPDATE broadcast_jobs
+        SET last_user_id = $2, sent = $3, failed = $4, status = $5,
+            delivered_ids = $6, updated_at = NOW()
+        WHERE id = $1;
+    """, BACKGROUND),
+    "broadcast.running": _q("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id;", BACKGROUND),
+
+    # 🧠 الاستعلامات الشائعة (search_cache.py)
+    "popular_queries.save": _q("""
+        INSERT INTO search_query_stats (query, hits, last_seen)
+        SELECT q, h, NOW() FROM unnest($1::text[], $2::bigint[]) AS v(q, h)
+        ON CONFLICT (query) DO UPDATE
+        SET hits = search_query_stats.hits + EXCLUDED.hits,
+            last_seen = NOW();
+    """, BACKGROUND),
+    "popular_queries.top": _q("""
+        SELECT query FROM search_query_stats
+        ORDER BY hits DESC
+        LIMIT $1;
+    """, BACKGROUND),
+
+    # 📚 المرور على كل الكتب بالترتيب (فهرس الاقتراحات وإعادة التصنيف)
+    "books.scan": _q("""
+        SELECT id, file_name FROM books
+        WHERE id > $1
+        ORDER BY id
+        LIMIT $2;
+    """, BACKGROUND),
+    # تعبئة الاسم المطبّع (main.py): كل الصفوف عند تغيّر نسخة التطبيع ($3) أو الفارغة فقط
+    "books.scan_unnormalized": _q("""
+        SELECT id, file_name FROM books
+        WHERE id > $1 AND ($3 OR name_normalized IS NULL)
+        ORDER BY id
+        LIMIT $2;
+    """, BACKGROUND),
+    "books.set_normalized": _q("""
+        UPDATE books AS b
+        SET name_normalized = v.name_normalized
+        FROM unnest($1::int[], $2::text[]) AS v(id, name_normalized)
+        WHERE b.id = v.id
+          AND b.name_normalized IS DISTINCT FROM v.name_normalized;
+    """, BACKGROUND),
+
+    # 📥 دمج دفعة الإدخال من الجدول المؤقت ingest_staging (ingest_queue.py)
+    # الصفوف غير المتغيرة لا تُعاد كتابتها ولا تُرجع (تُحسب كمكررة)
+    "ingest.merge": _q("""
+        INSERT INTO books (file_id, file_name, name_normalized)
+        SELECT file_id, file_name, name_normalized FROM ingest_staging
+        ON CONFLICT (file_id) DO UPDATE
+        SET file_name = EXCLUDED.file_name,
+            name_normalized = EXCLUDED.name_normalized
+        WHERE books.file_name IS DISTINCT FROM EXCLUDED.file_name
+        RETURNING id, file_name, name_normalized;
+    """, BACKGROUND),
+    # إعادة دمج دفعة قُطعت أو فشلت أثناء الدمج: قد تكون التزمت فعلاً، فتُرجع كل صفوفها
+    # (حتى غير المتغيرة) لتعمل خطافات ما بعد الإدخال عليها؛ الخطافات آمنة للتكرار
+    "ingest.merge_retry": _q("""
+        INSERT INTO books (file_id, file_name, name_normalized)
+        SELECT file_id, file_name, name_normalized FROM ingest_staging
+        ON CONFLICT (file_id) DO UPDATE
+        SET file_name = EXCLUDED.file_name,
+            name_normalized = EXCLUDED.name_normalized
+        RETURNING id, file_name, name_normalized;
+    """, BACKGROUND),
+
+    # 🗂 أقسام الكتب (book_categories.py)
+    "categories.remove_books": _q("""
+        DELETE FROM book_categories WHERE book_id = ANY($1::int[])
+        RETURNING category_key;
+    """, BACKGROUND),
+    "categories.add": _q("""
+        INSERT INTO book_categories (category_key, book_id)
+        SELECT * FROM unnest($1::text[], $2::int[])
+        ON CONFLICT DO NOTHING;
+    """, BACKGROUND),
+    "categories.counts": _q("""
+        SELECT category_key, COUNT(*) AS books
+        FROM book_categories
+        GROUP BY category_key;
+    """, BACKGROUND),
+
+    # 🚀 مخزون مرشحات الرادار (radar_pool.py)
+    # قفل المخزون حتى نهاية المعاملة: إلحاقان متزامنان بالمخزون نفسه يحسبان الخانة
+    # التالية نفسها، فيُرفض أحدهما بصمت على المفتاح الأساسي دون القفل
+    "radar.lock_pool": _q("SELECT pg_advisory_xact_lock(hashtext('radar_candidates:' || $1));", BACKGROUND),
+    # إلحاق دفعة كتب بمخزون واحد بخانات متتالية بعد آخر خانة (مع تجاهل الموجود منها)،
+    # والناتج حجم المخزون الجديد أو NULL إن لم يُضف شيء
+    "radar.append": _q("""
+        WITH inserted AS (
+            INSERT INTO radar_candidates (pool_key, slot, book_id)
+            SELECT $1, (base.next_slot + ROW_NUMBER() OVER (ORDER BY new.ord) - 1)::int, new.book_id
+            FROM (SELECT COALESCE(MAX(slot) + 1, 0) AS next_slot FROM radar_candidates WHERE pool_key = $1) base
+            CROSS JOIN unnest($2::int[]) WITH ORDINALITY AS new(book_id, ord)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM radar_candidates c WHERE c.pool_key = $1 AND c.book_id = new.book_id
+            )
+            RETURNING slot
+        )
+        SELECT MAX(slot) + 1 FROM inserted;
+    """, BACKGROUND),
+    # الإلحاقات تنتظر اكتمال إعادة البناء (القراءة مسموحة) فتحسب خاناتها من المخزون الجديد
+    "radar.lock_all": _q("LOCK TABLE radar_candidates IN EXCLUSIVE MODE;", BACKGROUND),
+    "radar.clear": _q("DELETE FROM radar_candidates;", BACKGROUND),
+    "radar.rebuild_pool": _q("""
+        INSERT INTO radar_candidates (pool_key, slot, book_id)
+        SELECT $1, (ROW_NUMBER() OVER (ORDER BY id) - 1)::int, id
+        FROM books
+        WHERE file_name ILIKE ANY($2::text[])
+          AND NOT (file_name ILIKE ANY($3::text[]));
+    """, BACKGROUND),
+    "radar.pool_sizes": _q("""
+        SELECT pool_key, MAX(slot) + 1 AS size
+        FROM radar_candidates
+        GROUP BY pool_key;
+    """, BACKGROUND),
+
+    # 🔥 الأكثر تحميلاً (trending.py)
+    "trending.add_rollups": _q("""
+        INSERT INTO download_rollups (book_id, hour, downloads)
+        SELECT * FROM unnest($1::int[], $2::timestamptz[], $3::int[])
+        ON CONFLICT (book_id, hour)
+        DO UPDATE SET downloads = download_rollups.downloads + EXCLUDED.downloads;
+    """, BACKGROUND),
+    "trending.top_books": _q("""
+        SELECT b.id, b.file_id, b.file_name, t.download_count
+        FROM (
+            SELECT book_id, SUM(downloads) AS download_count
+            FROM download_rollups
+            WHERE hour >= date_trunc('hour', NOW()) - $1::interval
+            GROUP BY book_id
+            HAVING SUM(downloads) >= $2
+            ORDER BY download_count DESC
+            LIMIT $3
+        ) t
+        JOIN books b ON b.id = t.book_id
+        ORDER BY t.download_count DESC;
+    """, BACKGROUND),
+    "trending.prune_rollups": _q("DELETE FROM download_rollups WHERE hour < NOW() - $1::interval;", BACKGROUND),
+
+    # 📥 أقسام download_stats اليومية (download_recorder.py)
+    "downloads.partitions": _q("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'download_stats'::regclass;
+    """, BACKGROUND),
+
+    # 📄 طابور استخراج بيانات PDF (pdf_metadata.py)
+    "pdf_metadata.enqueue": _q("""
+        INSERT INTO pdf_metadata_queue (book_id)
+        SELECT unnest($1::int[])
+        ON CONFLICT (book_id) DO UPDATE
+        SET status = 'pending', attempts = 0, last_error = NULL, updated_at = NOW();
+    """, BACKGROUND),
+    # حجز دفعة من الطابور (SKIP LOCKED يسمح بأكثر من نسخة للبوت دون تكرار العمل)
+    "pdf_metadata.claim": _q("""
+        UPDATE pdf_metadata_queue q
+        SET status = 'running', attempts = q.attempts + 1, updated_at = NOW()
+        FROM books b
+        WHERE b.id = q.book_id
+          AND q.book_id IN (
+              SELECT book_id FROM pdf_metadata_queue
+              WHERE status = 'pending'
+              ORDER BY enqueued_at
+              LIMIT $1
+              FOR UPDATE SKIP LOCKED
+          )
+        RETURNING q.book_id, q.attempts, b.file_id;
+    """, BACKGROUND),
+    "pdf_metadata.reclaim": _q("""
+        UPDATE pdf_metadata_queue
+        SET status = 'pending', updated_at = NOW()
+        WHERE status = 'running'
+          AND updated_at < NOW() - make_interval(secs => $1);
+    """, BACKGROUND),
+    "pdf_metadata.backfill": _q("""
+        WITH batch AS (
+            SELECT id FROM books
+            WHERE id > $1 AND page_count IS NULL
+            ORDER BY id
+            LIMIT $2
+        ), queued AS (
+            INSERT INTO pdf_metadata_queue (book_id)
+            SELECT id FROM batch
+            ON CONFLICT DO NOTHING
+        )
+        SELECT MAX(id) AS last_id, COUNT(*) AS books FROM batch;
+    """, BACKGROUND),
+    "pdf_metadata.save": _q("""
+        UPDATE books SET page_count = $2, pdf_title = $3, pdf_author = $4
+        WHERE id = $1;
+    """, BACKGROUND),
+    "pdf_metadata.done": _q("DELETE FROM pdf_metadata_queue WHERE book_id = $1;", BACKGROUND),
+    # إعادة المحاولة تذهب لآخر الطابور
+    "pdf_metadata.retry": _q("""
+        UPDATE pdf_metadata_queue
+        SET status = $2, last_error = $3, enqueued_at = NOW(), updated_at = NOW()
+        WHERE book_id = $1;
+    """, BACKGROUND),
+
+    # 🐢 سجل التحديثات البطيئة (slow_updates.py)
+    "slow_updates.prune": _q("""
+        DELETE FROM slow_updates WHERE occurred_at < NOW() - make_interval(days => $1);
+    """, BACKGROUND),
+}
+
+
+class QueryStats:
+    """عدد التنفيذات والأخطاء ومدرّج الزمن لاستعلام واحد"""
+
+    __slots__ = ("calls", "errors", "total_seconds", "max_seconds", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # الخانة الأخيرة لما يتجاوز أكبر حد (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float, failed: bool):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def percentile(self, p: float) -> float:
+        """تقدير النسبة المئوية من المدرّج (الحد الأعلى للفئة)"""
+        if not self.calls:
+            return 0.0
+        target = self.calls * p
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (self.max_seconds,), self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+class Database:
+    """مجمعا الاتصال حسب نوع العمل + تنفيذ الاستعلامات المسجلة مع القياس"""
+
+    def __init__(self, queries: dict = QUERIES):
+        self.queries = queries
+        self.pools = {}
+        self.stats = {name: QueryStats() for name in queries}
+        # زمن انتظار الحصول على اتصال لكل مجمع
+        self.acquire_stats = {INTERACTIVE: QueryStats(), BACKGROUND: QueryStats()}
+
+    async def connect(self, dsn: str, interactive_size: int, background_size: int = BACKGROUND_POOL_SIZE):
+        sizes = {INTERACTIVE: (2, interactive_size), BACKGROUND: (1, background_size)}
+        for workload, (min_size, max_size) in sizes.items():
+            self.pools[workload] = await asyncpg.create_pool(
+                dsn=dsn,
+                min_size=min_size,
+                max_size=max_size,
+                command_timeout=60,
+                # ذاكرة كافية لكل الاستعلامات المسجلة وما تبقى من استعلامات الوحدات
+                statement_cache_size=max(100, len(self.queries) * 2),
+                server_settings=WORKLOAD_SETTINGS[workload],
+            )
+        logger.info(f"✅ Database pools ready (interactive: {interactive_size}, background: {background_size}).")
+
+    def pool(self, workload: str = INTERACTIVE):
+        return self.pools.get(workload)
+
+    @asynccontextmanager
+    async def acquire(self, pool=None):
+        """اتصال من المجمع (التفاعلي افتراضياً) مع قياس زمن انتظاره"""
+        pool = pool or self.pools[INTERACTIVE]
+        workload = next((w for w, p in self.pools.items() if p is pool), INTERACTIVE)
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            waited = time.perf_counter() - started
+            self.acquire_stats[workload].observe(waited, False)
+            record_span("db", f"acquire.{workload}", waited)
+            yield conn
+
+    def pool_usage(self) -> dict:
+        """workload ← (المفتوحة، المستخدمة حالياً، الحد الأقصى)"""
+        return {
+            workload: (pool.get_size(), pool.get_size() - pool.get_idle_size(), pool.get_max_size())
+            for workload, pool in self.pools.items()
+        }
+
+    async def _run(self, method: str, name: str, args, conn=None):
+        query = self.queries[name]
+        if conn is None:
+            async with self.acquire(self.pools[query.workload]) as pooled:
+                return await self._run(method, name, args, pooled)
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await getattr(conn, method)(query.sql, *args)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats[name].observe(elapsed, failed)
+            record_span("db", name, elapsed)
+
+    async def fetch(self, name: str, *args, conn=None):
+        return await self._run("fetch", name, args, conn)
+
+    async def fetchrow(self, name: str, *args, conn=None):
+        return await self._run("fetchrow", name, args, conn)
+
+    async def fetchval(self, name: str, *args, conn=None):
+        return await self._run("fetchval", name, args, conn)
+
+    async def execute(self, name: str, *args, conn=None):
+        return await self._run("execute", name, args, conn)
+
+    def top_queries(self, limit: int = 10) -> list:
+        """أثقل الاستعلامات حسب الزمن الكلي: [(الاسم، QueryStats)]"""
+        used = [(name, s) for name, s in self.stats.items() if s.calls]
+        return sorted(used, key=lambda item: item[1].total_seconds, reverse=True)[:limit]
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
+        self.pools.clear()
+
+
+DB = Database()
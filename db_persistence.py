@@ -0,0 +1,313 @@
+import os
+import asyncio
+import pickle
+import logging
+from copy import deepcopy
+
+import asyncpg
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence
+
+from migrator import migrate
+
+# إعداد اللوج لمتابعة عمليات الحفظ والترحيل
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 💾 حفظ بيانات البوت في PostgreSQL بدل ملف bot_data.pickle الواحد
+# - بيانات كل مستخدم في صف مستقل، ولا يُكتب إلا ما تغيّر فعلاً (على دفعات)
+# - بيانات المستخدم تُحمّل عند أول تحديث يصل منه وليس عند الإقلاع
+# ==========================================================
+
+# مفاتيح bot_data التي تحمل كائنات وقت التشغيل ولا تُنسخ أو تُحفظ أبداً
+RUNTIME_BOT_DATA_KEYS = {"db_conn"}
+
+# مفاتيح قديمة ضخمة في user_data لا داعي لترحيلها (استُبدلت بجلسات البحث)
+LEGACY_USER_KEYS = {"search_results", "current_page", "block_until"}
+
+# مهلة تجميع بيانات المستخدمين المتغيرة قبل كتابتها دفعة واحدة
+FLUSH_DELAY = 2.0
+WRITE_BATCH = 1000
+
+UPSERT_USERS_SQL = """
+INSERT INTO persistence_user_data (user_id, data, updated_at)
+SELECT u, d, NOW() FROM unnest($1::bigint[], $2::bytea[]) AS v(u, d)
+ON CONFLICT (user_id) DO UPDATE
+SET data = EXCLUDED.data, updated_at = NOW();
+"""
+
+UPSERT_BOT_DATA_SQL = """
+INSERT INTO persistence_bot_data (key, data, updated_at)
+SELECT k, d, NOW() FROM unnest($1::text[], $2::bytea[]) AS v(k, d)
+ON CONFLICT (key) DO UPDATE
+SET data = EXCLUDED.data, updated_at = NOW();
+"""
+
+
+class BotData(dict):
+    """bot_data التي يمكنها حمل كائنات وقت التشغيل (مثل db_conn).
+    عند النسخ العميق الذي يجريه PTB قبل كل حفظ تُستبعد هذه المفاتيح."""
+
+    def __deepcopy__(self, memo):
+        return {
+            key: deepcopy(value, memo)
+            for key, value in self.items()
+            if key not in RUNTIME_BOT_DATA_KEYS
+        }
+
+
+def _dump(data) -> bytes:
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class PostgresPersistence(BasePersistence):
+    """Persistence تدريجي: كتابة المستخدمين المتغيرين فقط وتحميل كسول لكل مستخدم"""
+
+    def __init__(self, dsn: str, legacy_pickle_path: str = None, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.dsn = dsn
+        self.legacy_pickle_path = legacy_pickle_path
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self._loaded_users = set()
+        self._loading_users = {}
+        self._dirty_users = {}
+        self._user_hashes = {}
+        self._bot_data_hashes = {}
+        self._flush_task = None
+
+    # --------------------------------------------------
+    # الاتصال والترحيل
+    # --------------------------------------------------
+    async def _get_pool(self):
+        # الـ Persistence يُحمّل قبل post_init لذا يملك مجمّع اتصالات صغيراً خاصاً به،
+        # ويطبّق ترحيلات المخطط (ومنها جداوله) قبل أول قراءة: استعلام إصدار واحد في الإقلاع الدافئ
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(dsn=self.dsn, min_size=1, max_size=2, command_timeout=60)
+                await migrate(self._pool, self.dsn)
+                await self._migrate_legacy_pickle()
+        return self._pool
+
+    async def _migrate_legacy_pickle(self):
+        """ترحيل لمرة واحدة من ملف bot_data.pickle القديم"""
+        path = self.legacy_pickle_path
+        if not path or not os.path.exists(path):
+            return
+
+        async with self._pool.acquire() as conn:
+            done = await conn.fetchval("SELECT value FROM persistence_meta WHERE key = 'pickle_migrated'")
+        if done:
+            return
+
+        try:
+            legacy = PicklePersistence(filepath=path)
+            legacy.set_bot(self.bot)
+            user_data = await legacy.get_user_data()
+            bot_data = await legacy.get_bot_data()
+        except Exception:
+            logger.error("❌ Could not read legacy pickle persistence, skipping migration", exc_info=True)
+            return
+
+        user_rows = []
+        for user_id, data in user_data.items():
+            data = {k: v for k, v in data.items() if k not in LEGACY_USER_KEYS}
+            if data:
+                user_rows.append((user_id, _dump(data)))
+
+        for i in range(0, len(user_rows), WRITE_BATCH):
+            batch = user_rows[i:i + WRITE_BATCH]
+            async with self._pool.acquire() as conn:
+                await conn.execute(UPSERT_USERS_SQL, [u for u, _ in batch], [d for _, d in batch])
+
+        await self._write_bot_data(dict(bot_data))
+
+        async with self._pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO persistence_meta (key, value) VALUES ('pickle_migrated', NOW()::TEXT)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+            """)
+
+        os.replace(path, path + ".migrated")
+        logger.info(f"✅ Migrated legacy pickle persistence: {len(user_rows):,} users.")
+
+    # --------------------------------------------------
+    # bot_data
+    # --------------------------------------------------
+    async def get_bot_data(self) -> BotData:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("SELECT key, data FROM persistence_bot_data;")
+
+        bot_data = BotData()
+        for r in rows:
+            raw = bytes(r["data"])
+            try:
+                bot_data[r["key"]] = pickle.loads(raw)
+                self._bot_data_hashes[r["key"]] = hash(raw)
+            except Exception as e:
+                logger.error(f"Could not load bot_data key {r['key']}: {e}")
+        return bot_data
+
+    async def _write_bot_data(self, data: dict):
+        changed = {}
+        for key, value in data.items():
+            if key in RUNTIME_BOT_DATA_KEYS:
+                continue
+            try:
+                raw = _dump(value)
+            except Exception as e:
+                logger.debug(f"Skipping unpicklable bot_data key {key}: {e}")
+                continue
+            if self._bot_data_hashes.get(key) != hash(raw):
+                changed[key] = raw
+
+        removed = [key for key in self._bot_data_hashes if key not in data]
+        if not changed and not removed:
+            return
+
+        # أثناء الترحيل يكون المجمّع جاهزاً والقفل محجوزاً، فلا نطلبه مجدداً
+        pool = self._pool or await self._get_pool()
+        async with pool.acquire() as conn:
+            if changed:
+                await conn.execute(UPSERT_BOT_DATA_SQL, list(changed), list(changed.values()))
+            if removed:
+                await conn.execute("DELETE FROM persistence_bot_data WHERE key = ANY($1::text[]);", removed)
+
+        for key, raw in changed.items():
+            self._bot_data_hashes[key] = hash(raw)
+        for key in removed:
+            self._bot_data_hashes.pop(key, None)
+
+    async def update_bot_data(self, data) -> None:
+        await self._write_bot_data(data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # --------------------------------------------------
+    # user_data (تحميل كسول وكتابة تدريجية)
+    # --------------------------------------------------
+    async def get_user_data(self) -> dict:
+        # لا نحمّل أي مستخدم عند الإقلاع، فالتحميل يتم في refresh_user_data
+        await self._get_pool()
+        return {}
+
+    async def _load_user(self, user_id: int, user_data: dict):
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                raw = await conn.fetchval("SELECT data FROM persistence_user_data WHERE user_id = $1;", user_id)
+        except Exception as e:
+            # لا نعلّم المستخدم كمحمّل حتى لا تُكتب فوق بياناته نسخة ناقصة
+            logger.error(f"Error loading user_data for {user_id}: {e}")
+            return
+
+        if raw is not None:
+            raw = bytes(raw)
+            for key, value in pickle.loads(raw).items():
+                user_data.setdefault(key, value)
+            self._user_hashes[user_id] = hash(raw)
+
+        self._loaded_users.add(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+
+        # تحديثان متزامنان لنفس المستخدم ينتظران نفس عملية التحميل
+        task = self._loading_users.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_user(user_id, user_data))
+            self._loading_users[user_id] = task
+            task.add_done_callback(lambda _: self._loading_users.pop(user_id, None))
+        await task
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # مستخدم لم تُحمّل بياناته المخزنة بعد: الكتابة الآن قد تمحوها
+        if user_id not in self._loaded_users:
+            return
+        raw = _dump(data)
+        if self._user_hashes.get(user_id) == hash(raw):
+            return
+        self._dirty_users[user_id] = raw
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users.pop(user_id, None)
+        self._user_hashes.pop(user_id, None)
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM persistence_user_data WHERE user_id = $1;", user_id)
+
+    def _schedule_flush(self):
+        # PTB يستدعي update_user_data لكل مستخدم على حدة، فنجمعها في كتابة واحدة
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(FLUSH_DELAY)
+        await self._write_dirty_users()
+
+    async def _write_dirty_users(self):
+        dirty, self._dirty_users = self._dirty_users, {}
+        if not dirty:
+            return
+
+        items = list(dirty.items())
+        pool = await self._get_pool()
+        try:
+            for i in range(0, len(items), WRITE_BATCH):
+                batch = items[i:i + WRITE_BATCH]
+                async with pool.acquire() as conn:
+                    await conn.execute(UPSERT_USERS_SQL, [u for u, _ in batch], [d for _, d in batch])
+                for user_id, raw in batch:
+                    self._user_hashes[user_id] = hash(raw)
+        except Exception as e:
+            logger.error(f"Error writing user_data batch: {e}")
+            # إعادة ما لم يُكتب دون تجاوز نسخة أحدث وصلت في الأثناء
+            for user_id, raw in dirty.items():
+                if self._user_hashes.get(user_id) != hash(raw):
+                    self._dirty_users.setdefault(user_id, raw)
+
+    # --------------------------------------------------
+    # بيانات غير مستخدمة في هذا البوت
+    # --------------------------------------------------
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    # --------------------------------------------------
+    # الإغلاق
+    # --------------------------------------------------
+    async def flush(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        await self._write_dirty_users()
+
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
+
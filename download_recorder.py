@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from database import DB
+from trending import add_to_rollups
+
+# إعداد اللوج لمتابعة تسجيل التحميلات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📥 تسجيل التحميلات بالكتابة المؤجلة (Write-Behind)
+# الضغط على زر التحميل يضيف حدثاً إلى الذاكرة فقط، ثم تُكتب الأحداث
+# دفعة واحدة عبر COPY. الاحتفاظ بالبيانات يتم بحذف أقسام يومية كاملة
+# من جدول download_stats المقسّم بدلاً من DELETE على الصفوف.
+# ==========================================================
+
+FLUSH_INTERVAL = 10
+
+# سقف الأحداث المعلّقة في الذاكرة إذا تعطلت قاعدة البيانات طويلاً
+MAX_BUFFERED = 100_000
+
+# مدة الاحتفاظ بأحداث التحميل الخام (بالأيام)
+RETENTION_DAYS = 7
+
+# عدد الأقسام المستقبلية المنشأة مسبقاً
+PARTITIONS_AHEAD = 2
+
+# فحص الأقسام (إنشاء القادمة وحذف القديمة) مرة كل ساعة
+MAINTENANCE_INTERVAL = 3600
+
+DOWNLOAD_COLUMNS = ("book_id", "file_id", "downloaded_at")
+
+
+def _partition_name(day) -> str:
+    return f"download_stats_p{day:%Y%m%d}"
+
+
+def _utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+async def _create_partition(conn, day):
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {_partition_name(day)}
+        PARTITION OF download_stats
+        FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+    """)
+
+
+class DownloadRecorder:
+    """مخزن مؤقت لأحداث التحميل يُفرَّغ دورياً إلى download_stats"""
+
+    def __init__(self):
+        self._buffer = []
+        self._flush_lock = asyncio.Lock()
+        self._ready_days = set()
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, book_id: int, file_id: str):
+        """تسجيل تحميل في الذاكرة فقط (بدون أي طلب لقاعدة البيانات)"""
+        if len(self._buffer) >= MAX_BUFFERED:
+            self.dropped += 1
+            return
+        self._buffer.append((book_id, file_id, datetime.now(timezone.utc)))
+        self.recorded += 1
+
+    async def _ensure_partitions(self, conn, records):
+        missing = {r[2].date() for r in records} - self._ready_days
+        for day in sorted(missing):
+            await _create_partition(conn, day)
+            self._ready_days.add(day)
+
+    async def flush(self, pool):
+        """كتابة الأحداث المعلّقة دفعة واحدة عبر COPY"""
+        if not self._buffer or not pool:
+            return
+
+        async with self._flush_lock:
+            records, self._buffer = self._buffer, []
+            if not records:
+                return
+            try:
+                async with DB.acquire(pool) as conn:
+                    await self._ensure_partitions(conn, records)
+                    async with conn.transaction():
+                        await conn.copy_records_to_table(
+                            "download_stats", records=records, columns=DOWNLOAD_COLUMNS
+                        )
+                        # 🔥 تحديث العدّادات بالساعة لقوائم الأكثر تحميلاً في نفس المعاملة
+                        await add_to_rollups(conn, records)
+                self.flushed += len(records)
+            except asyncio.CancelledError:
+                # الإغلاق أثناء الكتابة: تبقى الأحداث للتفريغ النهائي في post_shutdown
+                self._buffer[:0] = records
+                raise
+            except Exception as e:
+                # إعادة الأحداث إلى المخزن لمحاولة لاحقة (مع احترام السقف)
+                self._buffer[:0] = records
+                overflow = len(self._buffer) - MAX_BUFFERED
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    self.dropped += overflow
+                logger.error(f"Error flushing download stats ({len(records)} events): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+
+DOWNLOAD_RECORDER = DownloadRecorder()
+
+
+async def maintain_download_partitions(pool):
+    """إنشاء أقسام الأيام القادمة وحذف الأقسام التي تجاوزت مدة الاحتفاظ"""
+    today = _utc_today()
+    oldest_kept = today - timedelta(days=RETENTION_DAYS)
+
+    async with DB.acquire(pool) as conn:
+        for offset in range(PARTITIONS_AHEAD + 1):
+            await _create_partition(conn, today + timedelta(days=offset))
+
+        partitions = await DB.fetch("downloads.partitions", conn=conn)
+
+        for r in partitions:
+            name = r["relname"]
+            try:
+                day = datetime.strptime(name[-8:], "%Y%m%d").date()
+            except ValueError:
+                continue
+            if day < oldest_kept:
+                # حذف قسم يوم كامل: عملية فورية بدون انتفاخ الجدول أو أقفال على الصفوف
+                await conn.execute(f"DROP TABLE IF EXISTS {name};")
+                DOWNLOAD_RECORDER._ready_days.discard(day)
+                logger.info(f"🧹 Dropped expired download partition {name}.")
+
+
+async def run_download_recorder(pool, recorder: DownloadRecorder = DOWNLOAD_RECORDER):
+    """حلقة الخلفية: تفريغ المخزن كل FLUSH_INTERVAL وصيانة الأقسام كل ساعة"""
+    last_maintenance = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await recorder.flush(pool)
+
+        if loop.time() - last_maintenance >= MAINTENANCE_INTERVAL:
+            try:
+                await maintain_download_partitions(pool)
+                last_maintenance = loop.time()
+            except Exception as e:
+                logger.error(f"Error maintaining download partitions: {e}")
@@ -2,6 +2,8 @@ import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
+from search_session import new_regex_session, new_category_session, save_session
+
 # Setup logging for the English Index Handler
 logger = logging.getLogger(__name__)
 
@@ -61,16 +63,22 @@ ENGLISH_INDEX_CATEGORIES = {
 
 async def show_english_index_menu(update, context: ContextTypes.DEFAULT_TYPE):
     """Displays the massive 50-category library index to the user in English"""
+    from book_categories import CATEGORY_COUNTS, category_key
+
+    def button(key):
+        # Per-section book counts come from the in-memory category counters (no query)
+        count = CATEGORY_COUNTS.get(category_key("en", key))
+        label = ENGLISH_INDEX_CATEGORIES[key]["name"] + (f" ({count:,})" if count else "")
+        return InlineKeyboardButton(label, callback_data=f"eng_idx:{key}")
+
     keyboard = []
     keys = list(ENGLISH_INDEX_CATEGORIES.keys())
     
     # Arrange buttons dynamically (2 buttons per row)
     for i in range(0, len(keys), 2):
-        row = [
-            InlineKeyboardButton(ENGLISH_INDEX_CATEGORIES[keys[i]]["name"], callback_data=f"eng_idx:{keys[i]}"),
-        ]
+        row = [button(keys[i])]
         if i + 1 < len(keys):
-            row.append(InlineKeyboardButton(ENGLISH_INDEX_CATEGORIES[keys[i+1]]["name"], callback_data=f"eng_idx:{keys[i+1]}"))
+            row.append(button(keys[i+1]))
         
         keyboard.append(row)
 
@@ -98,28 +106,25 @@ async def handle_english_index_selection(update, context: ContextTypes.DEFAULT_T
     if not category:
         return
 
+    from book_categories import CATEGORY_COUNTS, category_key, categories_ready
+
     pool = context.bot_data.get("db_conn")
-    # Generating the regex pattern for exact pattern matching
-    keywords_pattern = "|".join(category["keywords"])
-    
-    async with pool.acquire() as conn:
-        # Utilizing regex matching (~*) to match any of the English keywords in database file names
-        sql = """
-        SELECT file_id, file_name 
-        FROM books 
-        WHERE file_name ~* $1 
-        LIMIT 700;
-        """
-        rows = await conn.fetch(sql, f"({keywords_pattern})")
+    stage = f"🇬🇧 Index: {category['name']}"
+
+    if categories_ready(context.bot_data):
+        # Pre-classified section: keyset pagination over the book_categories index
+        key = category_key("en", category_id)
+        session = new_category_session(key, CATEGORY_COUNTS.get(key, 0), stage=stage)
+    else:
+        # Until classification finishes, fall back to the keyword regex with a keyset cursor
+        keywords_pattern = "|".join(category["keywords"])
+        session = await new_regex_session(pool, f"({keywords_pattern})", stage=stage)
 
-    if not rows:
+    if not session["total"]:
         await query.answer(f"⚠️ No books found under: {category['name']}", show_alert=True)
         return
 
-    # Store found records cleanly back into user data context
-    context.user_data["search_results"] = [dict(r) for r in rows]
-    context.user_data["current_page"] = 0
-    context.user_data["search_stage"] = f"🇬🇧 Index: {category['name']}"
+    save_session(context.user_data, session)
     
     # 🎯 تحديد هدف العودة الذكي: عند ضغط المستخدم على عودة من داخل نتائج (الروايات مثلاً) يعود لقائمة الفهارس الإنكليزية وليس للبداية
     context.user_data["back_target"] = "show_english_index"
@@ -2,6 +2,8 @@ import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
+from search_session import new_regex_session, new_category_session, save_session
+
 logger = logging.getLogger(__name__)
 
 # تعريف 50 قسماً دقيقاً وشاملاً للمكتبة
@@ -60,16 +62,22 @@ INDEX_CATEGORIES = {
 
 async def show_index_menu(update, context: ContextTypes.DEFAULT_TYPE):
     """عرض قائمة الفهارس الـ 50 للمستخدم"""
+    from book_categories import CATEGORY_COUNTS, category_key
+
+    def button(key):
+        # عدد كتب القسم من العدّادات المحفوظة في الذاكرة (بدون استعلام)
+        count = CATEGORY_COUNTS.get(category_key("ar", key))
+        label = INDEX_CATEGORIES[key]["name"] + (f" ({count:,})" if count else "")
+        return InlineKeyboardButton(label, callback_data=f"idx:{key}")
+
     keyboard = []
     keys = list(INDEX_CATEGORIES.keys())
     
     # توزيع الأزرار (زرين في كل صف)
     for i in range(0, len(keys), 2):
-        row = [
-            InlineKeyboardButton(INDEX_CATEGORIES[keys[i]]["name"], callback_data=f"idx:{keys[i]}"),
-        ]
+        row = [button(keys[i])]
         if i + 1 < len(keys):
-            row.append(InlineKeyboardButton(INDEX_CATEGORIES[keys[i+1]]["name"], callback_data=f"idx:{keys[i+1]}"))
+            row.append(button(keys[i+1]))
         
         keyboard.append(row)
 
@@ -94,25 +102,24 @@ async def handle_index_selection(update, context: ContextTypes.DEFAULT_TYPE):
     if not category:
         return
 
+    from book_categories import CATEGORY_COUNTS, category_key, categories_ready
+
     pool = context.bot_data.get("db_conn")
-    keywords_pattern = "|".join(category["keywords"])
-    
-    async with pool.acquire() as conn:
-        sql = """
-        SELECT file_id, file_name 
-        FROM books 
-        WHERE file_name ~* $1 
-        LIMIT 700;
-        """
-        rows = await conn.fetch(sql, f"({keywords_pattern})")
 
-    if not rows:
+    if categories_ready(context.bot_data):
+        # 🗂 القسم مصنّف مسبقاً: تصفح عبر فهرس book_categories
+        key = category_key("ar", category_id)
+        session = new_category_session(key, CATEGORY_COUNTS.get(key, 0), stage=category["name"])
+    else:
+        # 📑 قبل اكتمال التصنيف: جلسة keyset على نمط الكلمات المفتاحية
+        keywords_pattern = "|".join(category["keywords"])
+        session = await new_regex_session(pool, f"({keywords_pattern})", stage=category["name"])
+
+    if not session["total"]:
         await query.answer(f"⚠️ لا توجد كتب حالياً في قسم {category['name']}", show_alert=True)
         return
 
-    # حفظ النتائج
-    context.user_data["search_results"] = [dict(r) for r in rows]
-    context.user_data["current_page"] = 0
+    save_session(context.user_data, session)
     
     # استدعاء دالة العرض
     from search_handler import send_books_page
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+from database import DB
+from search_handler import normalize_query
+
+# إعداد اللوج لمتابعة استقبال الكتب من القنوات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📥 طابور إدخال الكتب من القنوات (Batched Ingest)
+# المنشورات تُجمع في طابور محدود، ثم تُكتب دفعة واحدة عبر COPY إلى جدول
+# مؤقت وتُدمج في books بأمر واحد، فلا يستهلك الرفع الجماعي أكثر من اتصال
+# واحد من اتصالات البحث. امتلاء الطابور يبطئ استقبال التحديثات (Backpressure).
+# ==========================================================
+
+INGEST_BATCH = 500
+INGEST_FLUSH_INTERVAL = 2.0
+INGEST_MAX_QUEUE = 5000
+INGEST_RETRIES = 2
+
+# جدول مؤقت لكل اتصال يُملأ عبر COPY ثم يُدمج في books ("ingest.merge" في database.py)
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_staging (
+    file_id TEXT,
+    file_name TEXT,
+    name_normalized TEXT
+) ON COMMIT DELETE ROWS;
+"""
+
+
+class IngestQueue:
+    """طابور محدود لمنشورات PDF يُفرَّغ على دفعات إلى جدول books"""
+
+    def __init__(self, max_size: int = INGEST_MAX_QUEUE):
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self.on_ingested = None
+        # الدفعة الجاري دمجها (تُعاد عند الإغلاق إذا قُطعت؛ الدمج آمن للتكرار)
+        self._pending = []
+        # صفوف دفعة التزمت ولم تكتمل خطافاتها بعد (تُكمل عند الإغلاق)
+        self._unhooked = []
+        self.ingested = 0
+        self.deduped = 0
+        self.failed = 0
+
+    async def put(self, file_id: str, file_name: str):
+        """إضافة كتاب للطابور (تنتظر إذا كان الطابور ممتلئاً)"""
+        await self._queue.put((file_id, file_name))
+
+    def _drain_batch(self) -> list:
+        batch = []
+        while len(batch) < INGEST_BATCH and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _merge(self, pool, batch: list, retry: bool = False):
+        # إزالة التكرار داخل الدفعة (آخر اسم للملف هو المعتمد)
+        unique = {}
+        for file_id, file_name in batch:
+            unique[file_id] = file_name
+        self.deduped += len(batch) - len(unique)
+
+        records = [(fid, name, normalize_query(name or "")) for fid, name in unique.items()]
+
+        for attempt in range(INGEST_RETRIES + 1):
+            try:
+                async with DB.acquire(pool) as conn:
+                    async with conn.transaction():
+                        await conn.execute(STAGING_SQL)
+                        await conn.copy_records_to_table(
+                            "ingest_staging", records=records,
+                            columns=("file_id", "file_name", "name_normalized")
+                        )
+                        merge = "ingest.merge_retry" if retry or attempt else "ingest.merge"
+                        rows = await DB.fetch(merge, conn=conn)
+                break
+            except Exception as e:
+                if attempt == INGEST_RETRIES:
+                    self.failed += len(records)
+                    self._pending = []
+                    logger.error(f"Ingest batch of {len(records)} books failed: {e}")
+                    return
+                await asyncio.sleep(1)
+
+        # الدفعة التزمت: من هنا تُكمل خطافاتها ولا يُعاد دمجها (بلا await بين السطرين)
+        self._unhooked = [(r["id"], r["file_name"], r["name_normalized"]) for r in rows]
+        self._pending = []
+        self.ingested += len(rows)
+        self.deduped += len(records) - len(rows)
+        await self._run_hooks(pool)
+
+    async def _run_hooks(self, pool):
+        """خطافات ما بعد الإدخال لصفوف الدفعة الملتزمة؛ تبقى معلّقة إذا قُطعت لتُكمل في flush"""
+        if self._unhooked and self.on_ingested:
+            try:
+                await self.on_ingested(pool, self._unhooked)
+            except Exception as e:
+                logger.error(f"Post-ingest hooks error: {e}")
+        self._unhooked = []
+
+    async def flush(self, pool):
+        """تفريغ كل ما في الطابور الآن (يُستخدم أيضاً عند الإغلاق)"""
+        # دفعة التزمت وقُطعت خطافاتها
+        await self._run_hooks(pool)
+        # دفعة قُطعت أثناء الدمج (ربما بعد الالتزام)
+        if self._pending:
+            await self._merge(pool, list(self._pending), retry=True)
+        while not self._queue.empty():
+            await self._merge(pool, self._drain_batch())
+
+    async def run(self, pool):
+        """حلقة الخلفية: انتظار أول عنصر، ثم تجميع دفعة لمدة قصيرة ودمجها"""
+        while True:
+            self._pending = [await self._queue.get()]
+            await asyncio.sleep(INGEST_FLUSH_INTERVAL if self._queue.qsize() < INGEST_BATCH else 0)
+            self._pending += self._drain_batch()
+            await self._merge(pool, self._pending)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() + len(self._pending),
+            "unhooked": len(self._unhooked),
+            "ingested": self.ingested,
+            "deduped": self.deduped,
+            "failed": self.failed,
+        }
+
+
+INGEST_QUEUE = IngestQueue()
@@ -1,16 +1,37 @@
 import os
 import re
-import asyncpg
+import asyncio
 import logging
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
     Application, MessageHandler, CommandHandler, CallbackQueryHandler,
-    ChatMemberHandler, PicklePersistence, ContextTypes, filters
+    ChatMemberHandler, TypeHandler, PicklePersistence, ContextTypes, filters
 )
 
+from db_persistence import PostgresPersistence, BotData
+
 # 🛠 تم تصحيح هذا السطر وإلغاء المتغير القديم المتسبب في الـ ImportError
 from admin_panel import register_admin_handlers  
-from search_handler import search_books, handle_callbacks
+from search_handler import (
+    search_books, handle_callbacks, normalize_query, warm_up_search_cache, NORMALIZATION_VERSION
+)
+from search_cache import on_books_ingested, save_popular_queries, run_popular_queries_persist
+from suggestion_index import SUGGESTION_INDEX, build_suggestion_index
+from subscription_cache import is_channel_member, on_chat_member_update
+from database import DB, BACKGROUND
+from migrator import migrate, MigrationError, StartupTimer
+from download_recorder import DOWNLOAD_RECORDER, run_download_recorder
+from trending import SNAPSHOT_REFRESH_INTERVAL, ROLLUP_PRUNE_INTERVAL, refresh_trending_job, prune_rollups_job
+from book_categories import classify_books, reclassify_books
+from radar_pool import add_books_to_radar, rebuild_radar_candidates
+from broadcast_engine import resume_broadcasts, stop_broadcasts
+from ban_list import load_banned_users, migrate_legacy_bans, enforce_ban
+from ingest_queue import INGEST_QUEUE
+from update_processor import UserOrderedUpdateProcessor
+from pdf_metadata import PDF_METADATA_WORKER
+from slow_updates import SLOW_UPDATE_LOG, run_slow_update_log
+from metrics import METRICS_SERVER, InstrumentedRequest, instrument_handlers, start_metrics
+from channel_info import CHANNEL_INFO, CHECK_INTERVAL, refresh_channel_info_job
 # استيراد دوال الرادار من الملف المستقل لضمان الربط الكامل
 from radar_handler import (
     start_radar_flow, process_radar_category, 
@@ -30,121 +51,160 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# مهام الخلفية طويلة الأمد (تُلغى عند الإغلاق بدلاً من انتظارها)
+BACKGROUND_TASKS = set()
+
+# حجم دفعة تعبئة العمود المطبّع للكتب القديمة
+NORMALIZE_BACKFILL_BATCH = 5000
+
+# حجم مجمع قاعدة البيانات، ومنه سقف التحديثات المعالجة بالتوازي (كل تحديث يحتاج اتصالاً على الأكثر)
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", str(DB_POOL_MAX_SIZE)))
+
+ALLOWED_UPDATES = ["message", "channel_post", "callback_query", "chat_member", "my_chat_member"]
+
+# مسار الـ Webhook على الخادم (يُلحق بـ WEBHOOK_URL عند التسجيل لدى تيليجرام)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram").strip("/")
+
 # ===============================================
 # إعداد قاعدة البيانات
 # ===============================================
 async def init_db(app_context: ContextTypes.DEFAULT_TYPE):
+    timer = StartupTimer()
+    # 📈 نقطة المقاييس (اختيارية) تعمل حتى لو تعذر الاتصال بقاعدة البيانات
+    await start_metrics(app_context)
     try:
         db_url = os.getenv("DATABASE_URL")
         if not db_url:
             logger.error("🚨 DATABASE_URL environment variable is missing.")
             return
 
-        pool = await asyncpg.create_pool(
-            dsn=db_url,
-            min_size=2,
-            max_size=10,
-            command_timeout=60
-        )
+        # مجمعان: تفاعلي لطلبات المستخدمين (مهلة قصيرة) وخلفي للمهام الثقيلة
+        await DB.connect(db_url, DB_POOL_MAX_SIZE)
+        pool = DB.pool()
+        background = DB.pool(BACKGROUND)
+        timer.mark("pool")
 
-        async with pool.acquire() as conn:
-            await conn.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
-            await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
-
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id SERIAL PRIMARY KEY,
-                file_id TEXT UNIQUE,
-                file_name TEXT,
-                name_normalized TEXT,
-                uploaded_at TIMESTAMP DEFAULT NOW()
-            );
-            """)
-
-            await conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_fts_books
-            ON books USING gin (to_tsvector('arabic', file_name));
-            """)
-
-            await conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_trgm_books
-            ON books USING gin (file_name gin_trgm_ops);
-            """)
-
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                joined_at TIMESTAMP DEFAULT NOW(),
-                is_premium BOOLEAN DEFAULT FALSE,
-                premium_expiry TIMESTAMP,
-                search_credits INT DEFAULT 0
-            );
-            """)
-
-            await conn.execute("""
-            ALTER TABLE users
-            ADD COLUMN IF NOT EXISTS is_premium BOOLEAN DEFAULT FALSE;
-            """)
-
-            await conn.execute("""
-            ALTER TABLE users
-            ADD COLUMN IF NOT EXISTS premium_expiry TIMESTAMP;
-            """)
-
-            await conn.execute("""
-            ALTER TABLE users
-            ADD COLUMN IF NOT EXISTS search_credits INT DEFAULT 0;
-            """)
-
-            # إضافة عمود لتسجيل وقت تفعيل وتخطي الاشتراك الإجباري لحساب إحصائيات الـ 24 ساعة
-            await conn.execute("""
-            ALTER TABLE users
-            ADD COLUMN IF NOT EXISTS sub_verified_at TIMESTAMP;
-            """)
-
-            # 📊 [إضافة الجدول والضبط التلقائي للعداد الرقمي المستقل]
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS bot_counters (
-                counter_name TEXT PRIMARY KEY,
-                current_value INT DEFAULT 0,
-                reset_at TIMESTAMP DEFAULT NOW() + INTERVAL '24 hours'
-            );
-            """)
-            
-            await conn.execute("""
-            INSERT INTO bot_counters (counter_name, current_value, reset_at)
-            VALUES ('sub_verified_24h', 0, NOW() + INTERVAL '24 hours')
-            ON CONFLICT DO NOTHING;
-            """)
-
-            # إضافة جدول إحصائيات التحميل الأسبوعي لحساب الأكثر تحميلاً (5 مرات فما فوق)
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS download_stats (
-                id SERIAL PRIMARY KEY,
-                file_id TEXT,
-                downloaded_at TIMESTAMP DEFAULT NOW()
-            );
-            """)
-
-            await conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_download_stats_date 
-            ON download_stats (downloaded_at);
-            """)
+        # 🧱 ترحيلات المخطط: إعادة التشغيل الدافئة تكلّف استعلام إصدار واحد فقط
+        version, applied = await migrate(pool, db_url)
+        timer.mark(f"schema v{version}" + (f" (+{len(applied)} applied)" if applied else ""))
+
+        # 🔒 تحميل قائمة المحظورين إلى الذاكرة
+        await load_banned_users(pool)
+        timer.mark("bans")
 
         app_context.bot_data["db_conn"] = pool
-        logger.info("✅ Database pool ready with premium, credits, sub_verified, counters and download stats columns.")
 
+        # 🧹 حذف خريطة file_* القديمة (أزرار التحميل أصبحت تحمل معرّف الكتاب مباشرة)
+        # ونسخة all_books القديمة (استُبدلت بالفهرس المقلوب للاقتراحات)
+        legacy_keys = [k for k in app_context.bot_data if str(k).startswith("file_") or k == "all_books"]
+        for key in legacy_keys:
+            del app_context.bot_data[key]
+        if legacy_keys:
+            logger.info(f"🧹 Purged {len(legacy_keys):,} legacy bot_data keys.")
+        logger.info("✅ Database pool ready.")
+
+        # 📥 بعد كل دفعة إدخال: تحديث الكاش والفهارس والأقسام ومخزون الرادار
+        INGEST_QUEUE.on_ingested = after_books_ingested
+
+        for coro in (
+            backfill_normalized_names(background, app_context.bot_data),
+            warm_up_search_cache(background),
+            build_suggestion_index(background),
+            run_download_recorder(background),
+            run_popular_queries_persist(background),
+            reclassify_books(background, app_context.bot_data),
+            rebuild_radar_candidates(background, app_context.bot_data),
+            resume_broadcasts(app_context, background),
+            migrate_legacy_bans(app_context, background),
+            INGEST_QUEUE.run(background),
+            PDF_METADATA_WORKER.run(app_context.bot, background, app_context.bot_data),
+            run_slow_update_log(background),
+        ):
+            task = asyncio.create_task(coro)
+            BACKGROUND_TASKS.add(task)
+            task.add_done_callback(BACKGROUND_TASKS.discard)
+        timer.mark("background tasks")
+        logger.info(timer.report())
+
+    except MigrationError:
+        # مخطط ناقص يعني بوتاً يعمل بنصف ميزاته: الإيقاف أوضح من الاستمرار بصمت
+        logger.critical("❌ Schema migration failed, refusing to start", exc_info=True)
+        raise
     except Exception:
         logger.error("❌ Database setup error", exc_info=True)
 
+# ===============================================
+# تعبئة name_normalized للكتب القديمة على دفعات
+# ===============================================
+async def backfill_normalized_names(pool, bot_data, batch_size: int = NORMALIZE_BACKFILL_BATCH):
+    """تعبئة الاسم المطبّع للصفوف القديمة على دفعات حسب المعرّف.
+    العملية قابلة للاستئناف لأنها لا تلمس إلا الصفوف التي ما زال عمودها فارغاً.
+    عند تغيّر NORMALIZATION_VERSION تُعاد كتابة كل الصفوف مع حفظ نقطة التقدم في bot_data."""
+    rewrite_all = bot_data.get("normalization_version") != NORMALIZATION_VERSION
+    # نقطة التقدم تخص نسخة التطبيع التي بدأتها: رفع النسخة أثناء إعادة الكتابة يبدأ من الصفر
+    if rewrite_all and bot_data.get("normalization_build_version") != NORMALIZATION_VERSION:
+        bot_data["normalization_build_version"] = NORMALIZATION_VERSION
+        bot_data["normalization_checkpoint"] = 0
+    last_id = bot_data.get("normalization_checkpoint", 0) if rewrite_all else 0
+    total = 0
+    try:
+        while True:
+            async with DB.acquire(pool) as conn:
+                rows = await DB.fetch("books.scan_unnormalized", last_id, batch_size, rewrite_all, conn=conn)
+
+                if not rows:
+                    break
+
+                await DB.execute(
+                    "books.set_normalized",
+                    [r["id"] for r in rows], [normalize_query(r["file_name"] or "") for r in rows],
+                    conn=conn
+                )
+
+            last_id = rows[-1]["id"]
+            total += len(rows)
+            if rewrite_all:
+                bot_data["normalization_checkpoint"] = last_id
+            # إفساح المجال لطلبات البحث بين الدفعات
+            await asyncio.sleep(0.1)
+
+        if rewrite_all:
+            bot_data["normalization_version"] = NORMALIZATION_VERSION
+            bot_data.pop("normalization_build_version", None)
+            bot_data.pop("normalization_checkpoint", None)
+        if total:
+            logger.info(f"✅ Normalized names backfill finished: {total:,} books checked.")
+    except asyncio.CancelledError:
+        logger.info(f"⏸ Normalized names backfill paused at id {last_id} ({total:,} books checked).")
+        raise
+    except Exception:
+        logger.error("❌ Normalized names backfill error", exc_info=True)
+
 # ===============================================
 # إغلاق قاعدة البيانات
 # ===============================================
 async def close_db(app: Application):
-    pool = app.bot_data.get("db_conn")
-
-    if pool:
-        await pool.close()
+    await METRICS_SERVER.stop()
+
+    for task in list(BACKGROUND_TASKS):
+        task.cancel()
+    if BACKGROUND_TASKS:
+        await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+
+    # 📢 الإذاعات الجارية تتوقف عند آخر نقطة حفظ وتُستأنف في الإقلاع القادم
+    await stop_broadcasts()
+
+    background = DB.pool(BACKGROUND)
+
+    if background:
+        # 📥 دمج الكتب المتبقية في طابور الإدخال
+        await INGEST_QUEUE.flush(background)
+        # 📥 كتابة أحداث التحميل المتبقية في الذاكرة قبل الإغلاق
+        await DOWNLOAD_RECORDER.flush(background)
+        await SLOW_UPDATE_LOG.flush(background)
+        await save_popular_queries(background)
+        await DB.close()
         logger.info("✅ Database pool closed.")
 
 # ===============================================
@@ -158,56 +218,45 @@ async def handle_pdf(update, context: ContextTypes.DEFAULT_TYPE):
         and update.channel_post.document.mime_type == "application/pdf"
     ):
 
-        pool = context.bot_data.get("db_conn")
-
-        if not pool:
-            return
-
         document = update.channel_post.document
 
-        async with pool.acquire() as conn:
-            await conn.execute("""
-            INSERT INTO books(file_id, file_name)
-            VALUES($1, $2)
-            ON CONFLICT (file_id) DO UPDATE
-            SET file_name = EXCLUDED.file_name;
-            """, document.file_id, document.file_name)
+        # 📥 الكتاب يدخل طابور الإدخال الجماعي (ينتظر هنا فقط إذا امتلأ الطابور)
+        await INGEST_QUEUE.put(document.file_id, document.file_name)
 
 # ===============================================
-# الاشتراك الإجباري الديناميكي والمستمر عبر الـ Persistence
+# تحديث الكاش والفهارس بعد إضافة كتب جديدة
 # ===============================================
-async def check_subscription(user_id: int, bot) -> bool:
-    try:
-        from __main__ import app
-        channel_id = app.bot_data.get("required_channel_id")
-    except:
-        channel_id = None
+async def after_books_ingested(pool, books):
+    """books: قائمة (id, file_name, name_normalized) للكتب المضافة أو المحدّثة"""
+    normalized = [(book_id, name_normalized) for book_id, _, name_normalized in books]
+    # 🧠 إبطال نتائج الكاش التي قد يظهر فيها الكتاب الجديد
+    await on_books_ingested(normalized)
+    # 🗂 إضافة كلمات العناوين الجديدة إلى فهرس الاقتراحات
+    SUGGESTION_INDEX.add_many(normalized)
+    # 🗂 تصنيف الكتب الجديدة في أقسام الفهرسين
+    await classify_books(pool, normalized)
+    # 🚀 إلحاق الكتب المطابقة لجذور الأطلس بمخزون الرادار
+    await add_books_to_radar(pool, [(book_id, file_name) for book_id, file_name, _ in books])
+    # 📄 استخراج عدد الصفحات والعنوان والمؤلف في الخلفية
+    await PDF_METADATA_WORKER.enqueue(pool, [book_id for book_id, _, _ in books])
 
+# ===============================================
+# الاشتراك الإجباري الديناميكي والمستمر عبر الـ Persistence
+# ===============================================
+async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE, force: bool = False) -> bool:
+    channel_id = context.bot_data.get("required_channel_id")
     if channel_id is None: 
         return True
-    try:
-        member = await bot.get_chat_member(channel_id, user_id)
-        return member.status in ("member", "administrator", "creator")
-    except:
-        return False
-
-async def get_channel_invite_link(bot) -> str:
-    try:
-        from __main__ import app
-        channel_id = app.bot_data.get("required_channel_id")
-    except:
-        channel_id = None
+    # 🔐 كاش العضوية: المشترك المؤكد لا يحتاج أي طلب لـ Bot API
+    return await is_channel_member(context.bot, channel_id, user_id, force=force)
 
+async def get_channel_invite_link(context: ContextTypes.DEFAULT_TYPE) -> str:
+    channel_id = context.bot_data.get("required_channel_id")
     if channel_id is None:
         return "https://t.me/"
-    try:
-        chat = await bot.get_chat(channel_id)
-        if chat.username:
-            return f"https://t.me/{chat.username}"
-        elif chat.invite_link:
-            return chat.invite_link
-    except: pass
-    return "https://t.me/"
+    # 📢 الرابط محفوظ مسبقاً ويُحدَّث في الخلفية عبر الـ Job Queue
+    channel = await CHANNEL_INFO.resolve(context.bot, channel_id)
+    return channel.link
 
 # ===============================================
 # تسجيل المستخدم ومعالجة الإحالة (تم إصلاحها بشكل شامل)
@@ -221,66 +270,52 @@ async def register_user(update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = update.effective_user.id
 
-    async with pool.acquire() as conn:
-
-        existing_user = await conn.fetchval(
-            "SELECT user_id FROM users WHERE user_id = $1",
-            user_id
-        )
-
-        # لا تمنح المكافأة إلا إذا كان المستخدم جديداً كلياً في النظام
-        if not existing_user:
-
-            await conn.execute(
-                "INSERT INTO users(user_id) VALUES($1) ON CONFLICT DO NOTHING",
-                user_id
-            )
-
-            # استخراج كود الإحالة الآمن عبر فحص دقيق للـ args أو النص الخام للرسالة
-            inviter_id = None
-            if context.args and context.args[0].startswith("inv_"):
+    # لا تمنح المكافأة إلا إذا كان المستخدم جديداً كلياً في النظام (الإدراج يرجع صفاً للجديد فقط)
+    is_new_user = await DB.fetchval("users.register", user_id)
+
+    if is_new_user:
+        # استخراج كود الإحالة الآمن عبر فحص دقيق للـ args أو النص الخام للرسالة
+        inviter_id = None
+        if context.args and context.args[0].startswith("inv_"):
+            try:
+                inviter_id = int(context.args[0].split("_")[1])
+            except: pass
+        elif update.message and update.message.text:
+            match = re.search(r'/start inv_(\d+)', update.message.text)
+            if match:
                 try:
-                    inviter_id = int(context.args[0].split("_")[1])
+                    inviter_id = int(match.group(1))
                 except: pass
-            elif update.message and update.message.text:
-                match = re.search(r'/start inv_(\d+)', update.message.text)
-                if match:
-                    try:
-                        inviter_id = int(match.group(1))
-                    except: pass
-
-            # إذا عثرنا على أيدي الشخص الداعي وهو لا يساوي أيدي المستخدم الجديد
-            if inviter_id and inviter_id != user_id:
+
+        # إذا عثرنا على أيدي الشخص الداعي وهو لا يساوي أيدي المستخدم الجديد
+        if inviter_id and inviter_id != user_id:
+            try:
+                # إضافة 10 محاولات للشخص صاحب الرابط (يستهلكها محرك الحصص بعد نفاد حده اليومي)
+                await DB.execute("users.add_credits", inviter_id, 10)
+
+                # إرسال إشعار فوري للشخص القديم يبلغه بنجاح الإضافة
                 try:
-                    # إضافة 10 محاولات في قاعدة البيانات للشخص صاحب الرابط
-                    await conn.execute("""
-                        UPDATE users
-                        SET search_credits = search_credits + 10
-                        WHERE user_id = $1
-                    """, inviter_id)
-
-                    # فك قفل الحظر المؤقت بأسلوب القاموس الآمن للحماية من خطأ الـ MappingProxy
-                    if context.application.user_data:
-                        user_data_dict = dict(context.application.user_data)
-                        if inviter_id in user_data_dict and "block_until" in context.application.user_data[inviter_id]:
-                            context.application.user_data[inviter_id]["block_until"] = None
-
-                    # إرسال إشعار فوري للشخص القديم يبلغه بنجاح الإضافة
-                    try:
-                        await context.bot.send_message(
-                            chat_id=inviter_id,
-                            text=(
-                                "🎉 **شكرًا لك! لقد انضم مستخدم جديد إلى البوت من خلال رابطك.**\n\n"
-                                "🎁 تم إضافة **10 محاولات بحث إضافية** إلى حسابك مجاناً!\n"
-                                "يمكنك الآن الاستمرار في تصفح وتحميل الكتب والروايات."
-                            ),
-                            parse_mode="Markdown"
-                        )
-                    except:
-                        pass
+                    await context.bot.send_message(
+                        chat_id=inviter_id,
+                        text=(
+                            "🎉 **شكرًا لك! لقد انضم مستخدم جديد إلى البوت من خلال رابطك.**\n\n"
+                            "🎁 تم إضافة **10 محاولات بحث إضافية** إلى حسابك مجاناً!\n"
+                            "يمكنك الآن الاستمرار في تصفح وتحميل الكتب والروايات."
+                        ),
+                        parse_mode="Markdown"
+                    )
+                except:
+                    pass
+
+            except Exception as e:
+                logger.error(f"Error processing referral inside DB update: {e}")
 
-                except Exception as e:
-                    logger.error(f"Error processing referral inside DB update: {e}")
+# ===============================================
+# تحديث كاش العضوية من تحديثات CHAT_MEMBER للقناة الإجبارية
+# ===============================================
+async def track_channel_membership(update, context: ContextTypes.DEFAULT_TYPE):
+    if update.chat_member:
+        on_chat_member_update(context.bot_data.get("required_channel_id"), update.chat_member)
 
 # ===============================================
 # الترحيب المضمون عند إضافة البوت للمجموعة
@@ -326,15 +361,6 @@ async def welcome_bot_in_group(update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_start_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
 
     query = update.callback_query
-    
-    # 🔒 فحص الحظر الفوري والآمن عند ضغط أي زر
-    u_id = query.from_user.id
-    if context.application.user_data:
-        user_data_dict = dict(context.application.user_data)
-        if u_id in user_data_dict and user_data_dict[u_id].get("is_banned"):
-            await query.answer("❌ أنت محظور من استخدام أزرار هذا البوت.", show_alert=True)
-            return
-
     await query.answer()
 
     if query.data == "show_index":
@@ -355,7 +381,7 @@ async def handle_start_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
         await handle_english_index_selection(update, context)
         return
 
-    elif query.data == "show_trending":
+    elif query.data == "show_trending" or query.data.startswith("trending:"):
         from search_handler import send_trending_books
         await send_trending_books(update, context)
         return
@@ -391,31 +417,15 @@ async def handle_start_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
 
     elif query.data == "back_to_main" or query.data == "check_subscription":
 
-        if await check_subscription(query.from_user.id, context.bot):
+        # زر "تحقق من الاشتراك" يتجاوز الكاش السلبي حتى يُقبل من انضم للتو
+        if await check_subscription(query.from_user.id, context, force=query.data == "check_subscription"):
             
             # 🔥 [تحديث كود زيادة العداد بمقدار +1 بشكل رقمي مباشر وصحيح عند تخطي الاشتراك بنجاح عبر الأزرار]
             pool = context.bot_data.get("db_conn")
             if pool:
                 try:
-                    async with pool.acquire() as conn:
-                        # جلب آخر وقت توثيق للتحقق مما إذا كان تم احتسابه اليوم بالفعل
-                        already_verified_today = await conn.fetchval("""
-                            SELECT (sub_verified_at IS NOT NULL AND sub_verified_at >= NOW() - INTERVAL '24 hours') 
-                            FROM users WHERE user_id = $1
-                        """, query.from_user.id)
-                        
-                        await conn.execute("""
-                            UPDATE users 
-                            SET sub_verified_at = NOW() 
-                            WHERE user_id = $1;
-                        """, query.from_user.id)
-                        
-                        if not already_verified_today:
-                            await conn.execute("""
-                                UPDATE bot_counters 
-                                SET current_value = current_value + 1 
-                                WHERE counter_name = 'sub_verified_24h';
-                            """)
+                    # تسجيل وقت التوثيق وزيادة العداد +1 إن لم يُحتسب المستخدم خلال آخر 24 ساعة (أمر واحد)
+                    await DB.execute("users.mark_sub_verified", query.from_user.id)
                 except Exception as e:
                     logger.error(f"Error adjusting counter inside main callbacks: {e}")
 
@@ -452,7 +462,7 @@ async def handle_start_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
             )
 
         else:
-            target_link = await get_channel_invite_link(context.bot)
+            target_link = await get_channel_invite_link(context)
             await query.message.reply_text(
                 text=f"❌ لم يتم العثور على اشتراكك في القناة المطلوبة.\n🔔 يرجى الانضمام هنا أولاً ثم إعادة المحاولة:\n{target_link}"
             )
@@ -480,18 +490,11 @@ async def handle_start_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
 # ===============================================
 async def start(update, context: ContextTypes.DEFAULT_TYPE):
 
-    # 🔒 منع المستخدم المحظور من تشغيل البوت عبر /start نهائياً
-    if update.effective_user and context.application.user_data:
-        u_id = update.effective_user.id
-        user_data_dict = dict(context.application.user_data)
-        if u_id in user_data_dict and user_data_dict[u_id].get("is_banned"):
-            return
-
     await register_user(update, context)
 
     # 1. إذا كان المستخدم غير مشترك في القناة الإلزامية، أظهر له رسالة القفل والتحقق
-    if not await check_subscription(update.effective_user.id, context.bot):
-        target_link = await get_channel_invite_link(context.bot)
+    if not await check_subscription(update.effective_user.id, context):
+        target_link = await get_channel_invite_link(context)
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("✅ اشترك في القناة", url=target_link)],
             [InlineKeyboardButton("🔍 تحقق من الاشتراك", callback_data="check_subscription")]
@@ -513,27 +516,8 @@ async def start(update, context: ContextTypes.DEFAULT_TYPE):
     pool = context.bot_data.get("db_conn")
     if pool and update.effective_user:
         try:
-            async with pool.acquire() as conn:
-                # التحقق مما إذا كان قد تم احتسابه وتوثيقه خلال آخر 24 ساعة لضمان عدم تكرار العدد
-                already_verified_today = await conn.fetchval("""
-                    SELECT (sub_verified_at IS NOT NULL AND sub_verified_at >= NOW() - INTERVAL '24 hours') 
-                    FROM users WHERE user_id = $1
-                """, update.effective_user.id)
-                
-                # تحديث وقت التوثيق الحالي للمستخدم
-                await conn.execute("""
-                    UPDATE users 
-                    SET sub_verified_at = NOW() 
-                    WHERE user_id = $1;
-                """, update.effective_user.id)
-                
-                # إذا لم يتم احتسابه اليوم، قم بزيادة العداد الرقمي +1 فوراُ
-                if not already_verified_today:
-                    await conn.execute("""
-                        UPDATE bot_counters 
-                        SET current_value = current_value + 1 
-                        WHERE counter_name = 'sub_verified_24h';
-                    """)
+            # تسجيل وقت التوثيق وزيادة العداد +1 إن لم يُحتسب المستخدم خلال آخر 24 ساعة (أمر واحد)
+            await DB.execute("users.mark_sub_verified", update.effective_user.id)
         except Exception as e:
             logger.error(f"Error adjusting counter inside start command: {e}")
 
@@ -574,16 +558,9 @@ async def start(update, context: ContextTypes.DEFAULT_TYPE):
 # ===============================================
 async def search_books_with_subscription(update, context: ContextTypes.DEFAULT_TYPE):
 
-    # 🔒 فحص الحظر ومنع البحث النصي تماماً
-    if update.effective_user and context.application.user_data:
-        u_id = update.effective_user.id
-        user_data_dict = dict(context.application.user_data)
-        if u_id in user_data_dict and user_data_dict[u_id].get("is_banned"):
-            return
-
     # 🚨 إذا كان المستخدم غير مشترك في القناة الإلزامية، أرسل له رسالة القفل والتحقق
-    if not await check_subscription(update.effective_user.id, context.bot):
-        target_link = await get_channel_invite_link(context.bot)
+    if not await check_subscription(update.effective_user.id, context):
+        target_link = await get_channel_invite_link(context)
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("✅ اشترك في القناة", url=target_link)],
             [InlineKeyboardButton("🔍 تحقق من الاشتراك", callback_data="check_subscription")]
@@ -616,15 +593,34 @@ def run_bot():
         return
 
     global app
-    app = (
+    builder = (
         Application.builder()
         .token(token)
         .post_init(init_db)
         .post_shutdown(close_db)
-        .persistence(PicklePersistence(filepath="bot_data.pickle"))
-        .build()
+        # ⚡ معالجة التحديثات بالتوازي بين المستخدمين، وبالترتيب داخل تحديثات كل مستخدم
+        .concurrent_updates(UserOrderedUpdateProcessor(UPDATE_CONCURRENCY))
     )
 
+    # 📈 قياس زمن طلبات Bot API ورموز حالتها (للمقاييس ولتفصيل التحديثات البطيئة)
+    builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+
+    # 💾 حفظ تدريجي في PostgreSQL (مع ترحيل لمرة واحدة من ملف الـ pickle القديم)
+    db_url = os.getenv("DATABASE_URL")
+    if db_url:
+        builder = (
+            builder
+            .persistence(PostgresPersistence(db_url, legacy_pickle_path="bot_data.pickle"))
+            .context_types(ContextTypes(bot_data=BotData))
+        )
+    else:
+        builder = builder.persistence(PicklePersistence(filepath="bot_data.pickle"))
+
+    app = builder.build()
+
+    # 🔒 فحص الحظر قبل كل المعالجات الأخرى (مجموعة بأولوية أعلى)
+    app.add_handler(TypeHandler(Update, enforce_ban), group=-1)
+
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("search", search_books_with_subscription))
 
@@ -640,14 +636,50 @@ def run_bot():
 
     app.add_handler(ChatMemberHandler(welcome_bot_in_group, ChatMemberHandler.MY_CHAT_MEMBER))
     app.add_handler(ChatMemberHandler(welcome_bot_in_group, ChatMemberHandler.CHAT_MEMBER))
+    # مجموعة منفصلة حتى لا يستهلك معالج الترحيب التحديث قبل تحديث كاش العضوية
+    app.add_handler(ChatMemberHandler(track_channel_membership, ChatMemberHandler.CHAT_MEMBER), group=1)
 
     app.add_handler(CallbackQueryHandler(handle_start_callbacks))
 
     register_admin_handlers(app, start)
 
-    logger.info("✅ Bot is running successfully...")
-    
-    app.run_polling(allowed_updates=["message", "channel_post", "callback_query", "chat_member", "my_chat_member"])
+    # 📈 قياس كل معالج (بعد تسجيل آخر معالج)
+    instrument_handlers(app)
+
+    # ⏳ المهام الدورية عبر الـ Job Queue (لا تتداخل نسخ المهمة الواحدة، وتتوقف مع التطبيق)
+    if app.job_queue is None:
+        raise RuntimeError("JobQueue is unavailable: install python-telegram-bot[job-queue] (see requirements.txt)")
+    periodic = {"max_instances": 1, "coalesce": True}
+    app.job_queue.run_repeating(
+        refresh_channel_info_job, interval=CHECK_INTERVAL, first=5, name="refresh_channel_info", job_kwargs=periodic
+    )
+    # 🔥 لقطات الأكثر تحميلاً فور الإقلاع ثم دورياً، وحذف الصفوف التجميعية القديمة
+    app.job_queue.run_repeating(
+        refresh_trending_job, interval=SNAPSHOT_REFRESH_INTERVAL, first=1, name="refresh_trending", job_kwargs=periodic
+    )
+    app.job_queue.run_repeating(
+        prune_rollups_job, interval=ROLLUP_PRUNE_INTERVAL, first=60, name="prune_rollups",
+        job_kwargs=periodic
+    )
+
+    logger.info(f"✅ Bot is running successfully (update concurrency: {UPDATE_CONCURRENCY})...")
+
+    # 🌐 وضع الـ Webhook عند تحديد WEBHOOK_URL، وإلا الاستطلاع المعتاد
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        # خادم المكتبة: يضع التحديثات في update_queue ويتحقق من الرمز السري، وعند الإيقاف
+        # يتوقف الاستقبال أولاً ثم تُعالج كل التحديثات المستلمة قبل إغلاق التطبيق
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", "8080")),
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{webhook_url.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=min(max(UPDATE_CONCURRENCY, 1), 100),
+        )
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     run_bot()
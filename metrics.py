@@ -0,0 +1,382 @@
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from http import HTTPStatus
+from functools import wraps
+
+from telegram.ext import ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+from slow_updates import record_handler, record_span
+
+# إعداد اللوج لمتابعة نقطة المقاييس
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📈 مقاييس بصيغة Prometheus
+# عدّادات ومدرّجات زمن في الذاكرة (بدون اعتماديات إضافية)، ونقطة HTTP
+# اختيارية (METRICS_PORT) تعرضها بصيغة النص التي يقرؤها Prometheus.
+# القيم الجاهزة في الوحدات الأخرى (قاعدة البيانات، الكاش، طابور الإدخال...)
+# تُقرأ عند كل سحب عبر "مُجمِّعات" بدل نسخها إلى عدّادات مكررة.
+# ==========================================================
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+# الاستماع محلياً افتراضياً: النقطة مخصصة لـ Prometheus على نفس الخادم
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PATH = "/metrics"
+METRICS_READ_TIMEOUT = 10
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def family(name: str, kind: str, help_text: str, rows, labelnames=()) -> list:
+    """أسطر مقياس بسيط (counter أو gauge): rows قائمة (قيم الوسوم، القيمة)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labelnames, values)} {_number(value)}" for values, value in rows]
+    return lines
+
+
+def histogram_lines(name: str, labelnames, values, bounds, counts, total: float, count: int) -> list:
+    """أسطر سلسلة مدرّج واحدة من فئات غير تراكمية (الأخيرة لما فوق أكبر حد)"""
+    lines = []
+    cumulative = 0
+    for bound, bucket in zip(tuple(bounds) + (None,), counts):
+        cumulative += bucket
+        le = "+Inf" if bound is None else repr(float(bound))
+        lines.append(f"{name}_bucket{_labels(tuple(labelnames) + ('le',), tuple(values) + (le,))} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labelnames, values)} {_number(total)}")
+    lines.append(f"{name}_count{_labels(labelnames, values)} {count}")
+    return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def lines(self) -> list:
+        return family(self.name, "counter", self.help_text, self.values.items(), self.labelnames)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # قيم الوسوم ← [الفئات، المجموع، العدد]
+        self.series = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self.series.get(labelvalues)
+        if series is None:
+            series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def lines(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in self.series.items():
+            lines += histogram_lines(self.name, self.labelnames, values, self.buckets, counts, total, count)
+        return lines
+
+
+class Registry:
+    """المقاييس المسجلة + المُجمِّعات التي تُستدعى عند كل سحب"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.lines()
+        for collect in self.collectors:
+            try:
+                lines += collect()
+            except Exception as e:
+                logger.error(f"Metrics collector {collect.__name__} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ----------------------------------------------------------
+# المقاييس المقاسة مباشرة في مسار التنفيذ
+# ----------------------------------------------------------
+HANDLER_UPDATES = REGISTRY.counter(
+    "bot_handler_updates_total", "Updates handled per handler callback and outcome.", ("handler", "outcome"))
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_duration_seconds", "Handler callback duration.", ("handler",))
+SEARCH_SECONDS = REGISTRY.histogram(
+    "bot_search_duration_seconds", "Tiered search duration by the tier of the first result.", ("result_tier",))
+SEARCH_TIER_SECONDS = REGISTRY.histogram(
+    "bot_search_tier_duration_seconds", "Duration of each executed search tier.", ("tier",))
+TELEGRAM_API_SECONDS = REGISTRY.histogram(
+    "telegram_api_duration_seconds", "Bot API request duration.", ("method",))
+TELEGRAM_API_RESPONSES = REGISTRY.counter(
+    "telegram_api_responses_total", "Bot API responses by HTTP status (429 = flood control).", ("method", "code"))
+
+
+# ==========================================================
+# 🧩 قياس المعالجات وطلبات Bot API
+# ==========================================================
+
+def _timed_callback(callback):
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # إيقاف مقصود لبقية المعالجات (مثل فحص الحظر)
+            outcome = "stopped"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_SECONDS.observe(elapsed, name)
+            HANDLER_UPDATES.inc(name, outcome)
+            record_handler(name, elapsed)
+
+    return wrapper
+
+
+def instrument_handlers(application):
+    """تغليف دوال كل المعالجات المسجلة (يُستدعى بعد إضافة آخر معالج)"""
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = _timed_callback(handler.callback)
+            count += 1
+    logger.info(f"📈 Instrumented {count} handlers.")
+
+
+def _api_method(url: str) -> str:
+    # روابط تنزيل الملفات تحمل مسار الملف: وسم ثابت بدل قيمة لكل ملف
+    if "/file/bot" in url:
+        return "file_download"
+    return url.rsplit("/", 1)[-1]
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest يقيس زمن كل طلب ورمز حالته (ومنها 429 عند تجاوز المعدل)"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = _api_method(url)
+        started = time.perf_counter()
+        code = "error"
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            return code, payload
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_API_SECONDS.observe(elapsed, api_method)
+            TELEGRAM_API_RESPONSES.inc(api_method, str(code))
+            record_span("api", api_method, elapsed)
+
+
+# ==========================================================
+# 📦 المُجمِّعات: قراءة إحصائيات الوحدات عند السحب
+# ==========================================================
+
+def install_collectors(application):
+    # استيراد متأخر: هذه الوحدات تستورد metrics بدورها أو تعتمد على main
+    from database import DB, LATENCY_BUCKETS
+    from search_cache import RESULT_CACHE, BOOK_ROW_CACHE
+    from subscription_cache import MEMBERSHIP_CACHE
+    from suggestion_index import SUGGESTION_INDEX
+    from ingest_queue import INGEST_QUEUE
+    from download_recorder import DOWNLOAD_RECORDER
+    from pdf_metadata import PDF_METADATA_WORKER
+    from slow_updates import SLOW_UPDATE_LOG
+
+    @REGISTRY.collector
+    def database_metrics():
+        lines = ["# HELP db_query_duration_seconds Registered query duration.",
+                 "# TYPE db_query_duration_seconds histogram"]
+        for name, s in DB.stats.items():
+            if s.calls:
+                lines += histogram_lines("db_query_duration_seconds", ("query",), (name,),
+                                         LATENCY_BUCKETS, s.buckets, s.total_seconds, s.calls)
+        lines += family("db_query_errors_total", "counter", "Registered query failures.",
+                        [((name,), s.errors) for name, s in DB.stats.items() if s.calls], ("query",))
+
+        lines += ["# HELP db_pool_acquire_seconds Time spent waiting for a pooled connection.",
+                  "# TYPE db_pool_acquire_seconds histogram"]
+        for workload, s in DB.acquire_stats.items():
+            lines += histogram_lines("db_pool_acquire_seconds", ("pool",), (workload,),
+                                     LATENCY_BUCKETS, s.buckets, s.total_seconds, s.calls)
+
+        usage = DB.pool_usage()
+        rows = []
+        for workload, (size, in_use, _) in usage.items():
+            rows += [((workload, "in_use"), in_use), ((workload, "idle"), size - in_use)]
+        lines += family("db_pool_connections", "gauge", "Open pool connections by state.", rows, ("pool", "state"))
+        lines += family("db_pool_max_connections", "gauge", "Pool size limit.",
+                        [((workload,), limit) for workload, (_, _, limit) in usage.items()], ("pool",))
+        return lines
+
+    @REGISTRY.collector
+    def update_processor_metrics():
+        processor = application.update_processor
+        if not hasattr(processor, "stats"):
+            return []
+        s = processor.stats()
+        return (
+            family("bot_updates_running", "gauge", "Updates currently executing.", [((), s["running"])])
+            + family("bot_updates_pending", "gauge", "Updates waiting in per-user lanes.", [((), s["pending"])])
+            + family("bot_updates_active_users", "gauge", "Users with queued or running updates.", [((), s["active_users"])])
+            + family("bot_updates_processed_total", "counter", "Updates processed.", [((), s["processed"])])
+            + family("bot_updates_dropped_total", "counter", "Updates dropped by the per-user cap.", [((), s["dropped"])])
+            + family("bot_update_wait_seconds", "gauge", "Recent lane wait before execution.",
+                     [(("0.5",), s["wait_p50"]), (("0.95",), s["wait_p95"])], ("quantile",))
+        )
+
+    @REGISTRY.collector
+    def cache_metrics():
+        caches = {
+            "search_results": RESULT_CACHE.stats(),
+            "book_rows": BOOK_ROW_CACHE.stats(),
+            "membership": MEMBERSHIP_CACHE.stats(),
+        }
+        return (
+            family("bot_cache_hits_total", "counter", "Cache hits.",
+                   [((name,), s["hits"]) for name, s in caches.items()], ("cache",))
+            + family("bot_cache_misses_total", "counter", "Cache misses.",
+                     [((name,), s["misses"]) for name, s in caches.items()], ("cache",))
+            + family("bot_cache_entries", "gauge", "Cached entries.",
+                     [((name,), s["entries"]) for name, s in caches.items()], ("cache",))
+        )
+
+    @REGISTRY.collector
+    def background_metrics():
+        components = {
+            "ingest": INGEST_QUEUE.stats(),
+            "downloads": DOWNLOAD_RECORDER.stats(),
+            "pdf_metadata": PDF_METADATA_WORKER.stats(),
+            "suggestion_index": SUGGESTION_INDEX.stats(),
+            "slow_updates": SLOW_UPDATE_LOG.stats(),
+        }
+        rows = [((component, stat), value)
+                for component, stats in components.items()
+                for stat, value in stats.items()
+                if isinstance(value, (int, float))]
+        return family("bot_component_stat", "gauge", "Background component counters and queue depths.",
+                      rows, ("component", "stat"))
+
+
+# ==========================================================
+# 🌐 نقطة /metrics
+# ==========================================================
+
+class MetricsServer:
+    """خادم HTTP صغير يرد على GET /metrics فقط (اتصال واحد لكل سحب)"""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.registry = registry
+        self._server = None
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self, host: str = METRICS_HOST, port: int = 9100):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"📈 Metrics endpoint on http://{host}:{self.port}{METRICS_PATH}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), METRICS_READ_TIMEOUT)
+            method, target, _ = head.decode("latin-1").split("\r\n", 1)[0].split(" ", 2)
+
+            body = b""
+            content_type = "text/plain"
+            if target.split("?", 1)[0] != METRICS_PATH:
+                status = 404
+            elif method != "GET":
+                status = 405
+            else:
+                status = 200
+                body = self.registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+            writer.write(
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        except Exception as e:
+            logger.error(f"Metrics connection error: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+METRICS_SERVER = MetricsServer()
+
+
+async def start_metrics(application):
+    """تشغيل نقطة المقاييس إن حُدد METRICS_PORT (من post_init)"""
+    if not METRICS_PORT:
+        return
+    try:
+        install_collectors(application)
+        await METRICS_SERVER.start(port=int(METRICS_PORT))
+    except Exception:
+        logger.error("❌ Metrics endpoint failed to start", exc_info=True)
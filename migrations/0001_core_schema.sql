@@ -0,0 +1,66 @@
+-- الجداول الأساسية: الكتب والمستخدمون والعدّادات
+-- تطابق ما كان يُنفَّذ في init_db عند كل إقلاع، وآمنة على قاعدة قائمة (IF NOT EXISTS)
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS books (
+    id SERIAL PRIMARY KEY,
+    file_id TEXT UNIQUE,
+    file_name TEXT,
+    name_normalized TEXT,
+    uploaded_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGINT PRIMARY KEY,
+    joined_at TIMESTAMP DEFAULT NOW(),
+    is_premium BOOLEAN DEFAULT FALSE,
+    premium_expiry TIMESTAMP,
+    search_credits INT DEFAULT 0
+);
+
+-- أعمدة أُضيفت لاحقاً على قواعد أقدم
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_premium BOOLEAN DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS premium_expiry TIMESTAMP;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS search_credits INT DEFAULT 0;
+-- وقت تخطي الاشتراك الإجباري لحساب إحصائيات الـ 24 ساعة
+ALTER TABLE users ADD COLUMN IF NOT EXISTS sub_verified_at TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS bot_counters (
+    counter_name TEXT PRIMARY KEY,
+    current_value INT DEFAULT 0,
+    reset_at TIMESTAMP DEFAULT NOW() + INTERVAL '24 hours'
+);
+
+INSERT INTO bot_counters (counter_name, current_value, reset_at)
+VALUES ('sub_verified_24h', 0, NOW() + INTERVAL '24 hours')
+ON CONFLICT DO NOTHING;
+
+-- عدّادات الاستعلامات الشائعة لتسخين كاش البحث عند الإقلاع
+CREATE TABLE IF NOT EXISTS search_query_stats (
+    query TEXT PRIMARY KEY,
+    hits BIGINT DEFAULT 0,
+    last_seen TIMESTAMP DEFAULT NOW()
+);
+
+-- migrate:concurrently
+-- فهارس books تُبنى دون قفل الكتابة على الجدول
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fts_books
+ON books USING gin (to_tsvector('arabic', file_name));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_books
+ON books USING gin (file_name gin_trgm_ops);
+
+-- trigram على الاسم المطبّع (يخدم LIKE '%...%' و % معاً)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_books_normalized
+ON books USING gin (name_normalized gin_trgm_ops);
+
+-- التطابق التام وبادئة العنوان (طبقة البحث الأولى)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_name_prefix
+ON books (name_normalized text_pattern_ops);
+
+-- فهرس جزئي صغير يجعل استئناف تعبئة الاسم المطبّع فورياً
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_unnormalized
+ON books (id) WHERE name_normalized IS NULL;
@@ -0,0 +1,65 @@
+-- سجلات البحث اليومية ودالة الحصص consume_search_quota
+-- فحص واستهلاك حصة البحث في طلب واحد (انظر limit_handler.py)
+
+CREATE TABLE IF NOT EXISTS search_logs (
+    user_id BIGINT,
+    search_date DATE,
+    count INTEGER DEFAULT 0,
+    PRIMARY KEY (user_id, search_date)
+);
+
+CREATE OR REPLACE FUNCTION consume_search_quota(p_user_id BIGINT, p_daily_limit INT)
+RETURNS TABLE (
+    allowed BOOLEAN,
+    source TEXT,
+    remaining_daily INT,
+    credits INT,
+    reset_in_seconds INT
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_premium BOOLEAN;
+    v_expiry TIMESTAMP;
+    v_count INT;
+    v_credits INT;
+    v_reset INT := CEIL(EXTRACT(EPOCH FROM (CURRENT_DATE + 1) - LOCALTIMESTAMP))::INT;
+BEGIN
+    SELECT u.is_premium, u.premium_expiry, u.search_credits
+    INTO v_premium, v_expiry, v_credits
+    FROM users u WHERE u.user_id = p_user_id;
+
+    -- 1. العضوية المميزة السارية (مع إنهاء المنتهية تلقائياً)
+    IF v_premium THEN
+        IF v_expiry IS NULL OR v_expiry > NOW() THEN
+            RETURN QUERY SELECT TRUE, 'premium'::TEXT, NULL::INT, v_credits, 0;
+            RETURN;
+        END IF;
+        UPDATE users SET is_premium = FALSE WHERE user_id = p_user_id;
+    END IF;
+
+    -- 2. الحد اليومي المجاني: الزيادة تتم فقط إذا لم يُستنفد الحد
+    INSERT INTO search_logs AS l (user_id, search_date, count)
+    VALUES (p_user_id, CURRENT_DATE, 1)
+    ON CONFLICT (user_id, search_date)
+    DO UPDATE SET count = l.count + 1
+    WHERE l.count < p_daily_limit
+    RETURNING l.count INTO v_count;
+
+    IF FOUND THEN
+        RETURN QUERY SELECT TRUE, 'daily'::TEXT, p_daily_limit - v_count, v_credits, v_reset;
+        RETURN;
+    END IF;
+
+    -- 3. رصيد الإحالات يُستهلك بعد نفاد الحد اليومي
+    UPDATE users SET search_credits = search_credits - 1
+    WHERE user_id = p_user_id AND search_credits > 0
+    RETURNING search_credits INTO v_credits;
+
+    IF FOUND THEN
+        RETURN QUERY SELECT TRUE, 'credits'::TEXT, 0, v_credits, v_reset;
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT FALSE, 'exhausted'::TEXT, 0, COALESCE(v_credits, 0), v_reset;
+END;
+$$;
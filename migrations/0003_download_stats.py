@@ -0,0 +1,53 @@
+import logging
+from datetime import timedelta
+
+from download_recorder import RETENTION_DAYS, PARTITIONS_AHEAD, _create_partition, _utc_today
+
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📥 جدول أحداث التحميل المقسّم إلى أقسام يومية (download_stats)
+# مع ترحيل الجدول القديم غير المقسّم لمرة واحدة (أحداث الأسبوع الأخير فقط)
+# ==========================================================
+
+PARTITIONED_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS download_stats (
+    book_id INT,
+    file_id TEXT,
+    downloaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (downloaded_at);
+"""
+
+
+async def up(conn):
+    relkind = await conn.fetchval("""
+        SELECT c.relkind FROM pg_class c
+        WHERE c.oid = to_regclass('download_stats');
+    """)
+
+    if relkind == "r":
+        await conn.execute("ALTER TABLE download_stats RENAME TO download_stats_legacy;")
+        await conn.execute("ALTER INDEX IF EXISTS idx_download_stats_date RENAME TO idx_download_stats_legacy_date;")
+
+    await conn.execute(PARTITIONED_TABLE_SQL)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_download_stats_book
+        ON download_stats (book_id, downloaded_at);
+    """)
+
+    today = _utc_today()
+    for offset in range(-RETENTION_DAYS, PARTITIONS_AHEAD + 1):
+        await _create_partition(conn, today + timedelta(days=offset))
+
+    if relkind == "r":
+        moved = await conn.execute(f"""
+            INSERT INTO download_stats (book_id, file_id, downloaded_at)
+            SELECT b.id, s.file_id, s.downloaded_at
+            FROM download_stats_legacy s
+            LEFT JOIN LATERAL (
+                SELECT id FROM books WHERE file_id = s.file_id LIMIT 1
+            ) b ON TRUE
+            WHERE s.downloaded_at >= '{today - timedelta(days=RETENTION_DAYS)}'::date;
+        """)
+        await conn.execute("DROP TABLE download_stats_legacy;")
+        logger.info(f"✅ download_stats migrated to daily partitions ({moved}).")
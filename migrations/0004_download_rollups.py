@@ -0,0 +1,29 @@
+# ==========================================================
+# 🔥 العدّادات بالساعة لقوائم الأكثر تحميلاً (download_rollups)
+# تُعبّأ من الأحداث الخام الموجودة عند إنشائها لأول مرة
+# ==========================================================
+
+ROLLUPS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS download_rollups (
+    book_id INT NOT NULL,
+    hour TIMESTAMPTZ NOT NULL,
+    downloads INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (book_id, hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_download_rollups_hour ON download_rollups (hour);
+"""
+
+
+async def up(conn):
+    await conn.execute(ROLLUPS_SCHEMA_SQL)
+
+    if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM download_rollups);"):
+        await conn.execute("""
+            INSERT INTO download_rollups (book_id, hour, downloads)
+            SELECT book_id, date_trunc('hour', downloaded_at), COUNT(*)
+            FROM download_stats
+            WHERE book_id IS NOT NULL
+            GROUP BY 1, 2
+            ON CONFLICT DO NOTHING;
+        """)
@@ -0,0 +1,10 @@
+-- تصنيف الكتب مسبقاً إلى أقسام الفهرسين
+-- يُملأ ويُعاد بناؤه من book_categories.py عند تغيّر الكلمات المفتاحية
+
+CREATE TABLE IF NOT EXISTS book_categories (
+    category_key TEXT NOT NULL,
+    book_id INT NOT NULL,
+    PRIMARY KEY (category_key, book_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_book_categories_book ON book_categories (book_id);
@@ -0,0 +1,10 @@
+-- مخزون مرشحات الرادار
+-- يُعاد بناؤه من radar_pool.py عند تغيّر الأطلس
+
+CREATE TABLE IF NOT EXISTS radar_candidates (
+    pool_key TEXT NOT NULL,
+    slot INT NOT NULL,
+    book_id INT NOT NULL,
+    PRIMARY KEY (pool_key, slot),
+    UNIQUE (pool_key, book_id)
+);
@@ -0,0 +1,16 @@
+-- مهام الإذاعة القابلة للاستئناف
+-- نقاط الحفظ تُكتب من broadcast_engine.py
+
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id SERIAL PRIMARY KEY,
+    message TEXT NOT NULL,
+    admin_chat_id BIGINT NOT NULL,
+    progress_message_id BIGINT,
+    total INT DEFAULT 0,
+    last_user_id BIGINT DEFAULT 0,
+    sent INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    status TEXT DEFAULT 'running',
+    started_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,7 @@
+-- قائمة المحظورين
+-- تُحمَّل إلى الذاكرة عند كل إقلاع (ban_list.py)
+
+CREATE TABLE IF NOT EXISTS banned_users (
+    user_id BIGINT PRIMARY KEY,
+    banned_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,24 @@
+-- أعمدة بيانات PDF (عدد الصفحات، العنوان، المؤلف) وطابور استخراجها
+-- يملؤها عامل الخلفية في pdf_metadata.py
+
+ALTER TABLE books ADD COLUMN IF NOT EXISTS page_count INT;
+ALTER TABLE books ADD COLUMN IF NOT EXISTS pdf_title TEXT;
+ALTER TABLE books ADD COLUMN IF NOT EXISTS pdf_author TEXT;
+
+CREATE TABLE IF NOT EXISTS pdf_metadata_queue (
+    book_id INT PRIMARY KEY,
+    status TEXT DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    last_error TEXT,
+    enqueued_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_pdf_metadata_pending
+ON pdf_metadata_queue (enqueued_at) WHERE status = 'pending';
+
+-- migrate:concurrently
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_page_count ON books (page_count);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_pdf_author ON books (pdf_author);
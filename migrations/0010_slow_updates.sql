@@ -0,0 +1,16 @@
+-- سجل التحديثات البطيئة مع تفصيل زمنها (قاعدة بيانات / Bot API / بايثون)
+-- يكتبه slow_updates.py دفعات، ويعرض /slow_updates أثقل الأنماط
+
+CREATE TABLE IF NOT EXISTS slow_updates (
+    id BIGSERIAL PRIMARY KEY,
+    occurred_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    handler TEXT NOT NULL,
+    query_text TEXT,
+    total_ms INT NOT NULL,
+    db_ms INT NOT NULL,
+    api_ms INT NOT NULL,
+    python_ms INT NOT NULL,
+    breakdown JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_slow_updates_occurred_at ON slow_updates (occurred_at);
@@ -0,0 +1,4 @@
+-- المستلمون المكتملون بعد last_user_id (الإرسال المتوازي يُنهيهم بغير ترتيب)
+-- يكتبها broadcast_engine.py مع كل نقطة حفظ، والاستئناف يتخطاهم
+
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS delivered_ids BIGINT[] NOT NULL DEFAULT '{}';
@@ -0,0 +1,5 @@
+-- مهام الاستخراج المحجوزة تُستعاد فقط بعد انتهاء مهلة حجزها (عدة نسخ للبوت)
+-- يستخدمه RECLAIM_SQL في pdf_metadata.py
+
+CREATE INDEX IF NOT EXISTS idx_pdf_metadata_running
+ON pdf_metadata_queue (updated_at) WHERE status = 'running';
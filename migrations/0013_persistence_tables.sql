@@ -0,0 +1,19 @@
+-- جداول PostgresPersistence (بيانات المستخدمين وbot_data وعلامات الترحيل القديم)
+-- كانت تُنشأ عند كل إقلاع من db_persistence.py، والـ Persistence يطبّق الترحيلات قبل أول قراءة
+
+CREATE TABLE IF NOT EXISTS persistence_user_data (
+    user_id BIGINT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS persistence_bot_data (
+    key TEXT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS persistence_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import logging
+import importlib
+from collections import namedtuple
+
+import asyncpg
+
+# إعداد اللوج لمتابعة ترحيل المخطط
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🧱 ترحيلات المخطط المرقّمة (Schema Migrations)
+# ملفات migrations/NNNN_name.sql أو .py تُطبَّق بالترتيب مرة واحدة، ويُسجَّل
+# آخر إصدار في جدول schema_version، فإعادة التشغيل الدافئة لا تكلّف إلا
+# استعلاماً واحداً. فهارس الجداول الكبيرة تُبنى بـ CREATE INDEX CONCURRENTLY
+# خارج المعاملة حتى لا تُقفل الكتابة على books أثناء إعادة النشر.
+#
+# ملف .sql: ما قبل السطر "-- migrate:concurrently" يُنفَّذ في معاملة واحدة،
+# وكل أمر بعده يُنفَّذ منفرداً خارج المعاملة.
+# ملف .py: دالة async up(conn) داخل معاملة، وقائمة CONCURRENTLY اختيارية.
+# كل ترحيل يجب أن يكون آمناً لإعادة التنفيذ (IF NOT EXISTS) لأن الإصدار
+# لا يُسجَّل إلا بعد اكتمال الفهارس المتزامنة.
+# ==========================================================
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+CONCURRENTLY_MARKER = "-- migrate:concurrently"
+
+# قفل استشاري يمنع نسختين من البوت من الترحيل في نفس الوقت
+MIGRATION_LOCK_KEY = 7_311_020_211
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    duration_ms INT,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+INDEX_NAME_RE = re.compile(r"INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+Migration = namedtuple("Migration", ["version", "name", "path"])
+
+
+class MigrationError(Exception):
+    """فشل ترحيل بعينه (الرسالة تحمل رقمه واسمه)"""
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    migrations = {}
+    for filename in os.listdir(directory):
+        match = re.fullmatch(r"(\d{4})_(\w+)\.(sql|py)", filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicate migration version {version}: {filename}")
+        migrations[version] = Migration(version, match.group(2), os.path.join(directory, filename))
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def _split_statements(sql: str) -> list:
+    statements = []
+    for chunk in sql.split(";"):
+        code = "\n".join(line for line in chunk.splitlines() if not line.strip().startswith("--"))
+        if code.strip():
+            statements.append(chunk.strip())
+    return statements
+
+
+def _load(migration: Migration):
+    """(دالة الجزء المعاملاتي، أوامر الفهارس المتزامنة)"""
+    if migration.path.endswith(".sql"):
+        with open(migration.path, encoding="utf-8") as f:
+            sql = f.read()
+        transactional, _, concurrent = sql.partition(CONCURRENTLY_MARKER)
+
+        async def up(conn):
+            await conn.execute(transactional)
+
+        return up, _split_statements(concurrent)
+
+    module = importlib.import_module(f"migrations.{os.path.basename(migration.path)[:-3]}")
+    return module.up, list(getattr(module, "CONCURRENTLY", []))
+
+
+async def _build_concurrently(conn, statement: str):
+    # بناء متزامن سابق انقطع يترك فهرساً غير صالح يتخطاه IF NOT EXISTS: يُحذف أولاً
+    match = INDEX_NAME_RE.search(statement)
+    if match:
+        invalid = await conn.fetchval("""
+            SELECT NOT i.indisvalid FROM pg_index i
+            WHERE i.indexrelid = to_regclass($1);
+        """, match.group(1))
+        if invalid:
+            logger.warning(f"🧱 Dropping invalid index {match.group(1)} left by an interrupted build.")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)};")
+    await conn.execute(statement)
+
+
+async def _current_version(conn) -> int:
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(pool, dsn: str, migrations: list = None) -> tuple:
+    """تطبيق الترحيلات المعلّقة. ترجع (الإصدار الحالي، [(الإصدار، الاسم، المدة بالملي ثانية)])"""
+    migrations = discover_migrations() if migrations is None else migrations
+    latest = migrations[-1].version if migrations else 0
+
+    # ⚡ المسار الدافئ: استعلام واحد عبر المجمع
+    async with pool.acquire() as conn:
+        version = await _current_version(conn)
+    if version >= latest:
+        return version, []
+
+    # اتصال مخصص بلا مهلة أوامر: بناء فهرس على جدول كبير قد يتجاوز مهلة المجمع
+    applied = []
+    conn = await asyncpg.connect(dsn=dsn, command_timeout=None)
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1);", MIGRATION_LOCK_KEY)
+        try:
+            await conn.execute(SCHEMA_VERSION_SQL)
+            # نسخة أخرى قد تكون أنهت الترحيل أثناء انتظار القفل
+            version = await _current_version(conn)
+
+            for migration in migrations:
+                if migration.version <= version:
+                    continue
+                started = time.perf_counter()
+                try:
+                    up, concurrent = _load(migration)
+                    async with conn.transaction():
+                        await up(conn)
+                    for statement in concurrent:
+                        await _build_concurrently(conn, statement)
+                except Exception as e:
+                    raise MigrationError(f"Migration {migration.version:04d}_{migration.name} failed: {e}") from e
+
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, name, duration_ms) VALUES ($1, $2, $3);",
+                    migration.version, migration.name, duration_ms
+                )
+                version = migration.version
+                applied.append((migration.version, migration.name, duration_ms))
+                logger.info(f"🧱 Applied migration {migration.version:04d}_{migration.name} in {duration_ms:,}ms.")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1);", MIGRATION_LOCK_KEY)
+    finally:
+        await conn.close()
+
+    return version, applied
+
+
+class StartupTimer:
+    """قياس مراحل الإقلاع وطباعة تقرير واحد في اللوج"""
+
+    def __init__(self):
+        self._started = self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000))
+        self._last = now
+
+    def report(self) -> str:
+        total = (self._last - self._started) * 1000
+        parts = ", ".join(f"{phase} {ms:,.0f}ms" for phase, ms in self.phases)
+        return f"⏱ Startup: {parts} | total {total:,.0f}ms"
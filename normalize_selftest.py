@@ -0,0 +1,66 @@
+from search_handler import normalize_query
+from book_categories import CATEGORY_RULES, classify_title
+from suggestion_index import TokenIndex, title_tokens
+
+# ==========================================================
+# 🧪 فحص محلي لتطبيع العناوين (بدون قاعدة بيانات)
+# أسماء ملفات القناة تفصل كلماتها بشرطات سفلية وتحمل تشكيلاً وهمزات،
+# والمستخدم يكتب الكلمات بمسافات: يجب أن يعطي الطرفان النص المطبّع نفسه
+# حتى تتطابق طبقات البحث وكلمات الاقتراحات وكلمات الأقسام.
+# التشغيل: python normalize_selftest.py
+# ==========================================================
+
+# (اسم الملف أو نص البحث، الناتج المتوقع)
+CASES = [
+    ("مقدمه_ابن_خلدون pdf", "مقدمه ابن خلدون pdf"),
+    ("مقدمة ابن خلدون", "مقدمه ابن خلدون"),
+    ("__مُقَدِّمَة__ابن_خلدون__.pdf", "مقدمه ابن خلدون pdf"),
+    ("أحلام_مستغانمي-ذاكرة_الجسد", "احلام مستغانمي ذاكره الجسد"),
+    ("إلى_الفتى  الذي", "الي الفتي الذي"),
+    ("The_Art_of_War (2nd_Edition)", "the art of war 2nd edition"),
+    ("___", ""),
+]
+
+
+def check_normalize():
+    for raw, expected in CASES:
+        got = normalize_query(raw)
+        assert got == expected, f"normalize_query({raw!r}) = {got!r}, expected {expected!r}"
+
+    # عنوان ملف بشرطات سفلية يطابق بحث المستخدم بالمسافات في طبقتي التطابق والاحتواء
+    title = normalize_query("مقدمة_ابن_خلدون_الطبعة_الثانية.pdf")
+    query = normalize_query("مقدمه ابن خلدون")
+    assert title.startswith(query), (title, query)
+    assert normalize_query("ابن خلدون") in title, title
+
+
+def check_tokens():
+    tokens = title_tokens(normalize_query("تاريخ_الحضارة_الإسلامية"))
+    assert {"تاريخ", "الحضاره", "حضاره", "الاسلاميه", "اسلاميه"} <= tokens, tokens
+    assert not any("_" in t for t in tokens), tokens
+
+    index = TokenIndex()
+    index.add_many([(1, normalize_query("تاريخ_الحضارة_الإسلامية")), (2, normalize_query("تاريخ_اوروبا"))])
+    index._finish_build()
+    assert index.query(normalize_query("الحضارة الاسلامية").split()) == [1]
+
+
+def check_categories():
+    # كل كلمة مفتاحية لقسم يجب أن تصنّف عنواناً يكتبها بشرطات سفلية
+    for key, keywords in CATEGORY_RULES:
+        for keyword in keywords:
+            title = normalize_query(f"كتاب_{keyword.replace(' ', '_')}_pdf")
+            assert key in classify_title(title), f"{key}: {keyword!r} not found in {title!r}"
+
+
+def main():
+    check_normalize()
+    check_tokens()
+    check_categories()
+    print(f"✅ normalize_query: {len(CASES)} cases")
+    print("✅ suggestion tokens: underscore titles split into words")
+    print(f"✅ categories: {sum(len(k) for _, k in CATEGORY_RULES)} keywords matched in underscore titles")
+
+
+if __name__ == "__main__":
+    main()
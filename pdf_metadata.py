@@ -0,0 +1,233 @@
+import io
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from telegram.error import BadRequest
+
+from database import DB
+
+# إعداد اللوج لمتابعة استخراج بيانات ملفات PDF
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📄 استخراج بيانات ملفات PDF (عدد الصفحات، العنوان، المؤلف)
+# الكتب الجديدة تدخل طابوراً دائماً في جدول pdf_metadata_queue، وعامل خلفية
+# ينزّل الملف عبر Bot API ويحلله بـ pypdf داخل ProcessPoolExecutor حتى لا
+# تتوقف حلقة asyncio، ثم تُحفظ النتائج كأعمدة مفهرسة في books.
+# الكتب القديمة لا تدخل الطابور إلا بتفعيل PDF_METADATA_BACKFILL_PER_HOUR،
+# وعندها تُضاف بالتدريج حسب المعدل المحدد حتى لا يُنزَّل الفهرس كله دفعة واحدة.
+# ==========================================================
+
+# عدد الملفات التي تُنزّل وتُحلل في نفس الوقت
+METADATA_CONCURRENCY = 3
+METADATA_PROCESSES = 2
+METADATA_BATCH = 20
+METADATA_MAX_ATTEMPTS = 3
+METADATA_IDLE_SLEEP = 30
+METADATA_PARSE_TIMEOUT = 60
+
+# حد التنزيل في Bot API (الملفات الأكبر تُعلَّم فاشلة مباشرة)
+BOT_API_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+# مجلد محلي لتجربة العامل دون تيليجرام: <file_id>.pdf
+PDF_MOCK_DIR = os.getenv("PDF_MOCK_DIR")
+
+# عدد الكتب القديمة (بلا عدد صفحات) المضافة للطابور في الساعة؛ 0 يعطّل التعبئة
+PDF_METADATA_BACKFILL_PER_HOUR = int(os.getenv("PDF_METADATA_BACKFILL_PER_HOUR", "0"))
+BACKFILL_INTERVAL = 5 * 60
+
+# مهلة حجز المهمة: المهمة 'running' أقدم من هذا تُعتبر متروكة (نسخة توقفت) وتعود للطابور
+METADATA_LEASE = 10 * 60
+RECLAIM_INTERVAL = 60
+
+
+def extract_pdf_metadata(data: bytes):
+    """يعمل داخل عملية منفصلة: (عدد الصفحات، العنوان، المؤلف) من محتوى الملف"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data), strict=False)
+    page_count = len(reader.pages)
+    info = reader.metadata or {}
+
+    def _clean(value):
+        value = str(value or "").replace("\x00", "").strip()
+        return value[:500] or None
+
+    return page_count, _clean(info.get("/Title")), _clean(info.get("/Author"))
+
+
+class PermanentMetadataError(Exception):
+    """خطأ لا تفيد معه إعادة المحاولة (ملف كبير أو غير موجود)"""
+
+
+class BotApiDownloader:
+    """تنزيل الملف عبر Bot API (getFile ثم التحميل إلى الذاكرة)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def fetch(self, file_id: str) -> bytes:
+        tg_file = await self.bot.get_file(file_id)
+        if tg_file.file_size and tg_file.file_size > BOT_API_DOWNLOAD_LIMIT:
+            raise PermanentMetadataError("file too big for Bot API")
+        return bytes(await tg_file.download_as_bytearray())
+
+
+class LocalDownloader:
+    """بديل محلي للتجربة: يقرأ <file_id>.pdf من مجلد"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def fetch(self, file_id: str) -> bytes:
+        path = os.path.join(self.directory, f"{file_id}.pdf")
+        if not os.path.exists(path):
+            raise PermanentMetadataError(f"missing local file {path}")
+        return await asyncio.to_thread(lambda: open(path, "rb").read())
+
+
+class PdfMetadataWorker:
+    """عامل خلفية بتوازٍ محدود يفرّغ طابور pdf_metadata_queue"""
+
+    def __init__(self):
+        self.downloader = None
+        self._executor = None
+        self._wakeup = asyncio.Event()
+        self._last_backfill = 0.0
+        self._last_reclaim = 0.0
+        self.extracted = 0
+        self.failed = 0
+        self.backfilled = 0
+        self.reclaimed = 0
+
+    async def enqueue(self, pool, book_ids):
+        """إدخال كتب في الطابور الدائم (إعادة الإدخال تعيد المحاولة من الصفر)"""
+        if not pool or not book_ids:
+            return
+        try:
+            async with DB.acquire(pool) as conn:
+                await DB.execute("pdf_metadata.enqueue", list(book_ids), conn=conn)
+            self._wakeup.set()
+        except Exception as e:
+            logger.error(f"Error queueing books for PDF metadata: {e}")
+
+    async def _backfill_step(self, pool, bot_data):
+        """إضافة دفعة صغيرة من الكتب القديمة بلا عدد صفحات (بحسب المعدل الساعي)
+        مع حفظ نقطة التقدم في bot_data، حتى لا يدخل الفهرس كله الطابور دفعة واحدة"""
+        if PDF_METADATA_BACKFILL_PER_HOUR <= 0 or bot_data.get("pdf_metadata_backfill_done"):
+            return
+        now = time.monotonic()
+        if now - self._last_backfill < BACKFILL_INTERVAL:
+            return
+        self._last_backfill = now
+
+        limit = max(1, PDF_METADATA_BACKFILL_PER_HOUR * BACKFILL_INTERVAL // 3600)
+        last_id = bot_data.get("pdf_metadata_backfill_checkpoint", 0)
+        async with DB.acquire(pool) as conn:
+            batch = await DB.fetchrow("pdf_metadata.backfill", last_id, limit, conn=conn)
+
+        if batch["last_id"] is None:
+            bot_data["pdf_metadata_backfill_done"] = True
+            bot_data.pop("pdf_metadata_backfill_checkpoint", None)
+            logger.info("✅ PDF metadata backfill: all existing books queued.")
+            return
+        bot_data["pdf_metadata_backfill_checkpoint"] = batch["last_id"]
+        self.backfilled += batch["books"]
+        self._wakeup.set()
+
+    async def _reclaim_expired(self, pool):
+        """إعادة المهام المحجوزة التي انتهت مهلتها فقط (لا تمس حجوزات النسخ الأخرى الحية)"""
+        now = time.monotonic()
+        if now - self._last_reclaim < RECLAIM_INTERVAL:
+            return
+        self._last_reclaim = now
+        async with DB.acquire(pool) as conn:
+            result = await DB.execute("pdf_metadata.reclaim", METADATA_LEASE, conn=conn)
+        reclaimed = int(result.split()[-1]) if result else 0
+        if reclaimed:
+            self.reclaimed += reclaimed
+            logger.info(f"🔁 PDF metadata: {reclaimed} expired jobs returned to the queue.")
+
+    async def _process(self, pool, job, semaphore):
+        async with semaphore:
+            try:
+                data = await self.downloader.fetch(job["file_id"])
+                loop = asyncio.get_running_loop()
+                page_count, title, author = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, extract_pdf_metadata, data),
+                    METADATA_PARSE_TIMEOUT
+                )
+                async with DB.acquire(pool) as conn:
+                    async with conn.transaction():
+                        await DB.execute("pdf_metadata.save", job["book_id"], page_count, title, author, conn=conn)
+                        await DB.execute("pdf_metadata.done", job["book_id"], conn=conn)
+                self.extracted += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                permanent = isinstance(e, (PermanentMetadataError, BadRequest))
+                status = "failed" if permanent or job["attempts"] >= METADATA_MAX_ATTEMPTS else "pending"
+                if status == "failed":
+                    self.failed += 1
+                # إعادة المحاولة تذهب لآخر الطابور
+                async with DB.acquire(pool) as conn:
+                    await DB.execute("pdf_metadata.retry", job["book_id"], status, str(e)[:500], conn=conn)
+
+    async def run(self, bot, pool, bot_data):
+        """حلقة الخلفية: حجز دفعة، معالجتها بتوازٍ محدود، ثم الانتظار عند فراغ الطابور"""
+        if self.downloader is None:
+            self.downloader = LocalDownloader(PDF_MOCK_DIR) if PDF_MOCK_DIR else BotApiDownloader(bot)
+        self._executor = ProcessPoolExecutor(max_workers=METADATA_PROCESSES)
+        semaphore = asyncio.Semaphore(METADATA_CONCURRENCY)
+
+        # علامة التعبئة القديمة التي كانت تُدخل كل الفهرس مرة واحدة
+        bot_data.pop("pdf_metadata_backfilled", None)
+
+        try:
+            while True:
+                try:
+                    # مهام نسخة توقفت أثناء التنفيذ تعود للطابور بعد انتهاء مهلة حجزها
+                    await self._reclaim_expired(pool)
+                    await self._backfill_step(pool, bot_data)
+                    async with DB.acquire(pool) as conn:
+                        jobs = await DB.fetch("pdf_metadata.claim", METADATA_BATCH, conn=conn)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"PDF metadata claim error: {e}")
+                    jobs = []
+
+                if not jobs:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), METADATA_IDLE_SLEEP)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await asyncio.gather(*(self._process(pool, job, semaphore) for job in jobs), return_exceptions=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.error("❌ PDF metadata worker error", exc_info=True)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "extracted": self.extracted,
+            "failed": self.failed,
+            "backfilled": self.backfilled,
+            "reclaimed": self.reclaimed,
+        }
+
+
+PDF_METADATA_WORKER = PdfMetadataWorker()
@@ -1,8 +1,9 @@
 import logging
-import random
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
+from search_session import new_ids_session, save_session
+
 # إعداد اللوج لتتبع حركة الرادار وتشخيص الأداء
 logger = logging.getLogger(__name__)
 
@@ -162,6 +163,17 @@ RADAR_ATLAS = {
     }
 }
 
+# 🛡️ كلمات احتياطية لكل تصنيف إذا لم تتوفر في الأرشيف كتب تطابق جذور الأطلس
+RADAR_BACKUP_KEYWORDS = {
+    "literature": ["رواية_", "رواية ", "قصص_"],
+    "philosophy": ["فلسفة", "كانط", "نيتشه", "سارتر", "أفلاطون", "أرسطو", "ابن_رشد", "الوجودية", "العقل العربي"],
+    "poetry": ["ديوان_", "ديوان ", "قصائد", "أشعار_"],
+    "psychology": ["علم_النفس", "سيكولوجية", "فرويد", "التحليل_النفسي", "لاوعي", "مصطفى حجازي"]
+}
+
+# ملفات لا تصلح كترشيح احتياطي
+RADAR_BACKUP_EXCLUDED = ["مقدمة_عامة", "تصوير", "دليل"]
+
 async def start_radar_flow(query):
     """المرحلة 1: اختيار التصنيف العام للمادة الفكرية والأدبية"""
     keyboard = InlineKeyboardMarkup([
@@ -207,7 +219,7 @@ async def process_radar_difficulty(query, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def execute_radar_search(query, context: ContextTypes.DEFAULT_TYPE):
-    """المرحلة 4: المحرك الفائق الفرز - استدعاء الجذور ومطابقة قاعدة البيانات عبر ILIKE"""
+    """المرحلة 4: المحرك الفائق الفرز - سحب ترشيحات من مخزون جذور الأطلس المطابَق مسبقاً"""
     size = query.data.split(":")[1]
     category = context.user_data.get("radar_category", "literature")
     difficulty = context.user_data.get("radar_difficulty", "easy")
@@ -217,72 +229,21 @@ async def execute_radar_search(query, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("❌ خطأ بنيوي: فشل الاتصال بقاعدة البيانات.")
         return
 
-    # جلب قائمة الجذور المحمية الـ 100 بالكامل حسب تصنيفك
-    targeted_roots = []
-    if category in RADAR_ATLAS and difficulty in RADAR_ATLAS[category]:
-        targeted_roots = list(RADAR_ATLAS[category][difficulty])
-
-    # خلط عشوائي كامل للأوراق ليتغير الناتج في كل مرة وبدقة مطلقة
-    random.shuffle(targeted_roots)
-    
-    # سحب عينة مكثفة من 15 جذراً لفحص توفرها الفوري في جدول الكتب الخاص بك
-    sample_roots = targeted_roots[:15]
-
+    # 🚀 سحب 5 ترشيحات عشوائية من المخزون المحسوب مسبقاً لجذور الأطلس (قراءة واحدة عبر الفهرس)
+    # مع تفضيل الكتب التي يطابق عدد صفحاتها الحجم المختار
+    from radar_pool import pick_radar_books
     rows = []
-    if sample_roots and pool:
-        try:
-            async with pool.acquire() as conn:
-                # صياغة الاستعلام المتعدد الشروط عالي الأداء برمجياً
-                clauses = [f"file_name ILIKE $ {i+1}" for i in range(len(sample_roots))]
-                sql_where = " OR ".join(clauses)
-                query_args = [f"%{root}%" for root in sample_roots]
-                
-                sql = f"""
-                SELECT file_id, file_name 
-                FROM books 
-                WHERE ({sql_where})
-                ORDER BY RANDOM() 
-                LIMIT 5;
-                """
-                rows = await conn.fetch(sql, *query_args)
-        except Exception as e:
-            logger.error(f"High-Quality Radar Execution Query Failed: {e}")
-
-    # 🛡️ المعالجة البنيوية الصارمة إذا كانت قاعدتك تفتقر لملفات هذه الجذور الـ 15 المحددة
-    if not rows and pool:
-        backup_keywords = {
-            "literature": ["رواية_", "رواية ", "قصص_"],
-            "philosophy": ["فلسفة", "كانط", "نيتشه", "سارتر", "أفلاطون", "أرسطو", "ابن_رشد", "الوجودية", "العقل العربي"],
-            "poetry": ["ديوان_", "ديوان ", "قصائد", "أشعار_"],
-            "psychology": ["علم_النفس", "سيكولوجية", "فرويد", "التحليل_النفسي", "لاوعي", "مصطفى حجازي"]
-        }
-        
-        keywords = backup_keywords.get(category, ["كتاب"])
-        where_clauses = [f"file_name ILIKE '%{k}%'" for k in keywords]
-        sql_where_backup = " OR ".join(where_clauses)
-        
-        sql_fallback = f"""
-        SELECT file_id, file_name FROM books 
-        WHERE ({sql_where_backup})
-        AND file_name NOT ILIKE '%مقدمة_عامة%' 
-        AND file_name NOT ILIKE '%تصوير%'
-        AND file_name NOT ILIKE '%دليل%'
-        ORDER BY RANDOM() LIMIT 5;
-        """
-        try:
-            async with pool.acquire() as conn:
-                rows = await conn.fetch(sql_fallback)
-        except Exception as e:
-            logger.error(f"Radar Fallback System Critical Failure: {e}")
+    try:
+        rows = await pick_radar_books(pool, category, difficulty, size)
+    except Exception as e:
+        logger.error(f"High-Quality Radar Execution Query Failed: {e}")
 
     # تهيئة واجهات ونصوص الإخراج لتطابق جمالية البوت
     cat_titles = {"literature": "أدب وروايات 🔍", "philosophy": "فلسفة وفكر 🧠", "poetry": "شعر وديوان 📜", "psychology": "علم نفس وتطوير 💡"}
     diff_titles = {"easy": "سهل وسلس 🟢", "hard": "عميق وأكاديمي 🔴"}
     size_titles = {"short": "وجبة سريعة ⏱️", "long": "رحلة ممتدة 📚"}
 
-    context.user_data["search_results"] = [dict(r) for r in rows]
-    context.user_data["current_page"] = 0
-    context.user_data["search_stage"] = f"🚀 رادار: {cat_titles.get(category)}"
+    save_session(context.user_data, new_ids_session([r["id"] for r in rows], stage=f"🚀 رادار: {cat_titles.get(category)}"))
     
     text_header = (
         f"🚀 **تمت التصفية الذكية والموسوعية بنجاح!**\n\n"
@@ -0,0 +1,160 @@
+import re
+import random
+import asyncio
+import hashlib
+import json
+import logging
+
+from database import DB
+from radar_handler import RADAR_ATLAS, RADAR_BACKUP_KEYWORDS, RADAR_BACKUP_EXCLUDED
+
+# إعداد اللوج لمتابعة بناء مرشحات الرادار
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🚀 مخزون مرشحات الرادار (radar_candidates)
+# جذور أطلس الرادار لكل (تصنيف، مستوى) تُطابق مع الكتب مسبقاً،
+# وكل مرشح يأخذ رقم خانة متسلسلاً داخل مخزونه، فيصبح سحب 5 ترشيحات
+# عشوائية قراءة واحدة عبر المفتاح الأساسي لخانات مختارة عشوائياً.
+# ==========================================================
+
+RADAR_PICKS = 5
+
+# عدد الخانات المسحوبة لكل ترشيح مطلوب (هامش لتفضيل الكتب المطابقة للحجم)
+RADAR_OVERSAMPLE = 8
+
+# حدود عدد الصفحات لاختيار "الحجم" في الرادار (page_count من استخراج بيانات PDF)
+RADAR_SIZE_PAGES = {
+    "short": (1, 150),
+    "long": (151, 1000000),
+}
+
+
+def _like_pattern(roots) -> re.Pattern:
+    """محاكاة file_name ILIKE ANY('%root%', ...): مطابقة جزئية دون حساسية لحالة الأحرف و"_" تطابق أي حرف"""
+    return re.compile(
+        "|".join(".".join(re.escape(part) for part in root.split("_")) for root in roots),
+        re.IGNORECASE
+    )
+
+
+def atlas_pool_key(category: str, difficulty: str) -> str:
+    return f"{category}:{difficulty}"
+
+
+def backup_pool_key(category: str) -> str:
+    return f"{category}:backup"
+
+
+def _build_rules() -> list:
+    """نمط مجمّع واحد لكل مخزون (لتصنيف الكتب الجديدة عند الإدخال)"""
+    rules = []
+    excluded = _like_pattern(RADAR_BACKUP_EXCLUDED)
+    for category, levels in RADAR_ATLAS.items():
+        for difficulty, roots in levels.items():
+            rules.append((atlas_pool_key(category, difficulty), _like_pattern(roots), None))
+    for category, keywords in RADAR_BACKUP_KEYWORDS.items():
+        rules.append((backup_pool_key(category), _like_pattern(keywords), excluded))
+    return rules
+
+
+RADAR_RULES = _build_rules()
+
+# بصمة الأطلس: أي تعديل على الجذور يطلق إعادة بناء المخزون تلقائياً عند الإقلاع
+RADAR_ATLAS_HASH = hashlib.sha1(
+    json.dumps([RADAR_ATLAS, RADAR_BACKUP_KEYWORDS, RADAR_BACKUP_EXCLUDED], ensure_ascii=False, sort_keys=True).encode("utf-8")
+).hexdigest()
+
+# حجم كل مخزون (عدد الخانات) لاختيار أرقام عشوائية دون استعلام
+RADAR_POOL_SIZES = {}
+
+
+def radar_pools_for(file_name: str) -> list:
+    if not file_name:
+        return []
+    return [
+        key for key, pattern, excluded in RADAR_RULES
+        if pattern.search(file_name) and not (excluded and excluded.search(file_name))
+    ]
+
+
+async def pick_radar_books(pool, category: str, difficulty: str, size: str = None, k: int = RADAR_PICKS) -> list:
+    """سحب k ترشيحات عشوائية من مخزون (التصنيف، المستوى) أو من المخزون الاحتياطي للتصنيف،
+    مع تفضيل الكتب التي يطابق عدد صفحاتها الحجم المطلوب"""
+    min_pages, max_pages = RADAR_SIZE_PAGES.get(size, (0, 0))
+    for key in (atlas_pool_key(category, difficulty), backup_pool_key(category)):
+        pool_size = RADAR_POOL_SIZES.get(key, 0)
+        if not pool_size:
+            continue
+        sample = k * RADAR_OVERSAMPLE if size in RADAR_SIZE_PAGES else k
+        slots = random.sample(range(pool_size), min(sample, pool_size))
+        rows = await DB.fetch("radar.pick", key, slots, min_pages, max_pages, k)
+        if rows:
+            return rows
+    return []
+
+
+async def add_books_to_radar(pool, books):
+    """إلحاق الكتب الجديدة بالمخزونات المطابقة: books قائمة (id, file_name)"""
+    if not pool or not books:
+        return
+    by_pool = {}
+    for book_id, file_name in books:
+        for key in radar_pools_for(file_name):
+            by_pool.setdefault(key, {})[book_id] = None
+    if not by_pool:
+        return
+    try:
+        async with DB.acquire(pool) as conn:
+            # إلحاق واحد لكل مخزون، والأقفال بترتيب ثابت حتى لا تتقاطع دفعتان
+            async with conn.transaction():
+                sizes = {}
+                for key in sorted(by_pool):
+                    await DB.execute("radar.lock_pool", key, conn=conn)
+                    sizes[key] = await DB.fetchval("radar.append", key, list(by_pool[key]), conn=conn)
+        for key, size in sizes.items():
+            if size is not None:
+                RADAR_POOL_SIZES[key] = max(RADAR_POOL_SIZES.get(key, 0), size)
+    except Exception as e:
+        logger.error(f"Error adding ingested books to radar pools: {e}")
+
+
+async def load_radar_pool_sizes(pool):
+    async with DB.acquire(pool) as conn:
+        rows = await DB.fetch("radar.pool_sizes", conn=conn)
+    RADAR_POOL_SIZES.clear()
+    RADAR_POOL_SIZES.update({r["pool_key"]: r["size"] for r in rows})
+
+
+def _rebuild_specs() -> list:
+    """(مفتاح المخزون، أنماط ILIKE، أنماط الاستبعاد) لكل مخزون"""
+    specs = []
+    for category, levels in RADAR_ATLAS.items():
+        for difficulty, roots in levels.items():
+            specs.append((atlas_pool_key(category, difficulty), [f"%{r}%" for r in roots], []))
+    excluded = [f"%{k}%" for k in RADAR_BACKUP_EXCLUDED]
+    for category, keywords in RADAR_BACKUP_KEYWORDS.items():
+        specs.append((backup_pool_key(category), [f"%{k}%" for k in keywords], excluded))
+    return specs
+
+
+async def rebuild_radar_candidates(pool, bot_data):
+    """إعادة بناء كل المخزونات عند تغيّر الأطلس: مسح واحد لكل مخزون داخل معاملة واحدة
+    (القراءات تستمر على المخزون القديم حتى اكتمال البناء)، ثم يكفي الإلحاق عند الإدخال"""
+    try:
+        if bot_data.get("radar_atlas_hash") != RADAR_ATLAS_HASH:
+            async with DB.acquire(pool) as conn:
+                async with conn.transaction():
+                    await DB.execute("radar.lock_all", conn=conn)
+                    await DB.execute("radar.clear", conn=conn)
+                    for key, patterns, excluded in _rebuild_specs():
+                        await DB.execute("radar.rebuild_pool", key, patterns, excluded, conn=conn)
+
+            bot_data["radar_atlas_hash"] = RADAR_ATLAS_HASH
+            logger.info("✅ Radar candidate pools rebuilt.")
+
+        await load_radar_pool_sizes(pool)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.error("❌ Radar candidate pools rebuild error", exc_info=True)
@@ -0,0 +1,266 @@
+import sys
+import time
+import asyncio
+import logging
+from array import array
+from collections import OrderedDict, Counter
+
+from database import DB
+
+# إعداد اللوج لمتابعة كفاءة الكاش
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🧠 كاش مشترك لنتائج البحث الشائعة (LRU + TTL)
+# المفتاح هو ناتج normalize_query والقيمة معرّفات الكتب المرتبة فقط.
+# ==========================================================
+
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESULT_CACHE_TTL = 15 * 60
+
+# كاش صغير لبيانات عرض الكتب (file_id, file_name) حتى تُعرض الصفحات الشائعة دون قاعدة البيانات
+BOOK_ROW_CACHE_MAX_ITEMS = 50_000
+
+# عدد الاستعلامات الأكثر تكراراً التي تُحفظ وتُحمّل مسبقاً عند الإقلاع
+POPULAR_QUERIES_LIMIT = 200
+POPULAR_QUERIES_TRACKED = 10_000
+
+# فاصل ترحيل عدّادات الاستعلامات إلى قاعدة البيانات (بالثواني)
+POPULAR_QUERIES_PERSIST_INTERVAL = 3600
+
+# عدد العناوين المفحوصة في كل خطوة إبطال قبل إفساح المجال لحلقة الأحداث
+INVALIDATE_CHUNK = 50
+
+# تكلفة تقريبية ثابتة لكل مدخل (القاموس والمرجع والطابع الزمني)
+_ENTRY_OVERHEAD = 200
+
+
+class ResultCache:
+    """كاش LRU بسقف للذاكرة وعمر محدد لكل مدخل، مع عدّادات للإصابة والإخفاق"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # فهرس عكسي لإبطال الكاش دون مسحه كاملاً: كل استعلام مسجّل تحت أطول كلماته
+        # (الأندر ظهوراً في العناوين)، وعدد الاستعلامات التي تستخدم كل كلمة
+        self._anchor_keys = {}
+        self._word_refs = {}
+        self._max_word_len = 0
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # عدد مرات طلب كل استعلام (للتحميل المسبق عند الإقلاع القادم)
+        self.query_counts = Counter()
+
+    def _entry_size(self, key: str, ids: array) -> int:
+        return sys.getsizeof(key) + ids.itemsize * len(ids) + _ENTRY_OVERHEAD
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.bytes_used -= entry[3]
+            self._unindex_key(key)
+
+    @staticmethod
+    def _anchor(words) -> str:
+        return max(words, key=lambda w: (len(w), w))
+
+    def _index_key(self, key: str):
+        words = set(key.split())
+        if not words:
+            return
+        for word in words:
+            self._word_refs[word] = self._word_refs.get(word, 0) + 1
+            self._max_word_len = max(self._max_word_len, len(word))
+        self._anchor_keys.setdefault(self._anchor(words), set()).add(key)
+
+    def _unindex_key(self, key: str):
+        words = set(key.split())
+        if not words:
+            return
+        for word in words:
+            refs = self._word_refs.get(word, 0) - 1
+            if refs > 0:
+                self._word_refs[word] = refs
+            else:
+                self._word_refs.pop(word, None)
+        anchor = self._anchor(words)
+        keys = self._anchor_keys.get(anchor)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._anchor_keys[anchor]
+
+    def get(self, key: str):
+        """ترجع (ids, stage) أو None"""
+        self._count_query(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        ids, stage, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self._drop(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return ids, stage
+
+    def put(self, key: str, ids, stage: str = None):
+        ids = array("i", ids)
+        size = self._entry_size(key, ids)
+        if size > self.max_bytes:
+            return
+
+        self._drop(key)
+        self._entries[key] = (ids, stage, time.monotonic() + self.ttl, size)
+        self._index_key(key)
+        self.bytes_used += size
+
+        while self.bytes_used > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _words_in_title(self, title: str) -> set:
+        """كلمات الاستعلامات المخزنة التي تظهر داخل العنوان (word in title كمطابقة جزئية).
+        كلمة البحث بلا مسافات، فهي تظهر في العنوان فقط كجزء من إحدى كلماته:
+        يكفي فحص أجزاء كلمات العنوان (حتى أطول كلمة مفهرسة) في الفهرس العكسي."""
+        found = set()
+        max_len = self._max_word_len
+        for token in set(title.split()):
+            for start in range(len(token)):
+                for end in range(start + 1, min(len(token), start + max_len) + 1):
+                    part = token[start:end]
+                    if part in self._word_refs:
+                        found.add(part)
+        return found
+
+    def invalidate_for_titles(self, normalized_titles):
+        """حذف المدخلات التي قد تتغير نتائجها بعد إضافة هذه العناوين:
+        أي استعلام تظهر كل كلماته داخل أحد العناوين الجديدة.
+        (التطابقات التقريبية تُترك لانتهاء الـ TTL)
+        التكلفة تتبع طول العناوين الجديدة وليس حجم الكاش، عبر الفهرس العكسي للكلمات."""
+        titles = [t for t in normalized_titles if t]
+        if not titles or not self._entries:
+            return
+
+        stale = set()
+        for title in titles:
+            present = self._words_in_title(title)
+            for word in present:
+                for key in self._anchor_keys.get(word, ()):
+                    if key not in stale and all(w in present for w in key.split()):
+                        stale.add(key)
+
+        for key in stale:
+            self._drop(key)
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._anchor_keys.clear()
+        self._word_refs.clear()
+        self._max_word_len = 0
+        self.bytes_used = 0
+
+    def _count_query(self, key: str):
+        self.query_counts[key] += 1
+        # إبقاء جدول العدّ محدوداً بأكثر الاستعلامات تكراراً
+        if len(self.query_counts) > POPULAR_QUERIES_TRACKED * 2:
+            self.query_counts = Counter(dict(self.query_counts.most_common(POPULAR_QUERIES_TRACKED)))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+class BookRowCache:
+    """كاش LRU بسيط: معرّف الكتاب ← (file_id, file_name)"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, ids):
+        found = {}
+        for book_id in ids:
+            row = self._rows.get(book_id)
+            if row is not None:
+                self._rows.move_to_end(book_id)
+                found[book_id] = row
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    def put_many(self, rows):
+        for r in rows:
+            self._rows[r["id"]] = {"id": r["id"], "file_id": r["file_id"], "file_name": r["file_name"]}
+            self._rows.move_to_end(r["id"])
+        while len(self._rows) > self.max_items:
+            self._rows.popitem(last=False)
+
+    def discard(self, book_id: int):
+        self._rows.pop(book_id, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+BOOK_ROW_CACHE = BookRowCache(BOOK_ROW_CACHE_MAX_ITEMS)
+
+
+async def on_books_ingested(books):
+    """تُستدعى بعد إدخال كتب جديدة: books قائمة (id, name_normalized).
+    الإبطال على دفعات صغيرة مع إفساح المجال لحلقة الأحداث بينها."""
+    for book_id, _ in books:
+        BOOK_ROW_CACHE.discard(book_id)
+    titles = [name for _, name in books]
+    for start in range(0, len(titles), INVALIDATE_CHUNK):
+        RESULT_CACHE.invalidate_for_titles(titles[start:start + INVALIDATE_CHUNK])
+        await asyncio.sleep(0)
+
+
+# ==========================================================
+# 💾 حفظ الاستعلامات الشائعة وتحميلها مسبقاً عند الإقلاع
+# ==========================================================
+
+async def save_popular_queries(pool):
+    """ترحيل عدّادات الاستعلامات المتراكمة إلى جدول search_query_stats"""
+    counts = RESULT_CACHE.query_counts.most_common(POPULAR_QUERIES_TRACKED)
+    if not counts or not pool:
+        return
+
+    RESULT_CACHE.query_counts = Counter()
+    try:
+        async with DB.acquire(pool) as conn:
+            await DB.execute("popular_queries.save", [q for q, _ in counts], [h for _, h in counts], conn=conn)
+    except Exception as e:
+        logger.error(f"Error saving popular search queries: {e}")
+
+
+async def run_popular_queries_persist(pool, interval: float = POPULAR_QUERIES_PERSIST_INTERVAL):
+    """حلقة الخلفية: ترحيل العدّادات دورياً حتى لا تضيع عند توقف غير نظيف"""
+    while True:
+        await asyncio.sleep(interval)
+        await save_popular_queries(pool)
+
+
+async def load_popular_queries(pool, limit: int = POPULAR_QUERIES_LIMIT) -> list:
+    async with DB.acquire(pool) as conn:
+        rows = await DB.fetch("popular_queries.top", limit, conn=conn)
+    return [r["query"] for r in rows]
@@ -0,0 +1,104 @@
+import logging
+import time
+
+from database import DB
+from metrics import SEARCH_SECONDS, SEARCH_TIER_SECONDS
+
+# إعداد اللوج لتتبع زمن كل طبقة بحث
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🧭 محرك البحث المرحلي (Tiered Search)
+# كل طبقة تعمل فقط إذا لم تُرجع الطبقات السابقة نتائج كافية
+# ==========================================================
+
+# الحد الأقصى لنتائج كل طبقة
+TIER_BUDGETS = {
+    "exact": 50,
+    "contains": 300,
+    "fts": 300,
+    "fuzzy": 100,
+}
+
+# عدد النتائج الذي يكفي لإيقاف الطبقات التالية
+ENOUGH_RESULTS = 20
+
+# أسماء الطبقات كما تظهر للمستخدم
+TIER_LABELS = {
+    "exact": "🎯 تطابق مباشر",
+    "contains": "✅ تطابق جزئي",
+    "fts": "🔤 بحث نصي",
+    "fuzzy": "🧩 نتائج تقريبية",
+}
+
+# نصوص الطبقات مسجلة في database.py باسم search.<الطبقة>
+
+def prefix_upper_bound(prefix: str) -> str:
+    """أصغر نص أكبر من كل النصوص التي تبدأ بالبادئة المعطاة"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+async def _run_tier(conn, tier: str, norm_q: str, ts_query: str) -> list:
+    budget = TIER_BUDGETS[tier]
+
+    if tier == "exact":
+        return await DB.fetch("search.exact", norm_q, prefix_upper_bound(norm_q), budget, conn=conn)
+
+    if tier == "contains":
+        rows = await DB.fetch("search.contains", f"%{norm_q}%", budget, conn=conn)
+        # العناوين الأقصر أقرب لما كتبه المستخدم
+        return sorted(rows, key=lambda r: len(r["file_name"] or ""))
+
+    if tier == "fts":
+        if not ts_query:
+            return []
+        return await DB.fetch("search.fts", ts_query, budget, conn=conn)
+
+    return await DB.fetch("search.fuzzy", norm_q, budget, conn=conn)
+
+
+async def run_tiered_search(conn, norm_q: str, ts_query: str, max_results: int) -> list:
+    """تنفيذ طبقات البحث بالترتيب مع الخروج المبكر.
+    كل نتيجة تحمل اسم الطبقة التي أنتجتها في المفتاح search_stage."""
+    search_started = time.perf_counter()
+    results = []
+    seen_ids = set()
+    exact_hits = 0
+
+    for tier in ("exact", "contains", "fts", "fuzzy"):
+        if len(results) >= ENOUGH_RESULTS:
+            break
+
+        # البحث التقريبي لا يُدفع ثمنه إذا وُجد تطابق مباشر للعنوان
+        if tier == "fuzzy" and exact_hits:
+            break
+
+        started = time.perf_counter()
+        rows = await _run_tier(conn, tier, norm_q, ts_query)
+        elapsed = time.perf_counter() - started
+        SEARCH_TIER_SECONDS.observe(elapsed, tier)
+
+        added = 0
+        for r in rows:
+            if r["id"] in seen_ids:
+                continue
+            seen_ids.add(r["id"])
+            results.append({
+                "id": r["id"],
+                "file_id": r["file_id"],
+                "file_name": r["file_name"],
+                "search_stage": tier,
+            })
+            added += 1
+
+        if tier == "exact":
+            exact_hits = added
+
+        logger.debug(f"Search tier '{tier}' for '{norm_q}': {added} rows in {elapsed * 1000:.1f} ms")
+
+        if len(results) >= max_results:
+            results = results[:max_results]
+            break
+
+    SEARCH_SECONDS.observe(time.perf_counter() - search_started, results[0]["search_stage"] if results else "none")
+    return results
@@ -1,29 +1,41 @@
-import hashlib
+import asyncio
 import re
 import logging
 from typing import List
-from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-
-# استيراد دالة الفحص من الملف المنفرد
-from limit_handler import check_search_limit
+from telegram.error import BadRequest
+
+# استيراد محرك الحصص من الملف المنفرد
+from limit_handler import consume_search_quota, DAILY_SEARCH_LIMIT
+from search_engine import run_tiered_search, TIER_LABELS
+from search_session import (
+    BOOKS_PER_PAGE, new_ids_session, save_session, fetch_session_page, total_pages
+)
+from search_cache import RESULT_CACHE, BOOK_ROW_CACHE, load_popular_queries
+from download_recorder import DOWNLOAD_RECORDER
+from trending import TRENDING, TRENDING_WINDOWS, DEFAULT_WINDOW
+from database import DB
 
 # إعداد اللوج لتتبع أي أخطاء
 logger = logging.getLogger(__name__)
 
 # الإعدادات
-BOOKS_PER_PAGE = 10
 MAX_RESULTS = 500  # عدد كافٍ جداً وشامل ودقيق
 
+# يُرفع عند تعديل normalize_query لإعادة تطبيع كل العناوين المخزنة وإعادة تصنيفها
+NORMALIZATION_VERSION = 4
+
 # دالة التطبيع (يجب أن تتطابق مع منطق قاعدة البيانات)
 def normalize_query(text: str) -> str:
     if not text: return ""
     text = text.lower().strip()
-    repls = str.maketrans("أإآةى", "اااوه")
+    repls = str.maketrans("أإآةى", "اااهي")
     text = text.translate(repls)
     text = re.sub(r"[ًٌٍَُِّْـ]", "", text)
     text = re.sub(r'[^\w\s]', ' ', text)
+    # \w تُبقي "_": أسماء الملفات تفصل كلماتها بشرطات سفلية
+    text = text.replace("_", " ")
     return ' '.join(text.split())
 
 # تنظيف الكلمات الجانبية
@@ -33,6 +45,35 @@ def get_clean_keywords(text: str) -> List[str]:
     if len(words) <= 2: return words
     return [w for w in words if w not in stop_words]
 
+def build_ts_query(norm_q: str) -> str:
+    return ' & '.join([f"{w}:*" for w in get_clean_keywords(norm_q)])
+
+async def search_ranked_ids(pool, norm_q: str):
+    """تنفيذ البحث المرحلي وتخزين ترتيب النتائج في الكاش المشترك.
+    ترجع (ids, stage) حيث stage اسم الطبقة التي أنتجت أول نتيجة."""
+    async with DB.acquire(pool) as conn:
+        # 🧭 بحث مرحلي: تطابق مباشر ← احتواء ← نص كامل ← تقريبي (مع خروج مبكر)
+        rows = await run_tiered_search(conn, norm_q, build_ts_query(norm_q), MAX_RESULTS)
+
+    ids = [r["id"] for r in rows]
+    stage = TIER_LABELS[rows[0]["search_stage"]] if rows else None
+    RESULT_CACHE.put(norm_q, ids, stage)
+    BOOK_ROW_CACHE.put_many(rows[:BOOKS_PER_PAGE])
+    return ids, stage
+
+async def warm_up_search_cache(pool):
+    """تحميل نتائج الاستعلامات الأكثر تكراراً في الكاش عند الإقلاع"""
+    try:
+        queries = await load_popular_queries(pool)
+        for norm_q in queries:
+            await search_ranked_ids(pool, norm_q)
+            # إفساح المجال لطلبات المستخدمين أثناء التسخين
+            await asyncio.sleep(0)
+        if queries:
+            logger.info(f"✅ Search cache warmed up with {len(queries)} popular queries.")
+    except Exception:
+        logger.error("❌ Search cache warm-up error", exc_info=True)
+
 async def search_books(update, context: ContextTypes.DEFAULT_TYPE):
     query = update.message.text.strip()
     user_id = update.effective_user.id
@@ -42,107 +83,69 @@ async def search_books(update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ خطأ في الاتصال بقاعدة البيانات.")
         return
 
-    async with pool.acquire() as conn:
+    # 🎟 فحص واستهلاك الحصة في طلب واحد (بريميوم ← الحد اليومي ← رصيد الإحالات)
+    try:
+        decision = await consume_search_quota(user_id)
+    except Exception as e:
+        logger.error(f"Quota check error for {user_id}: {e}")
+        # في حال حدوث خطأ تقني، نفضل السماح بالبحث لضمان استمرارية الخدمة
+        decision = None
 
-        # 🔥 فحص البريميوم الحقيقي
-        user_status = await conn.fetchrow(
-            "SELECT is_premium FROM users WHERE user_id = $1",
-            user_id
-        )
+    # مفتاح الحظر القديم لم يعد مستخدماً
+    context.user_data.pop("block_until", None)
 
-        is_premium = user_status and user_status["is_premium"]
+    if decision is not None and not decision.allowed:
+        hours = decision.reset_in_seconds // 3600
+        minutes = (decision.reset_in_seconds % 3600) // 60
 
         bot_username = context.bot.username
         referral_link = f"https://t.me/{bot_username}?start=inv_{user_id}"
 
-        if not is_premium:
-            now = datetime.now()
-            block_until = context.user_data.get("block_until")
-
-            if block_until and now < block_until:
-                remaining = block_until - now
-                hours = remaining.seconds // 3600
-                minutes = (remaining.seconds % 3600) // 60
-
-                # 🌟 الكليشة الجديدة المعدلة بدقة في حالة الحظر المؤقت المستمر
-                msg = (
-                    f"⚠️ **تنبيه: لقد استنفدت حد البحث اليومي المجاني (10 عمليات).**\n\n"
-                    f"⏱️ المتبقي لانتهاء الحظر التلقائي: **{hours} ساعة و {minutes} دقيقة**\n\n"
-                    f"يمكنك تفعيل البحث اللامحدود فوراً وتخطي الحظر عبر أحد الخيارات التالية:\n\n"
-                    f"💳 **الخيار السريع (الاشتراك المدفوع):**\n"
-                    f"• اشترك في العضوية المميزة بمبلغ 5$ دولارات فقط شهرياً للبحث بلا حدود.\n"
-                    f"📩 للتفعيل الفوري تواصل معنا: @vivvvv\n\n"
-                    f"🎁 **الخيار المجاني (دعم البوت):**\n"
-                    f"• شارك البوت مع أصدقائك أو في المجموعات عبر الزر أدناه.\n"
-                    f"• عند ضغط أحد أصدقائك على رابطك, سيقوم البوت تلقائياً بأضافة عشر محاولات جديدة لك!"
-                )
-
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("📢 مشاركة رابط الإحالة", switch_inline_query=f"{referral_link}")]
-                ])
-
-                await update.message.reply_text(msg, reply_markup=keyboard, parse_mode="Markdown")
-                return
-
-            can_search = await check_search_limit(user_id, conn)
-
-            if not can_search:
-                context.user_data["block_until"] = now + timedelta(days=1)
-
-                # 🌟 الكليشة الجديدة المعدلة بدقة لحظة وصول المستخدم للحد الأقصى مباشرة
-                msg = (
-                    f"⚠️ **تنبيه: لقد استنفدت حد البحث اليومي المجاني (10 عمليات).**\n\n"
-                    f"يمكنك تفعيل البحث اللامحدود فوراً وتخطي الحظر عبر أحد الخيارات التالية:\n\n"
-                    f"💳 **الخيار السريع (الاشتراك المدفوع):**\n"
-                    f"• اشترك في العضوية المميزة بمبلغ 5$ دولارات فقط شهرياً للبحث بلا حدود.\n"
-                    f"📩 للتفعيل الفوري تواصل معنا: @vivvvv\n\n"
-                    f"🎁 **الخيار المجاني (دعم البوت):**\n"
-                    f"• شارك البوت مع أصدقائك أو في المجموعات عبر الزر أدناه.\n"
-                    f"• بمجرد ضغط أحد أصدقائك على رابطك, سيقوم البوت تلقائياً بأضافة عشر محاولات جديدة لك !"
-                )
-
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("📢 انشر البوت الآن", switch_inline_query=f"{referral_link}")]
-                ])
-
-                await update.message.reply_text(msg, reply_markup=keyboard, parse_mode="Markdown")
-                return
+        # 🌟 الكليشة المعدلة بدقة عند استنفاد الحد اليومي ورصيد الإحالات
+        msg = (
+            f"⚠️ **تنبيه: لقد استنفدت حد البحث اليومي المجاني ({DAILY_SEARCH_LIMIT} عمليات).**\n\n"
+            f"⏱️ المتبقي لتجديد الحد اليومي: **{hours} ساعة و {minutes} دقيقة**\n\n"
+            f"يمكنك تفعيل البحث اللامحدود فوراً وتخطي الحظر عبر أحد الخيارات التالية:\n\n"
+            f"💳 **الخيار السريع (الاشتراك المدفوع):**\n"
+            f"• اشترك في العضوية المميزة بمبلغ 5$ دولارات فقط شهرياً للبحث بلا حدود.\n"
+            f"📩 للتفعيل الفوري تواصل معنا: @vivvvv\n\n"
+            f"🎁 **الخيار المجاني (دعم البوت):**\n"
+            f"• شارك البوت مع أصدقائك أو في المجموعات عبر الزر أدناه.\n"
+            f"• عند ضغط أحد أصدقائك على رابطك, سيقوم البوت تلقائياً بأضافة عشر محاولات جديدة لك!"
+        )
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📢 مشاركة رابط الإحالة", switch_inline_query=f"{referral_link}")]
+        ])
+
+        await update.message.reply_text(msg, reply_markup=keyboard, parse_mode="Markdown")
+        return
 
     norm_q = normalize_query(query)
-    keywords = get_clean_keywords(norm_q)
-    ts_query = ' & '.join([f"{w}:*" for w in keywords])
+
+    # نص فارغ بعد التطبيع (رموز فقط) سيطابق كل الكتب بنمط %%
+    if not norm_q:
+        from search_suggestions import send_search_suggestions
+        context.user_data["last_query"] = query
+        await send_search_suggestions(update, context)
+        return
 
     try:
-        async with pool.acquire() as conn:
-
-            sql = """
-            SELECT file_id, file_name,
-                   ts_rank_cd(to_tsvector('arabic', file_name), to_tsquery('arabic', $1)) AS rank,
-                   similarity(file_name, $2) AS sim
-            FROM books
-            WHERE 
-                to_tsvector('arabic', file_name) @@ to_tsquery('arabic', $1)
-                OR file_name ILIKE $3
-                OR file_name % $2
-            ORDER BY 
-                (file_name ILIKE $3) DESC,
-                rank DESC,
-                sim DESC
-            LIMIT $4;
-            """
-
-            full_pattern = f"%{query.strip()}%"
-            rows = await conn.fetch(sql, ts_query, norm_q, full_pattern, MAX_RESULTS)
-
-        if not rows:
+        # 🧠 الاستعلامات الشائعة تُجاب من الكاش المشترك دون حجز اتصال
+        cached = RESULT_CACHE.get(norm_q)
+        if cached is not None:
+            ids, stage = cached
+        else:
+            ids, stage = await search_ranked_ids(pool, norm_q)
+
+        if not ids:
             from search_suggestions import send_search_suggestions
             context.user_data["last_query"] = query
             await send_search_suggestions(update, context)
             return
 
-        context.user_data["search_results"] = [dict(r) for r in rows]
-        context.user_data["current_page"] = 0
-        context.user_data["search_stage"] = "✅ نتائج ذكية"
+        # 📑 نحفظ ترتيب المعرّفات فقط، والصفحة تُجلب عند العرض
+        save_session(context.user_data, new_ids_session(ids, stage=stage))
         await send_books_page(update, context)
 
     except Exception as e:
@@ -150,30 +153,65 @@ async def search_books(update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ حدث خطأ أثناء البحث، يرجى المحاولة لاحقاً.")
 
 
-async def send_books_page(update, context: ContextTypes.DEFAULT_TYPE):
-    results = context.user_data.get("search_results", [])
-    page = context.user_data.get("current_page", 0)
+def book_callback_data(book_id: int) -> str:
+    """بيانات زر التحميل: معرّف الكتاب فقط (قصير وثابت عبر إعادة التشغيل)"""
+    return f"book:{book_id}"
 
-    start = page * BOOKS_PER_PAGE
-    end = start + BOOKS_PER_PAGE
-    current_batch = results[start:end]
-    total_pages = (len(results) - 1) // BOOKS_PER_PAGE + 1
+async def resolve_book_file_id(pool, raw_id: str):
+    """تحويل معرّف الكتاب إلى file_id عبر الكاش ثم المفتاح الأساسي لجدول books"""
+    try:
+        book_id = int(raw_id)
+    except ValueError:
+        return None
 
-    text = f"📚 **نتائج البحث ({len(results)} نتيجة):**\n"
-    text += f"صفحة {page + 1} من {total_pages}\n\n"
+    cached = BOOK_ROW_CACHE.get_many([book_id]).get(book_id)
+    if cached:
+        return cached["file_id"]
+
+    if not pool:
+        return None
+
+    row = await DB.fetchrow("books.by_id", book_id)
+
+    if not row:
+        return None
+    BOOK_ROW_CACHE.put_many([row])
+    return row["file_id"]
+
+async def send_books_page(update, context: ContextTypes.DEFAULT_TYPE, step: int = 0):
+    """عرض صفحة من جلسة البحث الحالية (step: 0 الحالية، 1 التالية، -1 السابقة)"""
+    session = context.user_data.get("search_session")
+    pool = context.bot_data.get("db_conn")
+
+    page_data = None
+    if session and pool:
+        page_data = await fetch_session_page(pool, session, step)
+
+    if not page_data:
+        # لا توجد صفحة في هذا الاتجاه: تبقى الرسالة الحالية كما هي
+        if not session:
+            target = update.message or update.callback_query.message
+            await target.reply_text("❌ انتهت صلاحية نتائج البحث، يرجى البحث مجدداً.")
+        elif not step and update.message:
+            await update.message.reply_text("📚 لا توجد نتائج لعرضها حالياً.")
+        return
+
+    current_batch, has_prev, has_next = page_data
+    total = f"{session['total']:,}+" if session.get("capped") else f"{session['total']:,}"
+
+    text = f"📚 **نتائج البحث ({total} نتيجة):**\n"
+    text += f"صفحة {session['page'] + 1} من {total_pages(session)}\n\n"
 
     keyboard = []
 
     for b in current_batch:
         clean_name = b['file_name'] if len(b['file_name']) < 50 else b['file_name'][:47] + "..."
-        key = hashlib.md5(b['file_id'].encode()).hexdigest()[:16]
-        context.bot_data[f"file_{key}"] = b['file_id']
-        keyboard.append([InlineKeyboardButton(f"📖 {clean_name}", callback_data=f"file:{key}")])
+        keyboard.append([InlineKeyboardButton(f"📖 {clean_name}", callback_data=book_callback_data(b['id']))])
 
     nav_buttons = []
-    if page > 0:
+    if has_prev:
         nav_buttons.append(InlineKeyboardButton("⬅️ السابق", callback_data="prev_page"))
-    if end < len(results):
+    if has_next:
         nav_buttons.append(InlineKeyboardButton("التالي ➡️", callback_data="next_page"))
 
     if nav_buttons:
@@ -192,9 +230,11 @@ async def handle_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     await query.answer()
 
-    if data.startswith("file:"):
-        key = data.split(":")[1]
-        file_id = context.bot_data.get(f"file_{key}")
+    if data.startswith("book:") or data.startswith("file:"):
+        # أزرار file: القديمة كانت تعتمد على خريطة bot_data المحذوفة فتُعامل كمنتهية
+        file_id = None
+        if data.startswith("book:"):
+            file_id = await resolve_book_file_id(context.bot_data.get("db_conn"), data.split(":")[1])
 
         if file_id:
             share_keyboard = InlineKeyboardMarkup([
@@ -208,77 +248,60 @@ async def handle_callbacks(update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown"
             )
 
-            # 🌟 دمج ميزة تسجيل الإحصائيات والتنظيف الدوري التلقائي
-            pool = context.bot_data.get("db_conn")
-            if pool:
-                try:
-                    async with pool.acquire() as conn:
-                        # 1. تسجيل عملية التحميل الحالية في الجدول الوسيط
-                        await conn.execute("INSERT INTO download_stats (file_id) VALUES ($1);", file_id)
-                        
-                        # 2. حماية المساحة: حذف البيانات القديمة التي تجاوزت 7 أيام تلقائياً ليبقى الحجم صفرًا
-                        await conn.execute("DELETE FROM download_stats WHERE downloaded_at < NOW() - INTERVAL '7 days';")
-                except Exception as e:
-                    logger.error(f"Error in download stats execution: {e}")
+            # 🌟 تسجيل التحميل في الذاكرة فقط، والكتابة لقاعدة البيانات تتم دفعة واحدة في الخلفية
+            DOWNLOAD_RECORDER.record(int(data.split(":")[1]), file_id)
         else:
             await query.message.reply_text("❌ انتهت صلاحية الرابط.")
 
     elif data == "next_page":
-        context.user_data["current_page"] += 1
-        await send_books_page(update, context)
+        await send_books_page(update, context, step=1)
 
     elif data == "prev_page":
-        context.user_data["current_page"] -= 1
-        await send_books_page(update, context)
+        await send_books_page(update, context, step=-1)
 
 # ====================================================================
 # 🌟 الميزة المضافة: جلب وعرض الكتب الأكثر تحميلاً (5 مرات فما فوق) 🌟
 # ====================================================================
 
-async def get_top_weekly_books(pool) -> list:
-    """جلب الكتب التي تم تحميلها 5 مرات فما فوق خلال آخر 7 أيام"""
-    sql = """
-    SELECT b.file_id, b.file_name, COUNT(s.id) AS download_count
-    FROM download_stats s
-    JOIN books b ON s.file_id = b.file_id
-    WHERE s.downloaded_at >= NOW() - INTERVAL '7 days'
-    GROUP BY b.file_id, b.file_name
-    HAVING COUNT(s.id) >= 5
-    ORDER BY download_count DESC
-    LIMIT 15;
-    """
-    async with pool.acquire() as conn:
-        return await conn.fetch(sql)
-
 async def send_trending_books(update, context: ContextTypes.DEFAULT_TYPE):
-    """عرض قائمة الكتب الأكثر تحميلاً للمستخدم بأزرار تفاعلية حية"""
+    """عرض قائمة الكتب الأكثر تحميلاً من اللقطة المحسوبة مسبقاً (بدون أي استعلام)"""
     query = update.callback_query
-    pool = context.bot_data.get("db_conn")
-    
-    if not pool:
-        if query:
-            await query.message.reply_text("❌ خطأ في الاتصال بقاعدة البيانات.")
+    if not query:
         return
 
-    rows = await get_top_weekly_books(pool)
-    
-    if not rows:
-        msg = "📚 لا توجد كتب تجاوزت الـ 5 تحميلات هذا الأسبوع حتى الآن."
-        if query:
-            await query.message.reply_text(msg)
-        return
+    window = DEFAULT_WINDOW
+    if query.data.startswith("trending:") and query.data.split(":")[1] in TRENDING_WINDOWS:
+        window = query.data.split(":")[1]
+    _, window_title, min_downloads = TRENDING_WINDOWS[window]
 
-    text = "🔥 **الكتب الأكثر تحميلاً هذا الأسبوع (5 تحميلات فما فوق):**\n\n"
-    keyboard = []
+    rows = TRENDING.get(window)
 
-    for b in rows:
+    # أزرار التبديل بين النوافذ الزمنية
+    window_buttons = [
+        InlineKeyboardButton(("✅ " if key == window else "") + title, callback_data=f"trending:{key}")
+        for key, (_, title, _) in TRENDING_WINDOWS.items()
+    ]
+
+    if rows is None:
+        text = "⏳ يتم تجهيز قائمة الأكثر تحميلاً، يرجى المحاولة بعد قليل."
+    elif not rows:
+        text = f"📚 لا توجد كتب تجاوزت الـ {min_downloads} تحميلات {window_title} حتى الآن."
+    else:
+        text = f"🔥 **الكتب الأكثر تحميلاً {window_title} ({min_downloads} تحميلات فما فوق):**\n\n"
+
+    keyboard = []
+    for b in rows or []:
         clean_name = b['file_name'] if len(b['file_name']) < 45 else b['file_name'][:42] + "..."
-        key = hashlib.md5(b['file_id'].encode()).hexdigest()[:16]
-        context.bot_data[f"file_{key}"] = b['file_id']
-        
-        keyboard.append([InlineKeyboardButton(f"📥 ({b['download_count']}) {clean_name}", callback_data=f"file:{key}")])
+        keyboard.append([InlineKeyboardButton(f"📥 ({b['download_count']}) {clean_name}", callback_data=book_callback_data(b['id']))])
+    keyboard.append(window_buttons)
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if query:
+    if query.data.startswith("trending:"):
+        try:
+            await query.message.edit_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+        except BadRequest:
+            # نفس النافذة المعروضة حالياً (الرسالة لم تتغير)
+            pass
+    else:
         await query.message.reply_text(text, reply_markup=reply_markup, parse_mode="Markdown")
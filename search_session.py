@@ -0,0 +1,162 @@
+import logging
+from array import array
+
+from search_cache import BOOK_ROW_CACHE
+from database import DB
+
+# إعداد اللوج لتتبع أخطاء جلب الصفحات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 📑 جلسات البحث الخفيفة (Search Sessions)
+# بدلاً من حفظ مئات القواميس في user_data نحفظ معاملات الاستعلام فقط
+# ثم نجلب الصفحة المعروضة (10 كتب) من قاعدة البيانات عند كل تنقل.
+#
+# ثلاثة أنواع من الجلسات:
+#   - "ids": مصفوفة مضغوطة من معرّفات الكتب المرتبة (نتائج البحث والرادار)
+#   - "category": مفتاح القسم في book_categories + مؤشر keyset (أول وآخر معرّف في الصفحة)
+#   - "regex": نمط القسم + مؤشر keyset (يُستخدم فقط قبل اكتمال تصنيف الكتب)
+# ==========================================================
+
+BOOKS_PER_PAGE = 10
+
+# سقف العدّ التقريبي لنتائج الأقسام (يكفي لعرض "+700")
+COUNT_CAP = 700
+
+# استعلامات التنقل لكل نوع من جلسات keyset: (التالي، السابق، مفتاح المعامل في الجلسة)
+# النصوص مسجلة في database.py
+KEYSET_QUERIES = {
+    "regex": ("session.regex_next", "session.regex_prev", "pattern"),
+    "category": ("session.category_next", "session.category_prev", "category"),
+}
+
+
+def _pack_ids(ids) -> bytes:
+    return array("i", ids).tobytes()
+
+
+def _unpack_ids(packed: bytes) -> array:
+    ids = array("i")
+    ids.frombytes(packed)
+    return ids
+
+
+def new_ids_session(ids, stage: str = None) -> dict:
+    """جلسة لقائمة نتائج مرتبة مسبقاً (تُحفظ كمصفوفة أعداد مضغوطة)"""
+    return {
+        "kind": "ids",
+        "ids": _pack_ids(ids),
+        "total": len(ids),
+        "page": 0,
+        "stage": stage,
+    }
+
+
+async def new_regex_session(pool, pattern: str, stage: str = None) -> dict:
+    """جلسة تصفح قسم عبر keyset مع عدّ محدود بسقف COUNT_CAP"""
+    total = await DB.fetchval("session.regex_count", pattern, COUNT_CAP + 1)
+
+    return {
+        "kind": "regex",
+        "pattern": pattern,
+        "total": min(total, COUNT_CAP),
+        "capped": total > COUNT_CAP,
+        "page": 0,
+        "first_id": 0,
+        "last_id": 0,
+        "stage": stage,
+    }
+
+
+def new_category_session(category: str, total: int, stage: str = None) -> dict:
+    """جلسة تصفح قسم مصنّف مسبقاً (العدد معروف من عدّادات الأقسام دون استعلام)"""
+    return {
+        "kind": "category",
+        "category": category,
+        "total": total,
+        "capped": False,
+        "page": 0,
+        "first_id": 0,
+        "last_id": 0,
+        "stage": stage,
+    }
+
+
+def save_session(user_data, session: dict):
+    """حفظ الجلسة الجديدة وحذف القوائم القديمة الكبيرة إن وُجدت"""
+    user_data["search_session"] = session
+    user_data.pop("search_results", None)
+    user_data.pop("current_page", None)
+
+
+def total_pages(session: dict) -> int:
+    return max(1, (session["total"] - 1) // BOOKS_PER_PAGE + 1)
+
+
+async def _fetch_ids_page(session: dict, page: int):
+    ids = _unpack_ids(session["ids"])
+    start = page * BOOKS_PER_PAGE
+    page_ids = list(ids[start:start + BOOKS_PER_PAGE])
+    if not page_ids:
+        return None
+
+    # الكتب المعروضة حديثاً تُقرأ من الكاش ولا يُستعلم إلا عن الناقص منها
+    by_id = BOOK_ROW_CACHE.get_many(page_ids)
+    missing = [i for i in page_ids if i not in by_id]
+    if missing:
+        rows = await DB.fetch("session.page_by_ids", missing)
+        BOOK_ROW_CACHE.put_many(rows)
+        by_id.update({r["id"]: r for r in rows})
+
+    # إعادة الترتيب حسب ترتيب الجلسة الأصلي
+    books = [by_id[i] for i in page_ids if i in by_id]
+
+    session["page"] = page
+    has_next = start + BOOKS_PER_PAGE < len(ids)
+    return books, has_next
+
+
+async def _fetch_keyset_page(session: dict, step: int):
+    next_query, prev_query, arg_key = KEYSET_QUERIES[session["kind"]]
+    arg = session[arg_key]
+
+    if step < 0:
+        rows = await DB.fetch(prev_query, arg, session["first_id"], BOOKS_PER_PAGE)
+        rows = list(reversed(rows))
+        has_next = True
+    else:
+        # step == 0 يعيد رسم الصفحة الحالية بدءاً من أول معرّف فيها
+        after_id = session["last_id"] if step > 0 else session["first_id"] - 1
+        rows = await DB.fetch(next_query, arg, max(after_id, 0), BOOKS_PER_PAGE + 1)
+        has_next = len(rows) > BOOKS_PER_PAGE
+        rows = rows[:BOOKS_PER_PAGE]
+
+    if not rows:
+        return None
+
+    session["page"] = max(0, session["page"] + step)
+    session["first_id"] = rows[0]["id"]
+    session["last_id"] = rows[-1]["id"]
+    return rows, has_next
+
+
+async def fetch_session_page(pool, session: dict, step: int = 0):
+    """جلب الكتب المعروضة في الصفحة (الحالية أو التالية أو السابقة).
+    ترجع (books, has_prev, has_next) أو None إذا كانت الصفحة المطلوبة خارج النطاق."""
+    if step < 0 and session["page"] == 0:
+        return None
+
+    try:
+        if session["kind"] == "ids":
+            result = await _fetch_ids_page(session, session["page"] + step)
+        else:
+            result = await _fetch_keyset_page(session, step)
+    except Exception as e:
+        logger.error(f"Search session page fetch error: {e}")
+        return None
+
+    if result is None:
+        return None
+
+    books, has_next = result
+    return books, session["page"] > 0, has_next
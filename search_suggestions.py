@@ -1,10 +1,18 @@
 # search_suggestions.py
-import re
-import hashlib
+import logging
 from typing import List
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
+from search_handler import book_callback_data, normalize_query
+from suggestion_index import SUGGESTION_INDEX
+from database import DB
+
+logger = logging.getLogger(__name__)
+
+# عدد العناوين المقترحة
+SUGGESTIONS_LIMIT = 10
+
 # -----------------------------
 # إعدادات Stop Words
 # -----------------------------
@@ -16,20 +24,12 @@ ARABIC_STOP_WORDS = {
 
 # -----------------------------
 # دوال التطبيع والتنظيف
+# (نفس تطبيع name_normalized حتى تتطابق كلمات البحث مع الفهرس)
 # -----------------------------
-def normalize_text(text: str) -> str:
-    if not text:
-        return ""
-    text = text.lower()
-    text = text.replace("_", " ").replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    text = text.replace("ى", "ي").replace("ة", "ه").replace("ـ", "")
-    text = re.sub(r"[ًٌٍَُِ]", "", text)
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+NORMALIZED_STOP_WORDS = {normalize_query(w) for w in ARABIC_STOP_WORDS}
 
 def remove_stopwords(words: List[str]) -> List[str]:
-    return [w for w in words if w not in ARABIC_STOP_WORDS and len(w) > 1]
+    return [w for w in words if w not in NORMALIZED_STOP_WORDS and len(w) > 1]
 
 # -----------------------------
 # اقتراح الكتب بسرعة (بحث بالكلمات المفتاحية)
@@ -46,33 +46,19 @@ async def send_search_suggestions(update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # جلب قائمة الكتب من الذاكرة لتسريع البحث
-    if "all_books" not in context.bot_data:
-        conn = context.bot_data.get("db_conn")
-        if not conn:
-            await update.message.reply_text("❌ قاعدة البيانات غير متصلة حالياً.")
-            return
+    # 🗂 اقتراحات من الفهرس المقلوب: الكتب الأكثر تطابقاً في عدد الكلمات
+    query_words = remove_stopwords(normalize_query(last_query).split())
+    book_ids = SUGGESTION_INDEX.query(query_words, k=SUGGESTIONS_LIMIT)
+
+    suggested_books = []
+    pool = context.bot_data.get("db_conn")
+    if book_ids and pool:
         try:
-            rows = await conn.fetch("SELECT file_id, file_name FROM books;")
-            context.bot_data["all_books"] = [
-                {"file_id": r["file_id"], "file_name": r["file_name"]} for r in rows
-            ]
+            rows = await DB.fetch("books.titles", book_ids)
+            names = {r["id"]: r["file_name"] for r in rows}
+            suggested_books = [(i, names[i]) for i in book_ids if i in names]
         except Exception as e:
-            await update.message.reply_text(f"❌ حدث خطأ أثناء جلب الكتب: {e}")
-            return
-
-    all_books = context.bot_data["all_books"]
-
-    # اقتراحات بناءً على كلمات البحث
-    query_words = remove_stopwords(normalize_text(last_query).split())
-    suggested_books_set = set()
-
-    for book in all_books:
-        book_name_norm = normalize_text(book["file_name"])
-        if any(w in book_name_norm for w in query_words):
-            suggested_books_set.add((book["file_id"], book["file_name"]))
-
-    suggested_books = list(suggested_books_set)[:10]
+            logger.error(f"Error fetching suggested titles: {e}")
 
     # -------- النص الجديد عند الفشل --------
     if not suggested_books:
@@ -96,10 +82,8 @@ async def send_search_suggestions(update, context: ContextTypes.DEFAULT_TYPE):
 
     # إنشاء أزرار لإرسال الكتب مباشرة عند الضغط
     keyboard = []
-    for file_id, file_name in suggested_books:
-        key = hashlib.md5(file_id.encode()).hexdigest()[:16]
-        context.bot_data[f"file_{key}"] = file_id
-        keyboard.append([InlineKeyboardButton(file_name, callback_data=f"file:{key}")])
+    for book_id, file_name in suggested_books:
+        keyboard.append([InlineKeyboardButton(file_name, callback_data=book_callback_data(book_id))])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
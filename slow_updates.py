@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# إعداد اللوج لمتابعة سجل التحديثات البطيئة
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🐢 توقيت التحديثات وسجل التحديثات البطيئة
+# معالج التحديثات يفتح "توقيتاً" لكل تحديث في ContextVar، وطبقة قاعدة
+# البيانات وطلبات Bot API والمعالجات تضيف أزمنتها إليه دون تمرير أي
+# وسيط. ما يتجاوز SLOW_UPDATE_THRESHOLD يُكتب مع تفصيله (قاعدة بيانات /
+# Bot API / بايثون، وأثقل الاستعلامات والطلبات) إلى جدول slow_updates
+# دفعات في الخلفية، فيظهر مثلاً أن بطء /start من getChatMember لا من
+# تسجيل المستخدم.
+# ==========================================================
+
+# الحد بالثواني الذي يُعتبر بعده التحديث بطيئاً
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "1.0"))
+
+FLUSH_INTERVAL = 15
+
+# سقف السجلات المعلّقة في الذاكرة (الزائد يُهمل)
+MAX_BUFFERED = 5_000
+
+# مدة الاحتفاظ بالسجل وفاصل حذف القديم منه
+RETENTION_DAYS = 14
+MAINTENANCE_INTERVAL = 3600
+
+# طول النص المحفوظ وعدد أثقل المقاطع في التفصيل
+MAX_TEXT_LEN = 80
+MAX_SPANS = 8
+
+SLOW_UPDATE_COLUMNS = (
+    "occurred_at", "handler", "query_text", "total_ms", "db_ms", "api_ms", "python_ms", "breakdown"
+)
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+class UpdateTiming:
+    """أزمنة تحديث واحد: قاعدة البيانات وBot API مجمّعة وحسب الاسم"""
+
+    __slots__ = ("started", "wait", "db", "api", "spans", "handlers")
+
+    def __init__(self, wait: float = 0.0):
+        self.started = time.perf_counter()
+        self.wait = wait
+        self.db = 0.0
+        self.api = 0.0
+        self.spans = {}
+        self.handlers = {}
+
+    def add(self, kind: str, name: str, seconds: float):
+        if kind == "db":
+            self.db += seconds
+        else:
+            self.api += seconds
+        key = f"{kind}:{name}"
+        self.spans[key] = self.spans.get(key, 0.0) + seconds
+
+
+_CURRENT = ContextVar("update_timing", default=None)
+
+
+def begin_update(wait: float = 0.0):
+    """بدء توقيت التحديث الجاري (يُرجع رمزاً لـ end_update)"""
+    return _CURRENT.set(UpdateTiming(wait))
+
+
+def end_update(update, token):
+    timing = _CURRENT.get()
+    _CURRENT.reset(token)
+    if timing is None:
+        return
+    total = time.perf_counter() - timing.started
+    if total >= SLOW_UPDATE_THRESHOLD:
+        SLOW_UPDATE_LOG.record(update, timing, total)
+
+
+def record_span(kind: str, name: str, seconds: float):
+    """إضافة زمن استعلام (db) أو طلب Bot API (api) إلى التحديث الجاري إن وُجد"""
+    timing = _CURRENT.get()
+    if timing is not None:
+        timing.add(kind, name, seconds)
+
+
+def record_handler(name: str, seconds: float):
+    timing = _CURRENT.get()
+    if timing is not None:
+        timing.handlers[name] = timing.handlers.get(name, 0.0) + seconds
+
+
+def sanitize_text(update) -> str:
+    """نص التحديث بعد طي المسافات وإخفاء الأرقام (المعرّفات والأكواد) وقصّه"""
+    text = ""
+    if getattr(update, "callback_query", None):
+        text = update.callback_query.data or ""
+    elif getattr(update, "effective_message", None):
+        message = update.effective_message
+        text = message.text or message.caption or ("<document>" if message.document else "")
+    text = _DIGITS_RE.sub("#", _SPACES_RE.sub(" ", text).strip())
+    return text[:MAX_TEXT_LEN]
+
+
+def _ms(seconds: float) -> int:
+    return int(round(seconds * 1000))
+
+
+class SlowUpdateLog:
+    """مخزن مؤقت للتحديثات البطيئة يُفرَّغ دورياً إلى slow_updates عبر COPY"""
+
+    def __init__(self):
+        self._buffer = []
+        self._flush_lock = asyncio.Lock()
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, update, timing: UpdateTiming, total: float):
+        if len(self._buffer) >= MAX_BUFFERED:
+            self.dropped += 1
+            return
+
+        # المعالج صاحب أطول زمن (فحص الحظر مثلاً يسبق كل تحديث لكنه نادراً ما يكون السبب)
+        handler = max(timing.handlers, key=timing.handlers.get) if timing.handlers else "unhandled"
+        spans = sorted(timing.spans.items(), key=lambda item: item[1], reverse=True)[:MAX_SPANS]
+        breakdown = {
+            "wait_ms": _ms(timing.wait),
+            "handlers": {name: _ms(s) for name, s in timing.handlers.items()},
+            "spans": {name: _ms(s) for name, s in spans},
+        }
+        # الاستعلامات والطلبات المتوازية قد يتجاوز مجموعها الزمن الكلي
+        python = max(0.0, total - timing.db - timing.api)
+
+        self._buffer.append((
+            datetime.now(timezone.utc), handler, sanitize_text(update),
+            _ms(total), _ms(timing.db), _ms(timing.api), _ms(python), json.dumps(breakdown),
+        ))
+        self.recorded += 1
+
+    async def flush(self, pool):
+        if not self._buffer or not pool:
+            return
+
+        async with self._flush_lock:
+            records, self._buffer = self._buffer, []
+            if not records:
+                return
+            try:
+                async with pool.acquire() as conn:
+                    await conn.copy_records_to_table("slow_updates", records=records, columns=SLOW_UPDATE_COLUMNS)
+                self.flushed += len(records)
+            except asyncio.CancelledError:
+                self._buffer[:0] = records
+                raise
+            except Exception as e:
+                # سجل تشخيصي: لا داعي لإعادة المحاولة وتضخيم الذاكرة
+                self.dropped += len(records)
+                logger.error(f"Error flushing slow updates ({len(records)} rows): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+
+SLOW_UPDATE_LOG = SlowUpdateLog()
+
+
+async def run_slow_update_log(pool, log: SlowUpdateLog = SLOW_UPDATE_LOG):
+    """حلقة الخلفية: تفريغ السجل كل FLUSH_INTERVAL وحذف ما تجاوز مدة الاحتفاظ كل ساعة"""
+    last_maintenance = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await log.flush(pool)
+
+        if loop.time() - last_maintenance >= MAINTENANCE_INTERVAL:
+            try:
+                # استيراد متأخر: database يستورد record_span من هذه الوحدة
+                from database import DB
+                async with DB.acquire(pool) as conn:
+                    await DB.execute("slow_updates.prune", RETENTION_DAYS, conn=conn)
+                last_maintenance = loop.time()
+            except Exception as e:
+                logger.error(f"Error pruning slow updates: {e}")
@@ -0,0 +1,119 @@
+import time
+import logging
+from collections import OrderedDict
+
+# إعداد اللوج لمتابعة كفاءة كاش الاشتراك
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🔐 كاش عضوية القناة الإجبارية
+# العضو المؤكد يُحفظ طويلاً وغير العضو لفترة قصيرة (ليتمكن من التحقق بعد الانضمام)،
+# وتحديثات CHAT_MEMBER القادمة من القناة تحدّث الكاش فوراً.
+# ==========================================================
+
+POSITIVE_TTL = 6 * 3600
+NEGATIVE_TTL = 60
+
+# عند فشل Bot API نعيد آخر قيمة معروفة إذا لم يمضِ على انتهائها أكثر من هذه المدة
+STALE_GRACE = 30 * 60
+
+MAX_ENTRIES = 200_000
+
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+
+class MembershipCache:
+    """user_id ← (channel_id, is_member, checked_at) مع LRU بحد أقصى للمدخلات"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.api_errors = 0
+        self.invalidations = 0
+
+    def _ttl(self, is_member: bool) -> float:
+        return POSITIVE_TTL if is_member else NEGATIVE_TTL
+
+    def get(self, channel_id, user_id: int):
+        """ترجع القيمة المحفوظة إذا كانت حديثة، وإلا None"""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] == channel_id:
+            _, is_member, checked_at = entry
+            if time.monotonic() - checked_at < self._ttl(is_member):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return is_member
+        self.misses += 1
+        return None
+
+    def get_stale(self, channel_id, user_id: int):
+        """آخر قيمة معروفة ضمن فترة السماح (تُستخدم فقط عند فشل الـ API)"""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] == channel_id:
+            _, is_member, checked_at = entry
+            if time.monotonic() - checked_at < self._ttl(is_member) + STALE_GRACE:
+                self.stale_served += 1
+                return is_member
+        return None
+
+    def put(self, channel_id, user_id: int, is_member: bool):
+        self._entries[user_id] = (channel_id, is_member, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        if self._entries.pop(user_id, None):
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "stale_served": self.stale_served,
+            "api_errors": self.api_errors,
+            "invalidations": self.invalidations,
+        }
+
+
+MEMBERSHIP_CACHE = MembershipCache()
+
+
+async def is_channel_member(bot, channel_id, user_id: int, force: bool = False) -> bool:
+    """فحص العضوية عبر الكاش أولاً ثم get_chat_member عند الحاجة فقط.
+    force=True يتجاوز القيمة السلبية المحفوظة (زر التحقق بعد الانضمام)."""
+    cached = MEMBERSHIP_CACHE.get(channel_id, user_id)
+    if cached or (cached is False and not force):
+        return cached
+
+    try:
+        member = await bot.get_chat_member(channel_id, user_id)
+    except Exception as e:
+        MEMBERSHIP_CACHE.api_errors += 1
+        stale = MEMBERSHIP_CACHE.get_stale(channel_id, user_id)
+        if stale is not None:
+            return stale
+        logger.debug(f"get_chat_member failed for {user_id}: {e}")
+        return False
+
+    is_member = member.status in MEMBER_STATUSES
+    MEMBERSHIP_CACHE.put(channel_id, user_id, is_member)
+    return is_member
+
+
+def on_chat_member_update(channel_id, chat_member_updated):
+    """تحديث الكاش من تحديث CHAT_MEMBER القادم من القناة الإجبارية"""
+    if channel_id is None or chat_member_updated.chat.id != channel_id:
+        return
+
+    new_member = chat_member_updated.new_chat_member
+    MEMBERSHIP_CACHE.put(channel_id, new_member.user.id, new_member.status in MEMBER_STATUSES)
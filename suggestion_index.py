@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from database import DB
+from search_handler import normalize_query
+
+# إعداد اللوج لمتابعة بناء الفهرس
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🗂 فهرس مقلوب للكلمات (token → قائمة معرّفات الكتب)
+# يُبنى مرة واحدة من العناوين المطبّعة ويُحدَّث مع كل كتاب جديد،
+# ويُستخدم لاقتراح عناوين قريبة عندما لا يجد البحث نتائج.
+# ==========================================================
+
+BUILD_BATCH = 10_000
+
+# الكلمات الأطول من هذا الحد في قوائمها تُستخدم للتقييم فقط وليس لتوليد المرشحين
+COMMON_TOKEN_LIMIT = 20_000
+
+# عدد الكلمات المفهرسة التي تبدأ بكلمة البحث (لمحاكاة المطابقة الجزئية)
+MAX_PREFIX_EXPANSION = 20
+
+# الحد الأدنى لطول الكلمة المفهرسة
+MIN_TOKEN_LEN = 2
+
+
+def title_tokens(normalized_title: str) -> set:
+    """كلمات العنوان المطبّع + صيغتها دون "ال" التعريف"""
+    tokens = set()
+    for word in normalized_title.split():
+        if len(word) < MIN_TOKEN_LEN:
+            continue
+        tokens.add(word)
+        if word.startswith("ال") and len(word) > 4:
+            tokens.add(word[2:])
+    return tokens
+
+
+class TokenIndex:
+    """قوائم معرّفات مرتبة تصاعدياً داخل مصفوفات array('i') لتوفير الذاكرة"""
+
+    def __init__(self):
+        self._postings = {}
+        self._vocabulary = []
+        # معرّفات الكتب المفهرسة (مرتبة) حتى لا يُحسب الكتاب المعاد إدخاله مرتين
+        self._ids = array("i")
+        self.ready = False
+
+    def add(self, book_id: int, normalized_title: str):
+        for token in title_tokens(normalized_title or ""):
+            posting = self._postings.get(token)
+            if posting is None:
+                self._postings[token] = array("i", [book_id])
+                if self.ready:
+                    insort(self._vocabulary, token)
+                continue
+
+            if posting[-1] < book_id:
+                posting.append(book_id)
+            else:
+                # كتاب أُعيد إدخاله بمعرّف قديم: إدراج في موضعه مع تجنب التكرار
+                pos = bisect_left(posting, book_id)
+                if pos == len(posting) or posting[pos] != book_id:
+                    posting.insert(pos, book_id)
+
+        if not self._ids or self._ids[-1] < book_id:
+            self._ids.append(book_id)
+        elif not self._contains(self._ids, book_id):
+            self._ids.insert(bisect_left(self._ids, book_id), book_id)
+
+    @property
+    def books(self) -> int:
+        return len(self._ids)
+
+    def add_many(self, books):
+        for book_id, normalized_title in books:
+            self.add(book_id, normalized_title)
+
+    def _finish_build(self):
+        self._vocabulary = sorted(self._postings)
+        self.ready = True
+
+    def _expand(self, word: str) -> list:
+        """الكلمات المفهرسة التي تبدأ بكلمة البحث (بما فيها الكلمة نفسها)"""
+        start = bisect_left(self._vocabulary, word)
+        matches = []
+        for token in self._vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not token.startswith(word):
+                break
+            matches.append(token)
+        return matches
+
+    @staticmethod
+    def _contains(posting: array, book_id: int) -> bool:
+        pos = bisect_left(posting, book_id)
+        return pos < len(posting) and posting[pos] == book_id
+
+    def query(self, words, k: int = 10) -> list:
+        """أفضل k كتب مرتبة حسب عدد كلمات البحث المطابقة (ثم الأحدث)"""
+        if not self.ready:
+            return []
+
+        word_postings = []
+        for word in dict.fromkeys(words):
+            postings = [self._postings[t] for t in self._expand(word)]
+            if postings:
+                word_postings.append((sum(len(p) for p in postings), postings))
+
+        if not word_postings:
+            return []
+
+        # الكلمات النادرة أولاً: هي التي تولّد المرشحين بتكلفة صغيرة
+        word_postings.sort(key=lambda wp: wp[0])
+        scores = Counter()
+        common = []
+        for size, postings in word_postings:
+            if size > COMMON_TOKEN_LIMIT:
+                common.append(postings)
+                continue
+            matched = set()
+            for posting in postings:
+                matched.update(posting)
+            scores.update(matched)
+
+        if not scores:
+            # كل الكلمات شائعة جداً: نأخذ أحدث الكتب من أصغر قائمة كمرشحين
+            _, postings = word_postings[0]
+            common = common[1:]
+            for posting in postings:
+                scores.update(posting[-k * 20:])
+
+        # الكلمات الشائعة تُستخدم لرفع درجة المرشحين فقط (بحث ثنائي)
+        for postings in common:
+            for book_id in scores:
+                if any(self._contains(p, book_id) for p in postings):
+                    scores[book_id] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [book_id for book_id, _ in ranked[:k]]
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._postings), "books": self.books, "ready": self.ready}
+
+
+SUGGESTION_INDEX = TokenIndex()
+
+
+async def build_suggestion_index(pool, index: TokenIndex = SUGGESTION_INDEX):
+    """بناء الفهرس من جدول books على دفعات مع إفساح المجال لحلقة الأحداث"""
+    last_id = 0
+    try:
+        while True:
+            async with DB.acquire(pool) as conn:
+                rows = await DB.fetch("books.scan", last_id, BUILD_BATCH, conn=conn)
+
+            if not rows:
+                break
+
+            for r in rows:
+                # التطبيع هنا مباشرة حتى لا يتأثر الفهرس بصفوف لم تصلها التعبئة بعد
+                index.add(r["id"], normalize_query(r["file_name"] or ""))
+
+            last_id = rows[-1]["id"]
+            await asyncio.sleep(0)
+
+        index._finish_build()
+        logger.info(f"✅ Suggestion index ready: {index.books:,} books, {len(index._postings):,} tokens.")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.error("❌ Suggestion index build error", exc_info=True)
@@ -0,0 +1,92 @@
+import time
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from database import DB, BACKGROUND
+
+# إعداد اللوج لمتابعة تحديث قوائم الأكثر تحميلاً
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🔥 الكتب الأكثر تحميلاً عبر جدول تجميعي بالساعة
+# كل دفعة تحميلات تُضاف إلى download_rollups (book_id, hour, downloads)،
+# ولقطة أفضل الكتب لكل نافذة زمنية تُحسب دورياً عبر الـ Job Queue وتُقرأ من الذاكرة فقط.
+# ==========================================================
+
+# النوافذ المتاحة: المفتاح ← (الفترة، العنوان المعروض، الحد الأدنى للتحميلات)
+TRENDING_WINDOWS = {
+    "24h": (timedelta(hours=24), "آخر 24 ساعة", 3),
+    "7d": (timedelta(days=7), "هذا الأسبوع", 5),
+    "30d": (timedelta(days=30), "هذا الشهر", 10),
+}
+DEFAULT_WINDOW = "7d"
+
+TRENDING_LIMIT = 15
+SNAPSHOT_REFRESH_INTERVAL = 5 * 60
+
+# الاحتفاظ بالصفوف التجميعية لأطول نافذة + يوم احتياطي
+ROLLUP_RETENTION = timedelta(days=31)
+ROLLUP_PRUNE_INTERVAL = 3600
+
+
+async def add_to_rollups(conn, records):
+    """إضافة دفعة أحداث (book_id, file_id, downloaded_at) إلى العدّادات بالساعة"""
+    hourly = Counter(
+        (book_id, ts.replace(minute=0, second=0, microsecond=0))
+        for book_id, _, ts in records
+        if book_id is not None
+    )
+    if not hourly:
+        return
+    keys = list(hourly)
+    await DB.execute(
+        "trending.add_rollups",
+        [k[0] for k in keys], [k[1] for k in keys], [hourly[k] for k in keys],
+        conn=conn
+    )
+
+
+class TrendingSnapshot:
+    """آخر لقطة محسوبة لكل نافذة زمنية (قائمة قواميس id, file_id, file_name, download_count)"""
+
+    def __init__(self):
+        self._windows = {}
+        self.refreshed_at = 0.0
+
+    def get(self, window: str):
+        """ترجع القائمة أو None إذا لم تُحسب اللقطة بعد"""
+        return self._windows.get(window)
+
+    async def refresh(self, pool):
+        windows = {}
+        async with DB.acquire(pool) as conn:
+            for key, (period, _, min_downloads) in TRENDING_WINDOWS.items():
+                rows = await DB.fetch("trending.top_books", period, min_downloads, TRENDING_LIMIT, conn=conn)
+                windows[key] = [dict(r) for r in rows]
+        self._windows = windows
+        self.refreshed_at = time.monotonic()
+
+
+TRENDING = TrendingSnapshot()
+
+
+async def refresh_trending_job(context):
+    """مهمة الـ Job Queue: إعادة حساب لقطات الأكثر تحميلاً من الجدول التجميعي"""
+    pool = DB.pool(BACKGROUND)
+    if not pool:
+        return
+    try:
+        await TRENDING.refresh(pool)
+    except Exception as e:
+        logger.error(f"Error refreshing trending snapshot: {e}")
+
+
+async def prune_rollups_job(context):
+    """مهمة الـ Job Queue: حذف الصفوف التجميعية الأقدم من أطول نافذة"""
+    if not DB.pool(BACKGROUND):
+        return
+    try:
+        await DB.execute("trending.prune_rollups", ROLLUP_RETENTION)
+    except Exception as e:
+        logger.error(f"Error pruning download rollups: {e}")
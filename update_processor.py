@@ -0,0 +1,135 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from slow_updates import begin_update, end_update
+
+# إعداد اللوج لمتابعة معالجة التحديثات
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# 🚦 معالجة متوازية مع الحفاظ على ترتيب تحديثات كل مستخدم
+# تحديثات المستخدمين المختلفين تعمل بالتوازي (بسقف max_concurrent)، أما
+# تحديثات المستخدم الواحد فتمر عبر "مسار" خاص به بالترتيب، فلا تتسابق
+# ضغطات "التالي" السريعة والبحث الجديد على جلسة البحث في user_data.
+# المسار يُحذف فور فراغه، وعدد المنتظرين لكل مستخدم محدود.
+# منشورات القناة (بلا مستخدم) تمر بمسار المحادثة بالترتيب دون سقف: كل منشور
+# كتاب جديد، ونشر دفعة كبيرة يجب أن يُدخل كاملاً (يكفي سقف القبول العام).
+# ==========================================================
+
+# أقصى عدد تحديثات منتظرة لمستخدم واحد (الزائد يُهمل: ضغطات متكررة أو إغراق)
+MAX_PENDING_PER_USER = 20
+
+# عدد التحديثات المقبولة للانتظار مقابل كل خانة تنفيذ
+ADMISSION_FACTOR = 8
+
+# عينات زمن الانتظار الأخيرة لحساب النسب المئوية
+WAIT_SAMPLES = 1000
+
+
+class _UserLane:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+def _lane_key(update: object):
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return ("user", update.effective_user.id)
+    if update.effective_chat:
+        return ("chat", update.effective_chat.id)
+    return None
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """توازٍ بين المستخدمين وترتيب صارم داخل تحديثات المستخدم الواحد"""
+
+    def __init__(self, max_concurrent_updates: int):
+        # سقف PTB الخارجي يحد التحديثات المقبولة (تنفيذاً أو انتظاراً)، والسقف الداخلي
+        # يحد التنفيذ الفعلي فقط، حتى لا يحجز مستخدم واحد كل الخانات وهو ينتظر دوره
+        super().__init__(max_concurrent_updates * ADMISSION_FACTOR)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.concurrency = max_concurrent_updates
+        self._lanes = {}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+        self.max_wait = 0.0
+
+    async def do_process_update(self, update, coroutine):
+        key = _lane_key(update)
+        if key is None:
+            await self._execute(update, coroutine, time.monotonic())
+            return
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _UserLane()
+
+        if key[0] == "user" and lane.pending >= MAX_PENDING_PER_USER:
+            self.dropped += 1
+            # إغلاق الـ coroutine غير المنفذة لتجنب تحذير "never awaited"
+            coroutine.close()
+            logger.warning(f"Dropped update from {key}: {lane.pending} updates already pending.")
+            return
+
+        lane.pending += 1
+        queued_at = time.monotonic()
+        try:
+            async with lane.lock:
+                await self._execute(update, coroutine, queued_at)
+        finally:
+            lane.pending -= 1
+            # حذف المسار الخامل فوراً: الذاكرة تتبع المستخدمين النشطين فقط
+            if lane.pending == 0 and self._lanes.get(key) is lane:
+                del self._lanes[key]
+
+    async def _execute(self, update, coroutine, queued_at: float):
+        async with self._running:
+            wait = time.monotonic() - queued_at
+            self._waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+            self.running += 1
+            # 🐢 توقيت التحديث كاملاً (كل مجموعات المعالجات) لسجل التحديثات البطيئة
+            token = begin_update(wait)
+            try:
+                await coroutine
+            finally:
+                end_update(update, token)
+                self.running -= 1
+                self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._lanes.clear()
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        depths = [lane.pending for lane in self._lanes.values()]
+
+        def _percentile(p: float) -> float:
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "active_users": len(depths),
+            "pending": sum(depths),
+            "max_user_depth": max(depths, default=0),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "wait_p50": _percentile(0.5),
+            "wait_p95": _percentile(0.95),
+            "wait_max": self.max_wait,
+        }
@@ -0,0 +1,143 @@
+import time
+import asyncio
+import logging
+
+from telegram import Update, User
+from telegram.ext import Application, ExtBot, TypeHandler
+
+from update_processor import MAX_PENDING_PER_USER, UserOrderedUpdateProcessor
+
+# ==========================================================
+# 🧪 فحص محلي لمعالج التحديثات (بدون تيليجرام وبدون قاعدة بيانات)
+# يضع تحديثات اصطناعية في update_queue كما يفعل خادم الـ Webhook أو الاستطلاع،
+# ويقارن زمن معالجة تحديثات بطيئة تسلسلياً مقابل المعالجة المتوازية،
+# ويتحقق أن تحديثات المستخدم الواحد تُعالج بترتيب وصولها، وأن stop() يعالج
+# كل ما استُلم قبل الإيقاف، وأن نشر دفعة كتب في القناة يُدخل كاملاً بالترتيب.
+# التشغيل: python update_processor_selftest.py
+# ==========================================================
+
+UPDATES = 50
+HANDLER_DELAY = 0.2
+# المستخدمون في حالة الترتيب (كل مستخدم يرسل UPDATES / ORDERED_USERS تحديثاً)
+ORDERED_USERS = 5
+# منشورات دفعة القناة (أكبر من سقف المستخدم الواحد MAX_PENDING_PER_USER)
+CHANNEL_BURST = 100
+CHANNEL_ID = -1001234567890
+
+
+class OfflineBot(ExtBot):
+    """بوت لا يتصل بتيليجرام (get_me محلي) حتى يعمل initialize دون شبكة"""
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(id=1, first_name="selftest", is_bot=True, username="selftest_bot")
+        return self._bot_user
+
+
+def synthetic_update(update_id: int, user_id: int = None) -> dict:
+    user_id = user_id or 1000 + update_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": f"كتاب {update_id}",
+        },
+    }
+
+
+def synthetic_channel_post(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "channel_post": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": CHANNEL_ID, "type": "channel", "title": "library"},
+            "document": {"file_id": f"file{update_id}", "file_unique_id": f"u{update_id}",
+                         "file_name": f"كتاب_{update_id}.pdf", "mime_type": "application/pdf"},
+        },
+    }
+
+
+def build_app(concurrency: int, handler):
+    app = (
+        Application.builder()
+        .bot(OfflineBot("123456:SELFTEST"))
+        .updater(None)
+        .concurrent_updates(UserOrderedUpdateProcessor(concurrency))
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, handler))
+    return app
+
+
+async def run_case(concurrency: int, users: int = None) -> tuple:
+    """تشغيل التطبيق ووضع UPDATES تحديثاً في الطابور، وإرجاع (المعالَج، الزمن)"""
+    handled = []
+    per_user = {}
+
+    async def slow_handler(update, context):
+        # محاكاة استعلام قاعدة بيانات أو طلب Bot API (زمن متفاوت لكشف أي تسابق)
+        await asyncio.sleep(HANDLER_DELAY * (1 + update.update_id % 3) / 2)
+        handled.append(update.update_id)
+        per_user.setdefault(update.effective_user.id, []).append(update.update_id)
+
+    app = build_app(concurrency, slow_handler)
+    await app.initialize()
+    await app.start()
+
+    started = time.monotonic()
+    # ترتيب الوصول معروف (المعالجة نفسها متوازية)
+    for i in range(1, UPDATES + 1):
+        user_id = 1000 + (i % users if users else i)
+        await app.update_queue.put(Update.de_json(synthetic_update(i, user_id), app.bot))
+
+    # stop() يعالج كل ما في update_queue وينتظر التحديثات الجارية قبل الرجوع
+    await app.stop()
+    elapsed = time.monotonic() - started
+    await app.shutdown()
+
+    assert sorted(handled) == list(range(1, UPDATES + 1)), f"handled {len(handled)} of {UPDATES}"
+    for user_id, ids in per_user.items():
+        assert ids == sorted(ids), f"user {user_id} updates out of order: {ids}"
+    return len(handled), elapsed
+
+
+async def run_channel_burst() -> int:
+    """دفعة منشورات قناة تصل أسرع من معالجتها: لا يُهمل منها شيء ويُحفظ ترتيبها"""
+    handled = []
+
+    async def ingest_handler(update, context):
+        await asyncio.sleep(0.005)
+        handled.append(update.update_id)
+
+    app = build_app(10, ingest_handler)
+    await app.initialize()
+    await app.start()
+    for i in range(1, CHANNEL_BURST + 1):
+        await app.update_queue.put(Update.de_json(synthetic_channel_post(i), app.bot))
+    await app.stop()
+    dropped = app.update_processor.dropped
+    await app.shutdown()
+
+    assert dropped == 0, f"{dropped} channel posts dropped"
+    assert handled == list(range(1, CHANNEL_BURST + 1)), f"handled {len(handled)} of {CHANNEL_BURST}"
+    return len(handled)
+
+
+async def main():
+    logging.basicConfig(level=logging.WARNING)
+    sequential = await run_case(1)
+    concurrent = await run_case(10)
+    ordered = await run_case(10, users=ORDERED_USERS)
+    print(f"✅ sequential (1):  {sequential[0]} updates in {sequential[1]:.2f}s")
+    print(f"✅ concurrent (10): {concurrent[0]} updates in {concurrent[1]:.2f}s")
+    print(f"✅ ordered ({ORDERED_USERS} users): {ordered[0]} updates in {ordered[1]:.2f}s, per-user order kept")
+    burst = await run_channel_burst()
+    print(f"✅ channel burst: {burst} posts ingested in order (per-user cap {MAX_PENDING_PER_USER})")
+    print(f"⚡ speedup: x{sequential[1] / concurrent[1]:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())